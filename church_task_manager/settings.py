@@ -16,6 +16,12 @@ from decouple import config
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# SETTINGS_PROFILE=local runs on SQLite, with a local-memory cache and fast password hashing, and needs no
+# database server nor environment variables, e.g. for the tests and benchmarks
+# (church_task_manager.settings_local selects it as well).
+SETTINGS_PROFILE = config('SETTINGS_PROFILE', default='production')
+LOCAL_PROFILE = SETTINGS_PROFILE == 'local'
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -42,11 +48,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so that it measures the whole request (see schedule/metrics.py).
+    "schedule.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # Profiles the requests of staff users with ?_profile=1 (see schedule/profiling.py).
+    "schedule.profiling.ProfilerMiddleware",
+    # Watches the queries of the request for the slow-query log (see schedule/slow_queries.py).
+    "schedule.slow_queries.SlowQueryMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -64,6 +76,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "schedule.context_processors.department_links",
             ],
         },
     },
@@ -75,19 +88,62 @@ WSGI_APPLICATION = "church_task_manager.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': config('DATABASE_NAME'),
-        'USER': config('DATABASE_USER'),
-        'PASSWORD': config('DATABASE_PASSWORD'),
-        'HOST': config('DATABASE_HOST'),  # or the IP address of your PostgreSQL server
-        'PORT': config('DATABASE_PORT'),       # Default PostgreSQL port
+if LOCAL_PROFILE:
+    # SQLITE_NAME=:memory: keeps the database in memory, for a single process (the test runner always does).
+    DATABASES = {
+        "default": {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('SQLITE_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DATABASE_NAME'),
+            'USER': config('DATABASE_USER'),
+            'PASSWORD': config('DATABASE_PASSWORD'),
+            'HOST': config('DATABASE_HOST'),  # or the IP address of your PostgreSQL server
+            'PORT': config('DATABASE_PORT'),       # Default PostgreSQL port
+        }
+    }
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The rendered schedule tables, the page version stamps and the versions of the per-process snapshots (department
+# navigation, registry, teacher index) must be seen by every worker process, so production uses a file-based cache
+# in CACHE_LOCATION: a directory every worker can write to, on shared storage if the workers run on several hosts.
+# The local-memory cache is private to each process; only the local profile, which runs a single process, uses
+# it, and the schedule.E001 check refuses it otherwise (see schedule/checks.py).
+
+if LOCAL_PROFILE:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
     }
-}
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": config('CACHE_LOCATION', default=str(BASE_DIR / 'cache')),
+        }
+    }
+
+# Queries of the schedule app slower than this many milliseconds are logged with their EXPLAIN plan and
+# listed in the admin (see schedule/slow_queries.py); 0 disables the log.
+SCHEDULE_SLOW_QUERY_THRESHOLD = config('SCHEDULE_SLOW_QUERY_THRESHOLD', default=500, cast=float)
+
+# /metrics is served to staff users, and to scrapers sending "Authorization: Bearer <token>" with this token
+# (see schedule/metrics.py); empty allows no scraper.
+SCHEDULE_METRICS_TOKEN = config('SCHEDULE_METRICS_TOKEN', default='')
 
 # Secret Key
-SECRET_KEY = config('SECRET_KEY')
+if LOCAL_PROFILE:
+    # Falls back on the development key above.
+    SECRET_KEY = config('SECRET_KEY', default=SECRET_KEY)
+else:
+    SECRET_KEY = config('SECRET_KEY')
 
 
 # Password validation
@@ -108,6 +164,10 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+if LOCAL_PROFILE:
+    # Hashing the passwords of the test users with the production hasher is slow and pointless.
+    PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
@@ -0,0 +1,13 @@
+"""
+Local settings profile: SQLite, a local-memory cache and fast password hashing, with no database server nor
+environment variables needed. For the tests and benchmarks on a bare machine:
+
+    DJANGO_SETTINGS_MODULE=church_task_manager.settings_local python manage.py test schedule
+
+Same as running with SETTINGS_PROFILE=local; see church_task_manager/settings.py.
+"""
+import os
+
+os.environ['SETTINGS_PROFILE'] = 'local'
+
+from .settings import *  # noqa: E402,F401,F403
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "church_task_manager.settings")
 
 application = get_wsgi_application()
+
+# Load the dimension tables now rather than in the first request of this process.
+from schedule.registry import warm_registry  # noqa: E402
+
+warm_registry()
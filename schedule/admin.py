@@ -1,113 +1,92 @@
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.admin import DateFieldListFilter
-from .models import (Department, Teacher, Schedule, Position, ClassRole, RoleAssignment, HymnType)
-from datetime import timedelta, datetime
-
-WORSHIP_CLASS = "崇拜"
-HYMN_CLASS = "詩頌"
-ACTIVITY = "共習"
-
-PRE_KINDERGARTEN = "幼幼班"
-KINDERGARTEN = "幼稚班"
-ELEMENTARY_1 = "幼年班"
-ELEMENTARY_1_CN_JP = "幼年班(中日文)"
-ELEMENTARY_2 = "少年班"
-JUNIOR = "青教組"
-JAPANESE = "日文班"
-PIANICA = "口風琴班"
-SHIKOYASU = "新子安"
-
-STRPTIME_FORMAT = "%H:%M"
-
-
-def is_odd_saturday(given_saturday):
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import Prefetch
+from django.forms.models import BaseInlineFormSet
+from django.utils.functional import cached_property
+from .models import (Department, Teacher, Schedule, Position, ClassRole, RoleAssignment, HymnType,
+                     ScheduleTemplate, SlowQuery)
+from .assignments import RoleAssignmentValidator
+from . import generation
+
+# Above this many rows, the unfiltered changelists of large tables show the planner's row estimate instead of
+# running COUNT(*). 0 disables the estimate.
+APPROXIMATE_COUNT_THRESHOLD = getattr(settings, 'SCHEDULE_ADMIN_APPROXIMATE_COUNT_THRESHOLD', 0)
+
+
+class ApproximateCountPaginator(Paginator):
     """
-    Determines whether a given Saturday is the nth Saturday of the month where n%2 == 1.
-    Returns True if it is odd, False if even.
+    A paginator which reads the number of rows of an unfiltered queryset from the PostgreSQL statistics
+    (pg_class.reltuples) when it exceeds APPROXIMATE_COUNT_THRESHOLD, and counts them exactly otherwise.
     """
-    # Ensure the given date is a Saturday
-    if given_saturday.weekday() != 5:  # 5 = Saturday
-        raise ValueError("The given date is not a Saturday.")
-
-    # Find the first day of the month
-    first_day_of_month = given_saturday.replace(day=1)
-
-    # Calculate the first Saturday of the month
-    days_to_first_saturday = (5 - first_day_of_month.weekday()) % 7
-    first_saturday = first_day_of_month + timedelta(days=days_to_first_saturday)
-
-    # Calculate how many Saturdays have passed
-    count = 1
-    current_saturday = first_saturday
-    while current_saturday < given_saturday:
-        current_saturday += timedelta(days=7)
-        count += 1
 
-    # Check if n (count) is odd
-    return count % 2 == 1
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if APPROXIMATE_COUNT_THRESHOLD and connection.vendor == 'postgresql' and query is not None and not query.where:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                               [self.object_list.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > APPROXIMATE_COUNT_THRESHOLD:
+                return row[0]
+        return super().count
 
 
-def create_schedule_if_not_exists(date, department, start_time, end_time, class_type):
+class NameSearchListFilter(admin.SimpleListFilter):
     """
-    Helper function to check if a schedule exists and create it if it does not.
+    A list filter rendered as a text box matching part of a name, instead of listing every related object.
+    Subclasses set title, parameter_name and field_path.
     """
-    if not Schedule.objects.filter(date=date, department=department, class_type=class_type).exists():
-        Schedule.objects.get_or_create(
-            department=department,
-            date=date,
-            start_time=datetime.strptime(start_time, '%H:%M').time(),
-            end_time=datetime.strptime(end_time, '%H:%M').time(),
-            class_type=class_type
-        )
+    template = 'admin/name_search_filter.html'
+    field_path = None
 
-@admin.action(description="Generate Schedules for Upcoming Saturdays")
-def generate_schedules(modeladmin, request, queryset):
-    departments = Department.objects.all()
-    today = datetime.today().date()
+    def lookups(self, request, model_admin):
+        return ()
 
-    # Calculate the number of days to the next Saturday
-    days_to_next_saturday = (5 - today.weekday()) % 7 + 7
+    def has_output(self):
+        return True
 
-    # Generate the next 12 Saturdays
-    saturdays = [
-        today + timedelta(days=days_to_next_saturday + i * 7)
-        for i in range(14)
-    ]
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{f'{self.field_path}__icontains': self.value()})
+        return queryset
 
-    # Class Type constants
-    WORSHIP_CLASS = '崇拜'
-    ACTIVITY = '共習'
-    HYMN_CLASS = '詩頌'
+    def choices(self, changelist):
+        yield {
+            'value': self.value() or '',
+            'preserved_params': [(key, value) for key, value in changelist.params.items()
+                                 if key != self.parameter_name],
+        }
 
-    for date in saturdays:
-        for department in departments:
-            if department.name == PRE_KINDERGARTEN:
-                create_schedule_if_not_exists(date, department, '14:00', '14:30', WORSHIP_CLASS)
-                create_schedule_if_not_exists(date, department, '14:40', '15:00', ACTIVITY)
 
-            elif department.name == KINDERGARTEN:
-                create_schedule_if_not_exists(date, department, '11:30', '12:00', HYMN_CLASS)
-                create_schedule_if_not_exists(date, department, '14:00', '14:35', WORSHIP_CLASS)
-                create_schedule_if_not_exists(date, department, '14:40', '15:00', ACTIVITY)
+class PersonNameListFilter(NameSearchListFilter):
+    title = "person"
+    parameter_name = "person_name"
+    field_path = "person__name"
 
-            elif department.name in [ELEMENTARY_1, ELEMENTARY_1_CN_JP, ELEMENTARY_2, JUNIOR, JAPANESE]:
-                create_schedule_if_not_exists(date, department, '14:00', '14:55', WORSHIP_CLASS)
 
-                if department.name in [JUNIOR, JAPANESE]:
-                    create_schedule_if_not_exists(date, department, '15:00', '15:30', ACTIVITY)
+class CachedChoicesMixin:
+    """
+    Evaluates the choices of the foreign keys once per form class, rather than once per row of list_editable.
+    """
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if formfield is not None and db_field.name in self.list_editable:
+            formfield.choices = list(formfield.choices)
+        return formfield
 
-                # Handle odd/even Saturday logic
-                if is_odd_saturday(date):
-                    if department.name in [ELEMENTARY_1, ELEMENTARY_1_CN_JP]:
-                        create_schedule_if_not_exists(date, department, '15:00', '15:30', HYMN_CLASS)
-                    elif department.name == ELEMENTARY_2:
-                        create_schedule_if_not_exists(date, department, '15:00', '15:30', ACTIVITY)
-                else:  # Even Saturday logic
-                    if department.name in [ELEMENTARY_1, ELEMENTARY_1_CN_JP]:
-                        create_schedule_if_not_exists(date, department, '15:00', '15:30', ACTIVITY)
-                    elif department.name == ELEMENTARY_2:
-                        create_schedule_if_not_exists(date, department, '15:00', '15:30', HYMN_CLASS)
 
+@admin.action(description="Generate Schedules for Upcoming Saturdays")
+def generate_schedules(modeladmin, request, queryset):
+    # Generate the next 14 Saturdays
+    saturdays = generation.get_upcoming_saturdays(14)
+    created = generation.generate_schedules(saturdays[0], saturdays[-1])
+    modeladmin.message_user(request, f"Created {len(created)} schedules.")
 
 
 @admin.register(Department)
@@ -116,7 +95,7 @@ class DepartmentAdmin(admin.ModelAdmin):
     list_display = ["id", "name", "description"]
 
 @admin.register(Teacher)
-class TeacherAdmin(admin.ModelAdmin):
+class TeacherAdmin(CachedChoicesMixin, admin.ModelAdmin):
     fieldsets = (
         ("Personal Information", {"fields": ("name", "gender", "region")}),
         ("Professional Information", {"fields": ("status", "department", "position")})
@@ -124,6 +103,7 @@ class TeacherAdmin(admin.ModelAdmin):
     ordering = ["id"]
     list_display = ["id", "status", "department", "position", "name", "gender", "region"]
     list_editable = ["status", "department", "position", "name", "gender", "region"]
+    list_select_related = ["department", "position"]
     actions = ["delete_selected"]
     search_fields = ["name", "region", "department__name", "position__name"]
     list_filter = ["status", "department", "gender", "region"]
@@ -139,6 +119,7 @@ class PositionAdmin(admin.ModelAdmin):
 class ClassRoleAdmin(admin.ModelAdmin):
     ordering = ["id"]
     list_display = ["id", "name"]
+    search_fields = ["name"]
 
 
 @admin.register(RoleAssignment)
@@ -151,14 +132,59 @@ class RoleAssignmentAdmin(admin.ModelAdmin):
         "schedule__department__name",
         "schedule__class_type",
         "role",
-        "person"
+        PersonNameListFilter
     ]
+    list_select_related = ["person", "role", "schedule__department"]
     actions = ["delete_selected"]
     search_fields = ["person__name", "role__name", "schedule__date"]  # Include date in the search fields
     date_hierarchy = "schedule__date"
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+    # Enable live search for the 'schedule', 'role' and 'person' fields
+    autocomplete_fields = ["schedule", "role", "person"]
+
 
-    # Enable live search for the 'schedule' field
-    autocomplete_fields = ["schedule"]
+class RoleAssignmentInlineFormSet(BaseInlineFormSet):
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        # clean() checks the rules for the whole formset, instead of each form and then each save().
+        form.instance.validated_in_batch = True
+        return form
+
+    def clean(self):
+        """
+        Validates the role assignments of the schedule against each other as well as against the saved ones,
+        with a single RoleAssignmentValidator for the whole formset.
+        """
+        super().clean()
+        if any(self.errors) or self.instance.date is None:
+            return
+
+        # In the admin, the formset is saved in the transaction it is validated in, so the schedules of the day
+        # stay locked until then.
+        validator = RoleAssignmentValidator([self.instance.date], lock=transaction.get_connection().in_atomic_block)
+        # The saved assignments being changed or deleted are validated as they will be, not as they were.
+        for form in self.initial_forms:
+            if form.has_changed() or self._should_delete_form(form):
+                validator.discard(form.instance.id)
+
+        for form in self.forms:
+            if not form.has_changed() or self._should_delete_form(form):
+                continue
+            try:
+                validator.validate(form.instance)
+            except ValidationError as error:
+                form.add_error(None, error)
+            else:
+                validator.add(form.instance)
+
+
+class RoleAssignmentInline(admin.TabularInline):
+    model = RoleAssignment
+    formset = RoleAssignmentInlineFormSet
+    extra = 0
+    autocomplete_fields = ["role", "person"]
 
 
 @admin.register(Schedule)
@@ -178,9 +204,18 @@ class ScheduleAdmin(admin.ModelAdmin):
     ]
     list_editable = ["date"]
     list_filter = [("date", DateFieldListFilter), "department", "class_type"]
+    list_select_related = ["department", "hymn_type"]
     date_hierarchy = "date"
     actions = [generate_schedules]
     search_fields = ["date", "department__name", "class_type"]
+    inlines = [RoleAssignmentInline]
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('role_assignments', queryset=RoleAssignment.objects.select_related('role', 'person'))
+        )
 
     def get_role_assignments(self, obj):
         """
@@ -193,8 +228,37 @@ class ScheduleAdmin(admin.ModelAdmin):
         )
     get_role_assignments.short_description = "Role Assignments"
 
+@admin.register(ScheduleTemplate)
+class ScheduleTemplateAdmin(admin.ModelAdmin):
+    ordering = ["department", "weekday", "start_time"]
+    list_display = ["id", "department", "class_type", "weekday", "start_time", "end_time", "recurrence",
+                    "interval", "effective_from", "effective_until"]
+    list_editable = ["start_time", "end_time", "recurrence", "interval", "effective_from", "effective_until"]
+    list_filter = ["department", "class_type", "recurrence"]
+    list_select_related = ["department"]
+    actions = ["delete_selected"]
+
 @admin.register(HymnType)
 class HymnTypeAdmin(admin.ModelAdmin):
     ordering = ["id"]
     list_display = ["id", "name", "description"]
-    list_editable = ["description"]
\ No newline at end of file
+    list_editable = ["description"]
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    ordering = ["-duration"]
+    list_display = ["id", "duration", "origin", "view_name", "short_sql", "created"]
+    list_filter = ["view_name", ("created", DateFieldListFilter)]
+    search_fields = ["sql", "origin"]
+    readonly_fields = ["created", "duration", "sql", "params", "origin", "view_name", "explain"]
+    actions = ["delete_selected"]
+
+    def short_sql(self, obj):
+        return obj.sql[:120]
+    short_sql.short_description = "SQL"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,226 @@
+"""
+API endpoints exposing the schedules of a department together with their role assignments,
+e.g. for Google Sheets (=IMPORTDATA("https://.../api/departments/幼稚班/schedules.csv?from=2025-01-01")),
+and assigning roles in bulk.
+
+Both formats are streamed from a single query read with .iterator(), so memory stays flat however many
+terms are requested.
+
+Query parameters:
+    from, to:    the date window (YYYY-MM-DD), defaulting to the current term
+    class_type:  restricts the schedules to a class type; may be repeated
+"""
+import csv
+import json
+from itertools import groupby
+from operator import itemgetter
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views import View
+from .models import Department, Position, Schedule, Teacher
+from .assignments import BULK_ASSIGNMENT_LIMIT, RoleAssignmentValidator, create_role_assignments
+from .registry import get_registry
+from .teachers import get_teacher_index
+from .views import ConditionalGetMixin, DateWindowMixin
+
+EXPORT_CHUNK_SIZE = 2000
+
+TEACHER_AUTOCOMPLETE_LIMIT = 20
+TEACHER_AUTOCOMPLETE_MAX_LIMIT = 100
+
+SCHEDULE_FIELDS = ['id', 'date', 'start_time', 'end_time', 'class_type', 'topic', 'unit_number',
+                   'hymn_type', 'hymn_number']
+ROLE_ASSIGNMENT_FIELDS = ['role', 'person']
+
+
+class Echo:
+    """
+    A file-like object whose write() returns the value instead of storing it, for streaming csv.writer rows.
+    """
+
+    def write(self, value):
+        return value
+
+
+class DepartmentSchedulesExportView(ConditionalGetMixin, DateWindowMixin, View):
+    """
+    Base view streaming the schedules of a department with their role assignments.
+    """
+
+    @property
+    def page_departments(self):
+        return [self.kwargs.get('department_name')]
+
+    def get_rows(self):
+        """
+        Yields one flat tuple of SCHEDULE_FIELDS + ROLE_ASSIGNMENT_FIELDS per role assignment, ordered by schedule.
+        Schedules without role assignments are yielded once, with role and person set to None.
+        """
+        department_id = get_registry().id(Department, self.kwargs.get('department_name'))
+        if department_id is None:
+            raise Http404("No Department matches the given query.")
+        schedules = Schedule.objects.filter(department_id=department_id, date__range=self.date_window)
+
+        class_types = self.request.GET.getlist('class_type')
+        if class_types:
+            schedules = schedules.filter(class_type__in=class_types)
+
+        return schedules.order_by('date', 'start_time', 'id', 'role_assignments__id').values_list(
+            'id', 'date', 'start_time', 'end_time', 'class_type', 'topic', 'unit_number',
+            'hymn_type__name', 'hymn_number', 'role_assignments__role__name', 'role_assignments__person__name'
+        ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+class DepartmentSchedulesJSONView(DepartmentSchedulesExportView):
+    """
+    Streams {"department": ..., "from": ..., "to": ..., "schedules": [...]}, where every schedule holds
+    its role assignments as a list of {"role": ..., "person": ...} objects.
+    """
+
+    def stream(self, rows):
+        date_from, date_to = self.date_window
+        yield '{"department": %s, "from": "%s", "to": "%s", "schedules": [' % (
+            json.dumps(self.kwargs.get('department_name'), ensure_ascii=False), date_from, date_to
+        )
+
+        schedule_length = len(SCHEDULE_FIELDS)
+        for index, (schedule, schedule_rows) in enumerate(groupby(rows, key=itemgetter(*range(schedule_length)))):
+            data = dict(zip(SCHEDULE_FIELDS, schedule))
+            data['role_assignments'] = [
+                dict(zip(ROLE_ASSIGNMENT_FIELDS, row[schedule_length:]))
+                for row in schedule_rows
+                if row[schedule_length] is not None
+            ]
+            yield (',' if index else '') + json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+        yield ']}'
+
+    def get(self, request, *args, **kwargs):
+        return StreamingHttpResponse(self.stream(self.get_rows()), content_type='application/json; charset=utf-8')
+
+
+class DepartmentSchedulesCSVView(DepartmentSchedulesExportView):
+    """
+    Streams one CSV line per role assignment (or per schedule without role assignments) under a header line.
+    """
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(SCHEDULE_FIELDS + ROLE_ASSIGNMENT_FIELDS)
+        for row in rows:
+            yield writer.writerow(['' if value is None else value for value in row])
+
+    def get(self, request, *args, **kwargs):
+        return StreamingHttpResponse(self.stream(self.get_rows()), content_type='text/csv; charset=utf-8')
+
+
+class RoleAssignmentBulkView(View):
+    """
+    Creates many role assignments in one request, all or nothing.
+
+    Expects a JSON body {"assignments": [{"schedule": id, "role": id, "person": id}, ...]}.
+    Responds 201 with {"success": true, "created": n} once every assignment is saved, or 400 with
+    {"success": false, "errors": [{"index": i, "error": message}, ...]} without saving anything.
+    """
+
+    def post(self, request, *args, **kwargs):
+        try:
+            rows = json.loads(request.body)['assignments']
+        except (ValueError, TypeError, KeyError):
+            return JsonResponse({'success': False, 'error': 'Expected a JSON body with an "assignments" list.'},
+                                status=400)
+
+        if not isinstance(rows, list) or not rows:
+            return JsonResponse({'success': False, 'error': '"assignments" must be a non-empty list.'}, status=400)
+        if len(rows) > BULK_ASSIGNMENT_LIMIT:
+            return JsonResponse({'success': False,
+                                 'error': f'At most {BULK_ASSIGNMENT_LIMIT} assignments can be sent at once.'},
+                                status=400)
+
+        assignments, errors = create_role_assignments(rows)
+        if errors:
+            return JsonResponse({
+                'success': False,
+                'errors': [{'index': index, 'error': message} for index, message in errors],
+            }, status=400)
+
+        return JsonResponse({'success': True, 'created': len(assignments)}, status=201)
+
+
+def get_teacher_filters(request):
+    """
+    Returns the TeacherIndex.search() filters given by the department, position and status query parameters,
+    or None if one of them names nothing (no teacher can match).
+    """
+    registry = get_registry()
+    filters = {'status': request.GET.get('status') or None}
+    if filters['status'] is not None and filters['status'] not in dict(Teacher.STATUS_CHOICES):
+        return None
+
+    for parameter, model in [('department', Department), ('position', Position)]:
+        name = request.GET.get(parameter)
+        if name:
+            filters[f'{parameter}_id'] = registry.id(model, name)
+            if filters[f'{parameter}_id'] is None:
+                return None
+    return filters
+
+
+class TeacherAutocompleteView(View):
+    """
+    Searches the teachers whose name contains ?q=, the names starting with it first, from an in-memory index
+    (see schedule.teachers), and responds with {"results": [{"id": ..., "name": ...}, ...]}.
+
+    Query parameters:
+        q:           part of the name; empty matches every teacher
+        department:  restricts the teachers to a department name
+        position:    restricts the teachers to a position name
+        status:      restricts the teachers to a status (擔任中, 休息中 or 新任)
+        limit:       the maximum number of results (20 by default)
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = min(int(request.GET.get('limit', TEACHER_AUTOCOMPLETE_LIMIT)), TEACHER_AUTOCOMPLETE_MAX_LIMIT)
+        except ValueError:
+            return JsonResponse({'error': 'limit must be an integer.'}, status=400)
+
+        filters = get_teacher_filters(request)
+        if filters is None:
+            return JsonResponse({'results': []})
+
+        teachers = get_teacher_index().search(request.GET.get('q', ''), limit=max(limit, 0), **filters)
+        return JsonResponse({'results': [{'id': teacher.id, 'name': teacher.name} for teacher in teachers]})
+
+
+class ScheduleAvailabilityView(View):
+    """
+    Partitions the teachers into those free during a schedule and those busy with an overlapping assignment,
+    responding with {"schedule": id, "free": [{"id": ..., "name": ...}, ...],
+    "busy": [{"id": ..., "name": ..., "department": ..., "role": ..., "start_time": ..., "end_time": ...}, ...]}.
+
+    The assignments of the day are read with a single query (see RoleAssignmentValidator) and the teachers
+    come from the in-memory index, so the modal can grey out the busy teachers before anything is posted.
+
+    Query parameters:
+        department, position, status:  restrict the teachers as in TeacherAutocompleteView
+    """
+
+    def get(self, request, *args, **kwargs):
+        schedule = get_object_or_404(Schedule, id=self.kwargs.get('schedule_id'))
+        filters = get_teacher_filters(request)
+        teachers = [] if filters is None else get_teacher_index().search('', limit=None, **filters)
+
+        validator = RoleAssignmentValidator([schedule.date])
+        free, busy = [], []
+        for teacher in teachers:
+            conflict = validator.find_overlap(teacher.id, schedule.date, schedule.start_time, schedule.end_time)
+            if conflict is None:
+                free.append({'id': teacher.id, 'name': teacher.name})
+            else:
+                busy.append({'id': teacher.id, 'name': teacher.name, 'department': conflict.department_name,
+                             'role': conflict.role_name, 'start_time': conflict.start_time,
+                             'end_time': conflict.end_time})
+
+        return JsonResponse({'schedule': schedule.id, 'free': free, 'busy': busy})
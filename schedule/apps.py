@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ScheduleConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "schedule"
+
+    def ready(self):
+        # Register the signal handlers that invalidate the cached schedule tables.
+        from . import signals  # noqa: F401
+        # Register the system checks of the deployment settings.
+        from . import checks  # noqa: F401
@@ -0,0 +1,205 @@
+from bisect import bisect_left, insort
+from collections import defaultdict, namedtuple
+from operator import attrgetter
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from .models import Schedule, RoleAssignment, ClassRole, Teacher
+from .fragments import invalidate_slots
+from .workloads import month_of, refresh_workloads
+
+# Allow multiple Teaching Assistants
+TEACHING_ASSISTANT = '助教'
+
+# The largest batch accepted by validate_role_assignments().
+BULK_ASSIGNMENT_LIMIT = 1000
+
+# A time slot a teacher is busy with, as indexed by RoleAssignmentValidator.
+BusySlot = namedtuple('BusySlot', ['start_time', 'end_time', 'assignment_id', 'role_name', 'department_name'])
+
+
+class RoleAssignmentValidator:
+    """
+    Validates role assignments with the rules of RoleAssignment.clean() against an in-memory index of
+    the schedules and role assignments on a set of dates, loaded with a single query.
+
+    The index can be reused across many validations, and add() records an assignment (saved or not)
+    so that the following validations take it into account, e.g. for the rows of a batch.
+    Teachers are indexed per date, with their busy slots sorted by start time.
+    """
+
+    def __init__(self, dates, lock=False):
+        """
+        :param dates: The dates of the schedules to be validated
+        :param lock: Locks the schedules of these dates until the end of the current transaction,
+                     so that concurrent validations touching the same dates happen one after another
+        """
+        self.dates = set(dates)
+        self._schedule_slots = {}  # schedule id -> (date, start_time, end_time, department id)
+        self._slot_schedules = defaultdict(set)  # (date, start_time, end_time, department id) -> schedule ids
+        self._role_assignments = defaultdict(set)  # (schedule id, role id) -> assignment ids
+        self._busy_slots = defaultdict(list)  # (person id, date) -> BusySlots sorted by start time
+
+        schedules = Schedule.objects.filter(date__in=self.dates)
+        if lock:
+            schedules = schedules.select_for_update(of=('self',))
+
+        # One row per role assignment, or per schedule without role assignments.
+        for (schedule_id, date, start_time, end_time, department_id, department_name,
+             assignment_id, role_id, role_name, person_id) in schedules.values_list(
+            'id', 'date', 'start_time', 'end_time', 'department_id', 'department__name',
+            'role_assignments__id', 'role_assignments__role_id', 'role_assignments__role__name',
+            'role_assignments__person_id'
+        ):
+            if schedule_id not in self._schedule_slots:
+                slot = (date, start_time, end_time, department_id)
+                self._schedule_slots[schedule_id] = slot
+                self._slot_schedules[slot].add(schedule_id)
+            if assignment_id is not None:
+                self._index(assignment_id, schedule_id, role_id, person_id, date,
+                            BusySlot(start_time, end_time, assignment_id, role_name, department_name))
+
+    def _index(self, assignment_id, schedule_id, role_id, person_id, date, busy_slot):
+        self._role_assignments[(schedule_id, role_id)].add(assignment_id)
+        if person_id is not None:
+            insort(self._busy_slots[(person_id, date)], busy_slot, key=attrgetter('start_time'))
+
+    def discard(self, assignment_id):
+        """
+        Forgets the saved role assignment with the given id, e.g. because it is about to be changed or deleted.
+        """
+        for assignment_ids in self._role_assignments.values():
+            assignment_ids.discard(assignment_id)
+        for key, busy_slots in self._busy_slots.items():
+            self._busy_slots[key] = [busy_slot for busy_slot in busy_slots if busy_slot.assignment_id != assignment_id]
+
+    def find_overlap(self, person_id, date, start_time, end_time, exclude_id=None):
+        """
+        Returns the BusySlot of the given teacher overlapping the given time on the given date, or None.
+
+        :param exclude_id: The id of an assignment to ignore, i.e. the one being validated
+        """
+        busy_slots = self._busy_slots.get((person_id, date), [])
+        # Only the slots starting before end_time can overlap; the latest of them is checked first.
+        for busy_slot in reversed(busy_slots[:bisect_left(busy_slots, end_time, key=attrgetter('start_time'))]):
+            if busy_slot.end_time > start_time and (exclude_id is None or busy_slot.assignment_id != exclude_id):
+                return busy_slot
+        return None
+
+    def validate(self, role_assignment):
+        """
+        Raises a ValidationError if the given role assignment breaks any rule of RoleAssignment.clean().
+        The date of its schedule must be one of the indexed dates.
+        """
+        schedule, role, person = role_assignment.schedule, role_assignment.role, role_assignment.person
+        if schedule.date not in self.dates:
+            raise ValueError(f"{schedule.date} is not indexed by this validator.")
+
+        # Ensure the schedule is not duplicated
+        slot = (schedule.date, schedule.start_time, schedule.end_time, schedule.department_id)
+        if self._slot_schedules.get(slot, set()) - {schedule.id}:
+            raise ValidationError("A scheduel with the same date, time, and department already exists.")
+
+        # Prevent duplicate role assignments except for '助教'
+        if role.name != TEACHING_ASSISTANT:
+            # Unsaved assignments recorded by add() are indexed under None and always conflict.
+            if self._role_assignments.get((schedule.id, role.id), set()) - ({role_assignment.id} - {None}):
+                raise ValidationError(f"角色名稱為'{role.name}' 已經被安排在此課表中")
+
+        if person:
+            # Check for overlapping time slots
+            conflict = self.find_overlap(person.id, schedule.date, schedule.start_time, schedule.end_time,
+                                         exclude_id=role_assignment.id)
+            if conflict is not None:
+                raise ValidationError(
+                    f"{person.name} is already assigned as a '{conflict.role_name}' in the '{conflict.department_name}' "
+                    f"department from {conflict.start_time} to {conflict.end_time}."
+                )
+
+    def has_role(self, schedule_id, role_id):
+        """
+        Returns whether the given role of the given schedule is already assigned.
+        """
+        return bool(self._role_assignments.get((schedule_id, role_id)))
+
+    def add(self, role_assignment):
+        """
+        Records the given role assignment, so that the following validations are made against it as well.
+        """
+        schedule = role_assignment.schedule
+        self._index(role_assignment.id, schedule.id, role_assignment.role.id, role_assignment.person_id, schedule.date,
+                    BusySlot(schedule.start_time, schedule.end_time, role_assignment.id,
+                             role_assignment.role.name, schedule.department.name))
+
+
+def _parse_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def validate_role_assignments(rows, lock=False):
+    """
+    Validates a batch of role assignments against the existing assignments as well as against the earlier rows
+    of the batch, without saving anything.
+
+    The schedules, roles and teachers referenced by the batch are loaded with in_bulk(), and a single
+    RoleAssignmentValidator indexes the dates involved.
+
+    :param rows: A list of {'schedule': id, 'role': id, 'person': id} dictionaries
+    :param lock: Locks the schedules of the dates involved until the end of the current transaction
+    :return: An (assignments, errors) tuple, where assignments holds one unsaved RoleAssignment per valid row
+             and errors holds an (index, message) tuple per invalid row
+    """
+    triples = [
+        tuple(_parse_id(row.get(field)) if isinstance(row, dict) else None for field in ('schedule', 'role', 'person'))
+        for row in rows
+    ]
+    schedules = Schedule.objects.select_related('department').in_bulk({triple[0] for triple in triples} - {None})
+    roles = ClassRole.objects.in_bulk({triple[1] for triple in triples} - {None})
+    persons = Teacher.objects.in_bulk({triple[2] for triple in triples} - {None})
+    validator = RoleAssignmentValidator({schedule.date for schedule in schedules.values()}, lock=lock)
+
+    assignments, errors = [], []
+    for index, (schedule_id, role_id, person_id) in enumerate(triples):
+        schedule, role, person = schedules.get(schedule_id), roles.get(role_id), persons.get(person_id)
+        if schedule is None or role is None or person is None:
+            errors.append((index, "schedule, role and person must all reference existing objects."))
+            continue
+
+        assignment = RoleAssignment(schedule=schedule, role=role, person=person)
+        try:
+            validator.validate(assignment)
+        except ValidationError as error:
+            errors.append((index, error.messages[0]))
+            continue
+
+        validator.add(assignment)
+        assignments.append(assignment)
+
+    return assignments, errors
+
+
+def create_role_assignments(rows):
+    """
+    Validates a batch of role assignments (see validate_role_assignments()) and saves them all with a single
+    bulk_create(), or none of them if any row is invalid.
+
+    The schedules of the dates involved stay locked from the validation until the batch is committed.
+
+    :return: An (assignments, errors) tuple; assignments holds the created RoleAssignments when errors is empty
+    """
+    with transaction.atomic():
+        assignments, errors = validate_role_assignments(rows, lock=True)
+        if errors:
+            return [], errors
+
+        # bulk_create() skips save() (validated above) and the post_save signals, so the workloads are
+        # refreshed here and the cached schedule tables are invalidated once the batch is committed.
+        RoleAssignment.objects.bulk_create(assignments)
+        refresh_workloads({(assignment.person.id, month_of(assignment.schedule.date)) for assignment in assignments})
+        slots = {(assignment.schedule.department.name, assignment.schedule.class_type, assignment.schedule.date)
+                 for assignment in assignments}
+        transaction.on_commit(lambda: invalidate_slots(slots))
+
+    return assignments, errors
@@ -0,0 +1,28 @@
+"""
+System checks of the deployment settings the schedule app relies on.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Cache backends whose entries are not seen by the other processes.
+PER_PROCESS_CACHE_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The version keys of the cached tables, pages and per-process snapshots are read from the default cache,
+    so with a cache private to each process, a change only reaches the worker which made it.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PER_PROCESS_CACHE_BACKENDS and not getattr(settings, 'LOCAL_PROFILE', False):
+        return [Error(
+            f"The default cache ({backend}) is not shared between processes.",
+            hint="Use a shared cache backend (e.g. set CACHE_LOCATION for the file-based cache), or run with "
+                 "SETTINGS_PROFILE=local for a single process.",
+            id='schedule.E001',
+        )]
+    return []
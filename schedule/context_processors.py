@@ -1,9 +1,56 @@
+from django.urls import reverse
 from .models import Department
+from .registry import get_registry
+from .views import (PRE_KINDERGARTEN, KINDERGARTEN, ELEMENTARY_1, ELEMENTARY_1_CN_JP, ELEMENTARY_2, JUNIOR,
+                    JUNIOR_JP, PIANICA, SHINKOYASU)
+
+# Departments with a page of their own; the others link to the generic department page.
+DEPARTMENT_PAGES = {
+    PRE_KINDERGARTEN: 'pre_kindergarten_schedules',
+    KINDERGARTEN: 'kindergarten_schedules',
+    ELEMENTARY_1: 'elementary_1_schedules',
+    ELEMENTARY_1_CN_JP: 'elementary_1_cn_jp_schedules',
+    ELEMENTARY_2: 'elementary_2_schedules',
+    JUNIOR: 'junior_schedules',
+    JUNIOR_JP: 'junior_jp_schedules',
+    PIANICA: 'pianica_schedules',
+    SHINKOYASU: 'shinkoyasu_schedules',
+}
+
+# (version, links) of the department links cached by this process.
+_department_links = (None, [])
+
+
+def _department_url(department_name):
+    if department_name in DEPARTMENT_PAGES:
+        return reverse(DEPARTMENT_PAGES[department_name])
+    return reverse('department_schedules', kwargs={'department_name': department_name})
+
+
+def get_department_links():
+    """
+    Returns a {'name': ..., 'url': ...} dictionary per department, ordered by id.
+
+    The links are built from the departments of the registry (see schedule.registry) and cached by the process
+    until the registry changes, so rendering a page costs a single cache lookup.
+    """
+    global _department_links
+
+    registry = get_registry()
+    version, links = _department_links
+    if version is None or version != registry.version:
+        links = [
+            {'name': department.name, 'url': _department_url(department.name)}
+            for department in registry.objects(Department)
+        ]
+        _department_links = (registry.version, links)
+    return links
+
 
 def department_links(request):
     """
     Returns all departments to make them available across all templates.
     """
     return {
-        'departments': Department.objects.all()
-    }
\ No newline at end of file
+        'departments': get_department_links()
+    }
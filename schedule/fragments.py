@@ -0,0 +1,130 @@
+"""
+Versioning of the cached schedule tables and pages.
+
+The rendered tables are cached with the {% cache %} template tag under a key built by fragment_key().
+That key embeds a generation stamp for every (department, class_type, term) the table covers, and the
+signal handlers in schedule.signals replace the stamps of the (department, class_type, date) slots that
+changed. Stale fragments are therefore never deleted, just no longer looked up, which works with every
+cache backend (local-memory and file-based included) since no key pattern matching is needed.
+
+Whole pages are versioned the same way, per department, for conditional GETs (ETag / Last-Modified):
+each department has a version stamp recording when its schedules last changed, and the '*' stamp
+changes along with every department.
+"""
+import hashlib
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from .windows import get_term
+
+FRAGMENT_CACHE_TIMEOUT = getattr(settings, 'SCHEDULE_FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24 * 7)
+
+# Bumped when a change cannot be traced back to specific slots (e.g. a teacher is deleted).
+ALL_FRAGMENTS_KEY = 'schedule:fragments:all'
+
+# Pseudo department whose version stamp changes whenever any department changes.
+ALL_DEPARTMENTS = '*'
+# Bumped when something shown on every page changes (e.g. the teachers in the assign-role dropdown).
+ALL_PAGES_KEY = 'schedule:versions:all'
+
+
+def _generation_key(department_name, class_type, term_start):
+    return f'schedule:fragments:{department_name}:{class_type}:{term_start.isoformat()}'
+
+
+def _terms(date_from, date_to):
+    """
+    Yields the first day of every term overlapping the given date window.
+    """
+    term_start, term_end = get_term(date_from)
+    while term_start <= date_to:
+        yield term_start
+        term_start, term_end = get_term(term_end + timedelta(days=1))
+
+
+def _version_key(department_name):
+    return f'schedule:versions:{department_name}'
+
+
+def _new_version():
+    return f'{time.time():.6f}:{uuid.uuid4().hex}'
+
+
+def page_versions(department_names):
+    """
+    Returns the version stamps of the given departments, preceded by the stamp shared by every page.
+    A stamp is a 'timestamp:token' string, where the timestamp is the time of the last change.
+    """
+    version_keys = [ALL_PAGES_KEY] + [_version_key(department_name) for department_name in department_names]
+    versions = cache.get_many(version_keys)
+
+    missing = {key: _new_version() for key in version_keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+
+    return [versions[key] for key in version_keys]
+
+
+def last_modified(versions):
+    """
+    Returns the time of the latest change recorded by the given version stamps, as a Unix timestamp.
+    """
+    return max(float(version.split(':')[0]) for version in versions)
+
+
+def fragment_key(view_name, department_names, class_types, date_from, date_to):
+    """
+    Returns the key under which a table of the given view, departments, class types and date window
+    is cached. The key changes as soon as any schedule in that scope is invalidated.
+    """
+    generation_keys = [ALL_FRAGMENTS_KEY] + [
+        _generation_key(department_name, class_type, term_start)
+        for department_name in department_names
+        for class_type in class_types
+        for term_start in _terms(date_from, date_to)
+    ]
+    generations = cache.get_many(generation_keys)
+
+    missing = {key: uuid.uuid4().hex for key in generation_keys if key not in generations}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        generations.update(missing)
+
+    raw_key = '|'.join([view_name, date_from.isoformat(), date_to.isoformat()] +
+                       [generations[key] for key in generation_keys])
+    return hashlib.md5(raw_key.encode()).hexdigest()
+
+
+def invalidate_slots(slots):
+    """
+    Invalidates the cached tables covering the given (department name, class type, date) slots
+    and changes the version of the pages of their departments.
+    """
+    keys, department_names = set(), set()
+    for department_name, class_type, day in slots:
+        keys.add(_generation_key(department_name, class_type, get_term(day)[0]))
+        department_names.add(department_name)
+
+    if keys:
+        version = _new_version()
+        cache.set_many({
+            **{key: uuid.uuid4().hex for key in keys},
+            **{_version_key(name): version for name in department_names | {ALL_DEPARTMENTS}},
+        }, timeout=None)
+
+
+def invalidate_pages():
+    """
+    Changes the version of every page, without invalidating the cached tables.
+    """
+    cache.set(ALL_PAGES_KEY, _new_version(), timeout=None)
+
+
+def invalidate_all():
+    """
+    Invalidates every cached table and changes the version of every page.
+    """
+    cache.set_many({ALL_FRAGMENTS_KEY: uuid.uuid4().hex, ALL_PAGES_KEY: _new_version()}, timeout=None)
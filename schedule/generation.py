@@ -0,0 +1,101 @@
+"""
+Generation of the schedules from the recurring ScheduleTemplate rules.
+
+Every template is expanded into its dates within the requested window with plain date arithmetic
+(no week-by-week walk from the start of the month), so the cost is proportional to the number of
+generated schedules. The wanted (date, department, class_type) slots are compared with the existing
+schedules with a single query, and the missing ones are inserted with a single bulk_create().
+Existing schedules are never changed, so generating the same window again is harmless.
+"""
+from datetime import date, timedelta
+from django.db import transaction
+from .models import Schedule, ScheduleTemplate
+from .fragments import invalidate_slots
+
+
+def week_of_month(day):
+    """
+    Returns n where the given day is the nth occurrence of its weekday in its month, e.g. 1 for the first Saturday.
+    """
+    return (day.day - 1) // 7 + 1
+
+
+def get_upcoming_saturdays(count, today=None):
+    """
+    Returns the given number of consecutive Saturdays, starting with the Saturday after next.
+    """
+    today = today or date.today()
+    # Calculate the number of days to the next Saturday
+    days_to_next_saturday = (5 - today.weekday()) % 7 + 7
+    return [today + timedelta(days=days_to_next_saturday + i * 7) for i in range(count)]
+
+
+def _first_weekday_on_or_after(day, weekday):
+    return day + timedelta(days=(weekday - day.weekday()) % 7)
+
+
+def expand_template(template, date_from, date_to):
+    """
+    Yields the dates of the given template within the given window, in order.
+    """
+    first = max(date_from, template.effective_from)
+    last = min(date_to, template.effective_until) if template.effective_until else date_to
+    day = _first_weekday_on_or_after(first, template.weekday)
+    step = 1
+
+    if template.recurrence == ScheduleTemplate.EVERY_NTH_WEEK:
+        step = template.interval
+        # Skip ahead to the next week counted from the first occurrence of the template.
+        anchor = _first_weekday_on_or_after(template.effective_from, template.weekday)
+        day += timedelta(weeks=-((day - anchor).days // 7) % step)
+
+    parity = {ScheduleTemplate.ODD_WEEKS: 1, ScheduleTemplate.EVEN_WEEKS: 0}.get(template.recurrence)
+    while day <= last:
+        if parity is None or week_of_month(day) % 2 == parity:
+            yield day
+        day += timedelta(weeks=step)
+
+
+def plan_schedules(templates, date_from, date_to):
+    """
+    Returns an unsaved Schedule for every occurrence of the given templates within the given window.
+    When several templates produce the same (date, department, class_type), the first one wins.
+
+    :param templates: ScheduleTemplates, with their department selected
+    """
+    schedules = {}
+    for template in templates:
+        for day in expand_template(template, date_from, date_to):
+            schedules.setdefault((day, template.department_id, template.class_type), Schedule(
+                department=template.department, date=day, class_type=template.class_type,
+                start_time=template.start_time, end_time=template.end_time
+            ))
+    return sorted(schedules.values(), key=lambda schedule: (schedule.date, schedule.department_id, schedule.start_time))
+
+
+def generate_schedules(date_from, date_to, dry_run=False):
+    """
+    Creates the schedules of every ScheduleTemplate missing within the given window.
+
+    :param dry_run: Only returns the schedules which would be created
+    :return: The list of the created (or missing, with dry_run) schedules, ordered by date
+    """
+    templates = ScheduleTemplate.objects.select_related('department').filter(
+        effective_from__lte=date_to
+    ).exclude(effective_until__lt=date_from).order_by('id')
+    existing = set(Schedule.objects.filter(date__range=(date_from, date_to)).values_list(
+        'date', 'department_id', 'class_type'
+    ))
+    missing = [
+        schedule for schedule in plan_schedules(templates, date_from, date_to)
+        if (schedule.date, schedule.department_id, schedule.class_type) not in existing
+    ]
+
+    if not dry_run and missing:
+        # A concurrent generation may have inserted some of them meanwhile; the unique constraint skips those.
+        Schedule.objects.bulk_create(missing, ignore_conflicts=True)
+        # bulk_create() sends no post_save signal.
+        slots = [(schedule.department.name, schedule.class_type, schedule.date) for schedule in missing]
+        transaction.on_commit(lambda: invalidate_slots(slots))
+
+    return missing
@@ -0,0 +1,145 @@
+import json
+import math
+import time
+from pathlib import Path
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from schedule import urls
+from schedule.models import Department, Schedule, RoleAssignment
+
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+
+# Routes which cannot be requested with a plain GET.
+SKIPPED_ROUTES = {'api_role_assignments_bulk', 'profile_report', 'profile_download'}
+
+# Extra query parameters of some routes.
+ROUTE_PARAMETERS = {'api_teacher_autocomplete': {'q': '老'}}
+
+
+def percentile(timings, percent):
+    """
+    Returns the given percentile of the timings, by the nearest-rank method.
+    """
+    ordered = sorted(timings)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = ("Times every page of the schedule app, the admin changelists and RoleAssignment.clean() on the current "
+            "database (see seed_dataset), and fails if they got slower than the stored baseline or run more queries.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help="Runs of each target")
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Path of the baseline JSON file")
+        parser.add_argument('--save-baseline', action='store_true', help="Stores the results as the new baseline")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Allowed p95 slowdown over the baseline, as a fraction")
+        parser.add_argument('--warm', action='store_true',
+                            help="Keeps the cache between runs instead of clearing it before each one")
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be at least 1.")
+        if not Schedule.objects.exists():
+            raise CommandError("There are no schedules to benchmark; run seed_dataset first.")
+
+        # The benchmark user and its session are rolled back along with everything the targets write.
+        with override_settings(ALLOWED_HOSTS=['*']), transaction.atomic():
+            client = Client()
+            client.force_login(User.objects.create_superuser('benchmark', password=None))
+            results = {
+                name: self.measure(target, options['repeat'], options['warm'])
+                for name, target in self.get_targets(client)
+            }
+            transaction.set_rollback(True)
+
+        self.report(results)
+
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.write_text(json.dumps(results, indent=2, ensure_ascii=False, sort_keys=True))
+            self.stdout.write(self.style.SUCCESS(f"Saved the baseline to {baseline_path}."))
+        elif baseline_path.exists():
+            self.compare(results, json.loads(baseline_path.read_text()), options['tolerance'])
+
+    def get_targets(self, client):
+        """
+        Yields a (name, callable) pair per target.
+        """
+        department = Department.objects.order_by('id').first()
+        schedules = Schedule.objects.order_by('date', 'id')
+        sample_kwargs = {
+            'department_name': department.name,
+            'schedule_id': schedules[schedules.count() // 2].id,
+        }
+
+        def get(url, params=None):
+            def run():
+                response = client.get(url, params or {})
+                if response.status_code >= 400:
+                    raise CommandError(f"{url} responded {response.status_code}.")
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            return run
+
+        for route in urls.urlpatterns:
+            if route.name in SKIPPED_ROUTES:
+                continue
+            url = reverse(route.name, kwargs={name: sample_kwargs[name] for name in route.pattern.converters})
+            yield route.name, get(url, ROUTE_PARAMETERS.get(route.name))
+
+        for model in admin.site._registry:
+            if model._meta.app_label == 'schedule':
+                name = f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist'
+                yield name, get(reverse(name))
+
+        assignments = RoleAssignment.objects.select_related('schedule', 'role', 'person').order_by('id')
+        count = assignments.count()
+        if count:
+            yield 'RoleAssignment.clean', assignments[count // 2].clean
+
+    @staticmethod
+    def measure(run, repeat, warm):
+        """
+        Returns the p50 and p95 latencies (ms) and the largest number of queries of the given target.
+        """
+        # The first run loads the modules, templates and (with warm) the caches.
+        run()
+        timings, queries = [], 0
+        for _ in range(repeat):
+            if not warm:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(captured))
+        return {'p50': round(percentile(timings, 50), 3), 'p95': round(percentile(timings, 95), 3), 'queries': queries}
+
+    def report(self, results):
+        width = max(len(name) for name in results)
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{'target':<{width}}  {'p50 ms':>9}  {'p95 ms':>9}  queries"))
+        for name, result in results.items():
+            self.stdout.write(f"{name:<{width}}  {result['p50']:>9.2f}  {result['p95']:>9.2f}  {result['queries']:>7}")
+
+    def compare(self, results, baseline, tolerance):
+        regressions = []
+        for name, result in results.items():
+            expected = baseline.get(name)
+            if expected is None:
+                self.stdout.write(self.style.WARNING(f"{name} is not in the baseline."))
+                continue
+            if result['p95'] > expected['p95'] * (1 + tolerance):
+                regressions.append(f"{name}: p95 {result['p95']:.2f} ms > baseline {expected['p95']:.2f} ms")
+            if result['queries'] > expected['queries']:
+                regressions.append(f"{name}: {result['queries']} queries > baseline {expected['queries']}")
+
+        if regressions:
+            raise CommandError("Regressions over the baseline:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regression over the baseline."))
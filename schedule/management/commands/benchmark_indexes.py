@@ -0,0 +1,125 @@
+import random
+import statistics
+import time
+from datetime import date, time as clock, timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from schedule.models import Department, ClassRole, Teacher, Schedule, RoleAssignment
+from schedule.workloads import cell_assignments, month_of
+
+# The composite indexes declared on the models, dropped and recreated to compare the query plans.
+COMPOSITE_INDEXES = [
+    (Schedule, 'schedule_dept_type_date_idx'),
+]
+
+# (department, class_type, start_time, end_time) of every seeded Saturday.
+SEED_SLOTS = [
+    ('幼幼班', '崇拜', clock(14, 0), clock(14, 30)),
+    ('幼幼班', '共習', clock(14, 40), clock(15, 0)),
+    ('幼稚班', '詩頌', clock(11, 30), clock(12, 0)),
+    ('幼稚班', '崇拜', clock(14, 0), clock(14, 35)),
+    ('幼稚班', '共習', clock(14, 40), clock(15, 0)),
+    ('幼年班', '崇拜', clock(14, 0), clock(14, 55)),
+    ('幼年班', '詩頌', clock(15, 0), clock(15, 30)),
+    ('少年班', '崇拜', clock(14, 0), clock(14, 55)),
+    ('少年班', '共習', clock(15, 0), clock(15, 30)),
+]
+
+
+class Command(BaseCommand):
+    help = ("Seeds several years of Saturdays in a transaction that is rolled back, and reports the query plans "
+            "and timings of the hot filter paths without and with the composite indexes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=int, default=3, help="Years of Saturdays to seed")
+        parser.add_argument('--teachers', type=int, default=200, help="Number of teachers to seed")
+        parser.add_argument('--repeat', type=int, default=50, help="Runs of each query to time")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['years'], options['teachers'])
+            queries = self.get_queries()
+            editor = connection.schema_editor()
+
+            for model, name in COMPOSITE_INDEXES:
+                self.run_sql(f'DROP INDEX {connection.ops.quote_name(name)}')
+            self.report("Without the composite indexes", queries, options['repeat'])
+
+            for model, name in COMPOSITE_INDEXES:
+                self.run_sql(self.get_index(model, name).create_sql(model, editor))
+            self.report("With the composite indexes", queries, options['repeat'])
+
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def get_index(model, name):
+        return next(index for index in model._meta.indexes if index.name == name)
+
+    @staticmethod
+    def run_sql(sql):
+        with connection.cursor() as cursor:
+            cursor.execute(str(sql))
+
+    def seed(self, years, teacher_count):
+        generator = random.Random(0)
+        departments = {
+            name: Department.objects.create(name=f'{name} (benchmark)')
+            for name in dict.fromkeys(department_name for department_name, _, _, _ in SEED_SLOTS)
+        }
+        roles = [ClassRole.objects.create(name=f'{name} (benchmark)') for name in ('主領', '司琴', '助教')]
+        teachers = Teacher.objects.bulk_create(
+            Teacher(name=f'benchmark {i}', status='擔任中', gender='女') for i in range(teacher_count)
+        )
+
+        first_saturday = date.today() - timedelta(days=(date.today().weekday() - 5) % 7 + 364 * years)
+        schedules = Schedule.objects.bulk_create(
+            Schedule(department=departments[department_name], date=first_saturday + timedelta(weeks=week),
+                     class_type=class_type, start_time=start_time, end_time=end_time)
+            for week in range(52 * years)
+            for department_name, class_type, start_time, end_time in SEED_SLOTS
+        )
+        RoleAssignment.objects.bulk_create(
+            RoleAssignment(schedule=schedule, role=role, person=generator.choice(teachers))
+            for schedule in schedules
+            for role in roles
+        )
+        self.run_sql('ANALYZE')
+
+        self.stdout.write(f"Seeded {len(schedules)} schedules and {len(schedules) * len(roles)} role assignments "
+                          f"on {connection.vendor}.")
+        self.sample = {
+            'department': departments['幼稚班'],
+            'schedule': schedules[len(schedules) // 2],
+        }
+
+    def get_queries(self):
+        """
+        Returns the querysets of the hot filter paths, by name.
+        """
+        department, schedule = self.sample['department'], self.sample['schedule']
+        day = schedule.date
+        # The cells refreshed after the roles of a schedule are assigned (see schedule.assignments).
+        cells = {(person_id, month_of(day)) for person_id in schedule.role_assignments.values_list('person_id',
+                                                                                                   flat=True)}
+        return {
+            "Department sheet (department, class_type, date window)": Schedule.objects.filter(
+                department=department, class_type='崇拜', date__range=(day, day + timedelta(days=90))
+            ),
+            "Workload refresh (person_id__in, schedule__date__range)": cell_assignments(cells),
+            "RoleAssignmentValidator day": Schedule.objects.filter(date__in=[day]).values_list(
+                'id', 'role_assignments__id', 'role_assignments__person_id'
+            ),
+        }
+
+    def report(self, title, queries, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n{title}"))
+        for name, queryset in queries.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+
+            self.stdout.write(self.style.MIGRATE_LABEL(f"\n{name}: median {statistics.median(timings):.3f} ms, "
+                                                       f"max {max(timings):.3f} ms over {repeat} runs"))
+            self.stdout.write(queryset.explain())
@@ -0,0 +1,28 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from schedule.generation import generate_schedules, get_upcoming_saturdays
+
+
+class Command(BaseCommand):
+    help = "Creates the schedules of the schedule templates missing within the upcoming weeks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weeks', type=int, default=14, help="Number of weeks to generate")
+        parser.add_argument('--start', type=date.fromisoformat,
+                            help="First day to generate (YYYY-MM-DD), defaulting to the Saturday after next")
+        parser.add_argument('--dry-run', action='store_true', help="Only lists the schedules which would be created")
+
+    def handle(self, *args, **options):
+        if options['weeks'] < 1:
+            raise CommandError("--weeks must be at least 1.")
+
+        date_from = options['start'] or get_upcoming_saturdays(1)[0]
+        date_to = date_from + timedelta(weeks=options['weeks'], days=-1)
+
+        schedules = generate_schedules(date_from, date_to, dry_run=options['dry_run'])
+        for schedule in schedules:
+            self.stdout.write(f"{schedule.date} {schedule.department.name} {schedule.class_type} "
+                              f"{schedule.start_time:%H:%M}-{schedule.end_time:%H:%M}")
+
+        verb = "Would create" if options['dry_run'] else "Created"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(schedules)} schedules from {date_from} to {date_to}."))
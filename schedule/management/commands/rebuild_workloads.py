@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from schedule.workloads import rebuild_workloads
+
+
+class Command(BaseCommand):
+    help = "Recomputes the teacher workloads from all the role assignments."
+
+    def handle(self, *args, **options):
+        count = rebuild_workloads()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} teacher workloads."))
@@ -0,0 +1,120 @@
+import random
+from datetime import date, time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from schedule.assignments import create_role_assignments
+from schedule.generation import generate_schedules
+from schedule.models import Department, ClassRole, Position, Teacher, ScheduleTemplate
+from schedule.roster import solve_roster
+from schedule.teachers import invalidate_teacher_index
+from schedule.views import HYMN_CLASS, HymnClassesView, get_required_roles
+
+# The roles read by the hymn class page, in addition to those of the department sheets.
+HYMN_PAGE_ROLES = ['主領', '司琴', '助教']
+
+# (start_time, end_time) of the templates created for the class types without one, every Saturday.
+DEFAULT_TIMES = {
+    '詩頌': (time(11, 30), time(12, 0)),
+    '口風琴': (time(13, 0), time(13, 45)),
+    '崇拜': (time(14, 0), time(14, 55)),
+    '共習': (time(15, 0), time(15, 30)),
+}
+
+POSITIONS = ['老師', '助教', '司琴']
+
+
+class Command(BaseCommand):
+    help = ("Seeds a synthetic dataset for benchmarks: the departments of the schedule pages, several years of "
+            "schedules generated from the schedule templates, teachers and the role assignments of a roster.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=int, default=3, help="Years of schedules, ending with the current one")
+        parser.add_argument('--teachers', type=int, default=300, help="Number of teachers to add")
+        parser.add_argument('--fill', type=float, default=0.9, help="Share of the open roles to assign (0 to 1)")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the random generator")
+
+    def handle(self, *args, **options):
+        if options['years'] < 1:
+            raise CommandError("--years must be at least 1.")
+        if not 0 <= options['fill'] <= 1:
+            raise CommandError("--fill must be between 0 and 1.")
+
+        generator = random.Random(options['seed'])
+        date_to = date(date.today().year, 12, 31)
+        date_from = date(date_to.year - options['years'] + 1, 1, 1)
+        required_roles = self.get_required_roles()
+
+        with transaction.atomic():
+            departments = self.seed_dimensions(required_roles)
+            templates = self.seed_templates(departments, required_roles, date_from)
+            teachers = self.seed_teachers(departments, options['teachers'], generator)
+            schedules = generate_schedules(date_from, date_to)
+
+        roster = solve_roster(date_from, date_to, required_roles)
+        rows = [
+            {'schedule': assignment.schedule.id, 'role': assignment.role.id, 'person': assignment.teacher.id}
+            for assignment in roster.assignments
+            if generator.random() < options['fill']
+        ]
+        assignments, errors = create_role_assignments(rows)
+        if errors:
+            raise CommandError(f"Could not assign the roster: {errors[0][1]}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(templates)} schedule templates, {len(teachers)} teachers, {len(schedules)} schedules and "
+            f"{len(assignments)} role assignments from {date_from} to {date_to}."
+        ))
+
+    @staticmethod
+    def get_required_roles():
+        required_roles = get_required_roles()
+        for department_name in HymnClassesView.page_departments:
+            roles = required_roles.setdefault((department_name, HYMN_CLASS), [])
+            roles.extend(role for role in HYMN_PAGE_ROLES if role not in roles)
+        return required_roles
+
+    @staticmethod
+    def seed_dimensions(required_roles):
+        for role_name in dict.fromkeys(role for roles in required_roles.values() for role in roles):
+            ClassRole.objects.get_or_create(name=role_name)
+        for position_name in POSITIONS:
+            Position.objects.get_or_create(name=position_name)
+        return {
+            department_name: Department.objects.get_or_create(name=department_name)[0]
+            for department_name in dict.fromkeys(department_name for department_name, _ in required_roles)
+        }
+
+    @staticmethod
+    def seed_templates(departments, required_roles, date_from):
+        """
+        Creates a weekly template for every class type of the departments which has none yet.
+        """
+        existing = set(ScheduleTemplate.objects.values_list('department__name', 'class_type'))
+        return ScheduleTemplate.objects.bulk_create(
+            ScheduleTemplate(department=departments[department_name], class_type=class_type,
+                             start_time=DEFAULT_TIMES[class_type][0], end_time=DEFAULT_TIMES[class_type][1],
+                             effective_from=date_from)
+            for department_name, class_type in required_roles
+            if (department_name, class_type) not in existing
+        )
+
+    @staticmethod
+    def seed_teachers(departments, count, generator):
+        """
+        Adds teachers spread over the departments, a fifth of them without a department.
+        """
+        positions = list(Position.objects.filter(name__in=POSITIONS))
+        departments = list(departments.values())
+        teachers = Teacher.objects.bulk_create(
+            Teacher(
+                name=f'老師{index:04d}',
+                status=generator.choices(['擔任中', '新任', '休息中'], weights=[8, 1, 1])[0],
+                department=departments[index % len(departments)] if generator.random() < 0.8 else None,
+                position=generator.choice(positions),
+                gender=generator.choice(['男', '女']),
+            )
+            for index in range(count)
+        )
+        # bulk_create() sends no post_save signal.
+        transaction.on_commit(invalidate_teacher_index)
+        return teachers
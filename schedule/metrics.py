@@ -0,0 +1,208 @@
+"""
+Per-request performance metrics, per view name.
+
+MetricsMiddleware measures every request: its SQL queries (counted and timed with connection.execute_wrapper()),
+the time spent in the pandas helpers decorated with @timed('pandas'), the template rendering and the total
+latency. They are sent back in a Server-Timing header, so the browser's developer tools show them, and
+accumulated into histograms exposed in the Prometheus text format by metrics_view (/metrics), to staff users
+and to scrapers sending the SCHEDULE_METRICS_TOKEN setting as a bearer token.
+
+The histograms live in the memory of each process, like the other per-process caches of the app; with
+several worker processes, every scrape reads the process which happens to serve it. Queries run while a
+streaming response is consumed (the CSV and JSON exports) are not counted, since they happen after the
+middleware returns.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+# Upper bounds of the histogram buckets.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# name -> (help text, buckets), in the order they are exposed.
+HISTOGRAMS = {
+    'schedule_request_duration_seconds': ("Total latency of the requests.", DURATION_BUCKETS),
+    'schedule_request_sql_queries': ("SQL queries run by the requests.", QUERY_COUNT_BUCKETS),
+    'schedule_request_sql_duration_seconds': ("Time spent running SQL queries.", DURATION_BUCKETS),
+    'schedule_request_pandas_duration_seconds': ("Time spent in the pandas helpers.", DURATION_BUCKETS),
+    'schedule_request_template_duration_seconds': ("Time spent rendering templates.", DURATION_BUCKETS),
+}
+
+_current = ContextVar('schedule_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    The measures of a single request, in seconds.
+    """
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.phases = {'pandas': 0.0, 'template': 0.0}
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.sql_count += 1
+
+    def server_timing(self, total):
+        """
+        Returns the value of the Server-Timing header, with durations in milliseconds.
+        """
+        return ', '.join([
+            f'sql;dur={self.sql_time * 1000:.1f};desc="{self.sql_count} queries"',
+            f'pandas;dur={self.phases["pandas"] * 1000:.1f}',
+            f'template;dur={self.phases["template"] * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+def timed(phase):
+    """
+    Decorates a function so that its duration is added to the given phase of the current request, if measured.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            metrics = _current.get()
+            if metrics is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                metrics.phases[phase] += time.perf_counter() - start
+        return wrapper
+    return decorator
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Per bucket, not cumulative; the last one is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# (histogram name, view name) -> Histogram
+_histograms = {}
+_lock = threading.Lock()
+
+
+def observe(view_name, metrics, total):
+    """
+    Records the measures of a request made to the given view.
+    """
+    values = {
+        'schedule_request_duration_seconds': total,
+        'schedule_request_sql_queries': metrics.sql_count,
+        'schedule_request_sql_duration_seconds': metrics.sql_time,
+        'schedule_request_pandas_duration_seconds': metrics.phases['pandas'],
+        'schedule_request_template_duration_seconds': metrics.phases['template'],
+    }
+    with _lock:
+        for name, value in values.items():
+            key = (name, view_name)
+            if key not in _histograms:
+                _histograms[key] = Histogram(HISTOGRAMS[name][1])
+            _histograms[key].observe(value)
+
+
+def reset_metrics():
+    with _lock:
+        _histograms.clear()
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics():
+    """
+    Returns the histograms in the Prometheus text exposition format.
+    """
+    lines = []
+    with _lock:
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (histogram_name, view_name), histogram in sorted(_histograms.items()):
+                if histogram_name != name:
+                    continue
+                view = _label(view_name)
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{view="{view}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{view="{view}"}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def _has_metrics_token(request):
+    token = settings.SCHEDULE_METRICS_TOKEN
+    return bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+
+def metrics_view(request):
+    if not (request.user.is_staff or _has_metrics_token(request)):
+        raise PermissionDenied
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class MetricsMiddleware:
+    """
+    Measures every request (see the module docstring). Should come first in MIDDLEWARE, so that the
+    template rendering starts right after its process_template_response() has run.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.sql_wrapper))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+
+        match = request.resolver_match
+        observe(match.view_name if match else '<unresolved>', metrics, total)
+        response['Server-Timing'] = metrics.server_timing(total)
+        return response
+
+    def process_template_response(self, request, response):
+        metrics = _current.get()
+        if metrics is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                metrics.phases['template'] += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0004_rename_lesson_number_schedule_unit_number'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='roleassignment',
+            index=models.Index(fields=['person', 'schedule'], name='roleassignment_person_sch_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roleassignment',
+            index=models.Index(fields=['schedule', 'role'], name='roleassignment_sch_role_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['department', 'class_type', 'date'], name='schedule_dept_type_date_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:47
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0005_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('class_type', models.CharField(choices=[('崇拜', '崇拜'), ('詩頌', '詩頌'), ('共習', '共習'), ('口風琴', '口風琴')], max_length=50)),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('weekday', models.IntegerField(choices=[(0, '星期一'), (1, '星期二'), (2, '星期三'), (3, '星期四'), (4, '星期五'), (5, '星期六'), (6, '星期日')], default=5)),
+                ('recurrence', models.CharField(choices=[('every', '每週'), ('odd', '每月第1、3、5週'), ('even', '每月第2、4週'), ('nth', '每N週')], default='every', max_length=10)),
+                ('interval', models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)])),
+                ('effective_from', models.DateField()),
+                ('effective_until', models.DateField(blank=True, null=True)),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedule_templates', to='schedule.department')),
+            ],
+        ),
+    ]
@@ -0,0 +1,61 @@
+from datetime import date, time
+from django.db import migrations
+
+# The timetable previously hard-coded in the generate_schedules admin action:
+# department name -> (class_type, start_time, end_time, recurrence)
+TIMETABLE = {
+    "幼幼班": [
+        ("崇拜", time(14, 0), time(14, 30), "every"),
+        ("共習", time(14, 40), time(15, 0), "every"),
+    ],
+    "幼稚班": [
+        ("詩頌", time(11, 30), time(12, 0), "every"),
+        ("崇拜", time(14, 0), time(14, 35), "every"),
+        ("共習", time(14, 40), time(15, 0), "every"),
+    ],
+    "幼年班": [
+        ("崇拜", time(14, 0), time(14, 55), "every"),
+        ("詩頌", time(15, 0), time(15, 30), "odd"),
+        ("共習", time(15, 0), time(15, 30), "even"),
+    ],
+    "幼年班(中日文)": [
+        ("崇拜", time(14, 0), time(14, 55), "every"),
+        ("詩頌", time(15, 0), time(15, 30), "odd"),
+        ("共習", time(15, 0), time(15, 30), "even"),
+    ],
+    "少年班": [
+        ("崇拜", time(14, 0), time(14, 55), "every"),
+        ("共習", time(15, 0), time(15, 30), "odd"),
+        ("詩頌", time(15, 0), time(15, 30), "even"),
+    ],
+    "青教組": [
+        ("崇拜", time(14, 0), time(14, 55), "every"),
+        ("共習", time(15, 0), time(15, 30), "every"),
+    ],
+    "日文班": [
+        ("崇拜", time(14, 0), time(14, 55), "every"),
+        ("共習", time(15, 0), time(15, 30), "every"),
+    ],
+}
+
+
+def seed_schedule_templates(apps, schema_editor):
+    Department = apps.get_model("schedule", "Department")
+    ScheduleTemplate = apps.get_model("schedule", "ScheduleTemplate")
+
+    ScheduleTemplate.objects.bulk_create(
+        ScheduleTemplate(department=department, class_type=class_type, start_time=start_time, end_time=end_time,
+                         weekday=5, recurrence=recurrence, effective_from=date(2025, 1, 1))
+        for department in Department.objects.filter(name__in=TIMETABLE)
+        for class_type, start_time, end_time, recurrence in TIMETABLE[department.name]
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("schedule", "0006_scheduletemplate"),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_schedule_templates, migrations.RunPython.noop),
+    ]
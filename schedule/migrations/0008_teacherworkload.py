@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:57
+
+import django.db.models.deletion
+from collections import defaultdict
+from django.db import migrations, models
+
+
+def populate_teacher_workloads(apps, schema_editor):
+    # The same aggregation as schedule.workloads.rebuild_workloads(), with the historical models.
+    RoleAssignment = apps.get_model("schedule", "RoleAssignment")
+    TeacherWorkload = apps.get_model("schedule", "TeacherWorkload")
+
+    totals = defaultdict(lambda: [0, 0])
+    for person_id, role_id, department_id, day, start_time, end_time in RoleAssignment.objects.filter(
+        person__isnull=False
+    ).values_list('person_id', 'role_id', 'schedule__department_id', 'schedule__date', 'schedule__start_time',
+                  'schedule__end_time').iterator(chunk_size=2000):
+        total = totals[(person_id, day.replace(day=1), role_id, department_id)]
+        total[0] += 1
+        total[1] += (end_time.hour * 60 + end_time.minute) - (start_time.hour * 60 + start_time.minute)
+
+    TeacherWorkload.objects.bulk_create((
+        TeacherWorkload(person_id=person_id, month=month, role_id=role_id, department_id=department_id,
+                        count=count, minutes=minutes)
+        for (person_id, month, role_id, department_id), (count, minutes) in totals.items()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0007_seed_schedule_templates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeacherWorkload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('minutes', models.PositiveIntegerField(default=0)),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='schedule.department')),
+                ('person', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='workloads', to='schedule.teacher')),
+                ('role', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='schedule.classrole')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month'], name='teacherworkload_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('person', 'month', 'role', 'department'), name='unique_teacher_workload_constraint')],
+            },
+        ),
+        migrations.RunPython(populate_teacher_workloads, migrations.RunPython.noop),
+    ]
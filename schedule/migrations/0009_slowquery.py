@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0008_teacherworkload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('duration', models.FloatField()),
+                ('sql', models.TextField()),
+                ('params', models.TextField(blank=True)),
+                ('origin', models.CharField(blank=True, max_length=300)),
+                ('view_name', models.CharField(blank=True, max_length=200)),
+                ('explain', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Slow queries',
+                'indexes': [models.Index(fields=['-duration'], name='slowquery_duration_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:12
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0009_slowquery'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='roleassignment',
+            name='roleassignment_person_sch_idx',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:29
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0010_drop_roleassignment_person_schedule_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='roleassignment',
+            name='roleassignment_sch_role_idx',
+        ),
+    ]
@@ -125,6 +125,56 @@ class Schedule(models.Model):
                 name='unique_schedule_constraint'
             )
         ]
+        indexes = [
+            # The schedule pages and exports read a department's class types over a date window.
+            models.Index(fields=['department', 'class_type', 'date'], name='schedule_dept_type_date_idx'),
+        ]
+
+
+# ScheduleTemplate Model
+class ScheduleTemplate(models.Model):
+    """
+    A recurring class of a department, from which the schedules are generated (see schedule/generation.py).
+    """
+    EVERY_WEEK = 'every'
+    ODD_WEEKS = 'odd'
+    EVEN_WEEKS = 'even'
+    EVERY_NTH_WEEK = 'nth'
+    RECURRENCE_CHOICES = [
+        (EVERY_WEEK, '每週'),
+        (ODD_WEEKS, '每月第1、3、5週'),
+        (EVEN_WEEKS, '每月第2、4週'),
+        (EVERY_NTH_WEEK, '每N週'),
+    ]
+    WEEKDAY_CHOICES = [
+        (0, '星期一'),
+        (1, '星期二'),
+        (2, '星期三'),
+        (3, '星期四'),
+        (4, '星期五'),
+        (5, '星期六'),
+        (6, '星期日'),
+    ]
+
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='schedule_templates')
+    class_type = models.CharField(max_length=50, choices=Schedule.CLASS_TYPE_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    weekday = models.IntegerField(choices=WEEKDAY_CHOICES, default=5)
+    recurrence = models.CharField(max_length=10, choices=RECURRENCE_CHOICES, default=EVERY_WEEK)
+    # Only used by EVERY_NTH_WEEK, counting the weeks from the first occurrence on or after effective_from.
+    interval = models.PositiveSmallIntegerField(default=1, validators=[MinValueValidator(1)])
+    effective_from = models.DateField()
+    effective_until = models.DateField(null=True, blank=True)  # Open-ended if blank
+
+    def clean(self):
+        if self.start_time and self.end_time and self.end_time <= self.start_time:
+            raise ValidationError("End time must be later than start time.")
+        if self.effective_until and self.effective_from and self.effective_until < self.effective_from:
+            raise ValidationError("The effective period must not end before it starts.")
+
+    def __str__(self):
+        return f"{self.department} - {self.class_type} - {self.get_weekday_display()} ({self.get_recurrence_display()})"
 
 
 # Activity Model
@@ -147,71 +197,21 @@ class RoleAssignment(models.Model):
     role = models.ForeignKey(ClassRole, on_delete=models.CASCADE)  # Link to the role
     person = models.ForeignKey(Teacher, on_delete=models.SET_NULL, null=True)
 
+    # Set on the assignments of a formset validating them all with one RoleAssignmentValidator
+    # (see RoleAssignmentInlineFormSet), so that they are not checked one by one again.
+    validated_in_batch = False
+
     def clean(self):
         """
         Prevent assigning a teacher to multiple tasks with overlapping time slots,
         and ensure a teacher can only have one role in a department on the same day.
         """
-        # Ensure the schedule is not duplicated
-        schedule_data = {
-            'date': self.schedule.date,
-            'start_time': self.schedule.start_time,
-            'end_time': self.schedule.end_time,
-            'department': self.schedule.department,
-        }
-        existing_schedule = Schedule.objects.filter(**schedule_data).exclude(id=self.schedule.id).exists()
-        if existing_schedule:
-            raise ValidationError("A scheduel with the same date, time, and department already exists.")
-        # Allow multiple Teaching Assistants
-        TEACHING_ASSISTANT = '助教'
-
-        # **Added Logic: Prevent duplicate role assignments except for '助教'**
-        if self.role.name != TEACHING_ASSISTANT:  # Highlight Start
-            conflicting_role_assignments = RoleAssignment.objects.filter(
-                schedule=self.schedule,
-                role=self.role
-            ).exclude(id=self.id)
-
-            if conflicting_role_assignments.exists():
-                raise ValidationError(
-                    f"角色名稱為'{self.role.name}' 已經被安排在此課表中"
-                )  # Highlight End
-
-        if self.person:
-            # Check for overlapping time slots
-            conflicting_assignments = RoleAssignment.objects.filter(
-                person=self.person,
-                schedule__date=self.schedule.date,
-                # Check overlapping time slots
-                schedule__start_time__lt=self.schedule.end_time,
-                schedule__end_time__gt=self.schedule.start_time
-            ).exclude(id=self.id)  # Exclude the current instance being validated
-
-            if conflicting_assignments.exists():
-                conflict = conflicting_assignments.first()  # Get the first conflict
-                department_name = conflict.schedule.department.name if conflict.schedule.department else "Unknown Department"
-                role_name = conflict.role  # Retrieve the role name
-
-                raise ValidationError(
-                    f"{self.person.name} is already assigned as a '{role_name}' in the '{department_name}' department "
-                    f"from {conflict.schedule.start_time} to {conflict.schedule.end_time}."
-                )
-
-            # # Check if the teacher is assigned to another role in the same department on the same day
-            # same_department_assignments = RoleAssignment.objects.filter(
-            #     person=self.person,
-            #     schedule__date=self.schedule.date,
-            #     schedule__department=self.schedule.department
-            # ).exclude(id=self.id)  # Exclude the current instance being validated
-
-            # if same_department_assignments.exists():
-            #     existing_role = same_department_assignments.first().role
-            #     department_name = self.schedule.department.name if self.schedule.department else "Unknown Department"
-
-            #     raise ValidationError(
-            #         f"{self.person.name} is already assigned to the role '{existing_role}' in the '{department_name}' department "
-            #         f"on {self.schedule.date}. A teacher can only have one role per department per day."
-            #     )
+        if self.validated_in_batch:
+            return
+        # The rules are implemented by RoleAssignmentValidator, which loads the schedules and role assignments
+        # of the day with a single query.
+        from .assignments import RoleAssignmentValidator
+        RoleAssignmentValidator([self.schedule.date]).validate(self)
 
     def save(self, *args, **kwargs):
         """
@@ -222,3 +222,55 @@ class RoleAssignment(models.Model):
 
     def __str__(self):
         return f"{self.role} - {self.person.name if self.person else 'Unassigned'} for {self.schedule}"
+
+
+# TeacherWorkload Model
+class TeacherWorkload(models.Model):
+    """
+    How many times, and for how many minutes in total, a teacher served a role in a department during a month.
+    Maintained from the role assignments by schedule/workloads.py rather than edited.
+    """
+    person = models.ForeignKey(Teacher, on_delete=models.CASCADE, related_name='workloads')
+    month = models.DateField()  # The first day of the month
+    role = models.ForeignKey(ClassRole, on_delete=models.CASCADE)
+    department = models.ForeignKey(Department, on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=0)
+    minutes = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.person} - {self.month:%Y-%m} - {self.department} - {self.role}: {self.count}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['person', 'month', 'role', 'department'],
+                name='unique_teacher_workload_constraint'
+            )
+        ]
+        indexes = [
+            # The workload reports read every teacher over a range of months.
+            models.Index(fields=['month'], name='teacherworkload_month_idx'),
+        ]
+
+
+# SlowQuery Model
+class SlowQuery(models.Model):
+    """
+    A query of the schedule app slower than the threshold, logged by schedule/slow_queries.py.
+    """
+    created = models.DateTimeField(auto_now_add=True)
+    duration = models.FloatField()  # In milliseconds
+    sql = models.TextField()
+    params = models.TextField(blank=True)
+    origin = models.CharField(max_length=300, blank=True)  # The innermost function of the schedule app
+    view_name = models.CharField(max_length=200, blank=True)
+    explain = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.duration:.0f} ms - {self.origin}"
+
+    class Meta:
+        verbose_name_plural = "Slow queries"
+        indexes = [
+            models.Index(fields=['-duration'], name='slowquery_duration_idx'),
+        ]
@@ -0,0 +1,164 @@
+"""
+On-demand profiling of single requests, for staff users.
+
+Adding ?_profile=1 to the URL of any page runs its view under cProfile; ?_profile=1&_profile_sql=1 also
+records every SQL statement with its duration. The page is served as usual, and the profile is stored in
+the shared cache for PROFILE_TIMEOUT seconds under a random ID generated by the server (never one sent by the
+client, which could overwrite the profile of another request), which the response carries in its X-Profile-Id
+header. The recent profiles are listed at /profiles/, each with a report of the top functions by cumulative time and a .prof download
+readable by pstats, snakeviz and the like.
+"""
+import cProfile
+import marshal
+import pstats
+import time
+import uuid
+from contextlib import ExitStack
+from io import StringIO
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.shortcuts import render
+from django.urls import reverse
+from django.utils import timezone
+
+PROFILE_TIMEOUT = 60 * 60 * 24
+# How many profiles /profiles/ lists.
+RECENT_PROFILES = 50
+PROFILE_REPORT_LIMIT = 40
+
+RECENT_PROFILES_KEY = 'schedule:profiles'
+
+
+def _profile_key(profile_id):
+    return f'schedule:profile:{profile_id}'
+
+
+class _StoredStats:
+    """
+    Stands in for a Profile object when loading stored stats with pstats.Stats().
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class QueryRecorder:
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({'sql': sql, 'params': repr(params),
+                                 'duration': (time.perf_counter() - start) * 1000})
+
+
+class ProfilerMiddleware:
+    """
+    Profiles the requests of staff users asking for it with ?_profile=1. Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.GET.get('_profile') != '1' or not request.user.is_staff:
+            return self.get_response(request)
+
+        profile_id = uuid.uuid4().hex
+        recorder = QueryRecorder() if request.GET.get('_profile_sql') == '1' else None
+        profiler = cProfile.Profile()
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            if recorder is not None:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is already running in this thread.
+                return self.get_response(request)
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = (time.perf_counter() - start) * 1000
+
+        profiler.create_stats()
+        cache.set(_profile_key(profile_id), {
+            'id': profile_id,
+            'path': request.get_full_path(),
+            'created': timezone.now(),
+            'duration': duration,
+            'stats': marshal.dumps(profiler.stats),
+            'queries': recorder.queries if recorder is not None else None,
+        }, timeout=PROFILE_TIMEOUT)
+        recent = [profile_id] + cache.get(RECENT_PROFILES_KEY, [])
+        cache.set(RECENT_PROFILES_KEY, recent[:RECENT_PROFILES], timeout=PROFILE_TIMEOUT)
+
+        response['X-Profile-Id'] = profile_id
+        response['X-Profile-Url'] = reverse('profile_report', kwargs={'profile_id': profile_id})
+        return response
+
+
+def get_profile(profile_id):
+    profile = cache.get(_profile_key(profile_id))
+    if profile is None:
+        raise Http404("No profile matches the given id; it may have expired.")
+    return profile
+
+
+def profile_report(profile, sort='cumulative', limit=PROFILE_REPORT_LIMIT):
+    """
+    Returns the pstats report of the top functions of a stored profile.
+    """
+    stream = StringIO()
+    stats = pstats.Stats(_StoredStats(marshal.loads(profile['stats'])), stream=stream)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+@staff_member_required
+def profile_list_view(request):
+    profiles = [profile for profile in cache.get_many(
+        [_profile_key(profile_id) for profile_id in cache.get(RECENT_PROFILES_KEY, [])]
+    ).values()]
+    profiles.sort(key=lambda profile: profile['created'], reverse=True)
+    return render(request, 'schedule/profiles.html', {'profiles': profiles})
+
+
+@staff_member_required
+def profile_report_view(request, profile_id):
+    profile = get_profile(profile_id)
+    sort = request.GET.get('sort', 'cumulative')
+    if sort not in ('cumulative', 'tottime', 'calls'):
+        sort = 'cumulative'
+    try:
+        limit = max(1, int(request.GET.get('limit', PROFILE_REPORT_LIMIT)))
+    except ValueError:
+        limit = PROFILE_REPORT_LIMIT
+
+    queries = profile['queries']
+    return render(request, 'schedule/profile.html', {
+        'profile': profile,
+        'report': profile_report(profile, sort, limit),
+        'queries': sorted(queries, key=lambda query: -query['duration']) if queries is not None else None,
+        'query_time': sum(query['duration'] for query in queries) if queries else 0,
+    })
+
+
+@staff_member_required
+def profile_download_view(request, profile_id):
+    profile = get_profile(profile_id)
+    response = HttpResponse(profile['stats'], content_type='application/octet-stream')
+    response['Content-Disposition'] = f'attachment; filename="profile-{profile_id}.prof"'
+    return response
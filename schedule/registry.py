@@ -0,0 +1,116 @@
+"""
+In-process registry of the small dimension tables: departments, class roles, hymn types and positions.
+
+Queries can filter by the integer foreign keys looked up here instead of joining these tables by name,
+and the dropdowns are built from memory. Every process keeps its own copy, loaded when the WSGI/ASGI
+application starts (see warm_registry()) and loaded again once the version in the shared cache changes;
+the signal handlers in schedule.signals change it whenever a row of these tables is saved or deleted.
+"""
+import logging
+import uuid
+from django.core.cache import cache
+from django.db import DatabaseError
+from .models import Department, ClassRole, HymnType, Position
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_VERSION_KEY = 'schedule:registry:version'
+
+DIMENSIONS = [Department, ClassRole, HymnType, Position]
+
+
+class Registry:
+    """
+    A snapshot of the dimension tables. Its objects are shared by every request and must not be modified.
+    """
+
+    def __init__(self, version, objects):
+        """
+        :param version: The version of the shared cache this snapshot was loaded at
+        :param objects: A list of objects per model, ordered by id
+        """
+        self.version = version
+        self._objects = objects
+        self._ids = {model: {obj.name: obj.id for obj in model_objects} for model, model_objects in objects.items()}
+
+    def objects(self, model, names=None):
+        """
+        Returns the objects of the given model ordered by id, optionally only those with the given names.
+        """
+        if names is None:
+            return self._objects[model]
+        names = set(names)
+        return [obj for obj in self._objects[model] if obj.name in names]
+
+    def id(self, model, name):
+        """
+        Returns the id of the object of the given model with the given name, or None.
+        """
+        return self._ids[model].get(name)
+
+    def ids(self, model, names):
+        """
+        Returns the ids of the objects of the given model with the given names, skipping unknown names.
+        """
+        ids = self._ids[model]
+        return [ids[name] for name in names if name in ids]
+
+
+_registry = Registry(None, {model: [] for model in DIMENSIONS})
+
+
+def get_shared_version(key):
+    """
+    Returns the version stored under the given key of the shared cache, creating it if missing.
+    Processes compare it with the version of their own copy of some data to know when to load it again.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_shared_version(key):
+    """
+    Changes the version stored under the given key of the shared cache.
+    """
+    cache.set(key, uuid.uuid4().hex, timeout=None)
+
+
+def get_registry():
+    """
+    Returns the registry of the current version, loading the dimension tables again (one query each)
+    if they changed since this process last loaded them.
+    """
+    global _registry
+
+    version = get_shared_version(REGISTRY_VERSION_KEY)
+    registry = _registry
+    if version is None or version != registry.version:
+        registry = Registry(version, {model: list(model.objects.order_by('id')) for model in DIMENSIONS})
+        _registry = registry
+    return registry
+
+
+def warm_registry():
+    """
+    Loads the registry ahead of the first request of a server process, so that no request pays for it.
+    Called from the WSGI and ASGI modules rather than AppConfig.ready(), where Django warns against queries
+    and which every management command runs, migrate included.
+    """
+    try:
+        get_registry()
+    except DatabaseError:
+        # E.g. the tables do not exist yet; the first request loads the registry instead.
+        logger.warning("Could not warm the registry of the dimension tables.", exc_info=True)
+
+
+def invalidate_registry():
+    """
+    Makes every process load the dimension tables again on its next lookup.
+    """
+    global _registry
+
+    _registry = Registry(None, {model: [] for model in DIMENSIONS})
+    bump_shared_version(REGISTRY_VERSION_KEY)
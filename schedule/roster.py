@@ -0,0 +1,191 @@
+"""
+Automatic rostering: proposes a teacher for every open role of the schedules within a date window.
+
+A role is open when the department sheet shows it for the class type of a schedule (see
+schedule.views.get_required_roles()) and the schedule has no assignment for it yet. A teacher can fill it when
+they are active (擔任中 or 新任), belong to the department of the schedule or to no department, hold one of
+the positions configured for the role (if any), and are not busy at that time, whether with a saved assignment
+or with one proposed earlier.
+
+Days are filled one after another, since the overlap rule never spans two dates. Within a day, the roles with
+the fewest candidates go first, and each one goes to the free candidate with the lightest load so far (the
+existing assignments of the window included), which spreads the work evenly. When no candidate is free, the
+solver backtracks one step: a candidate busy with a single proposed role hands it over to another free
+teacher, if there is one, and takes the open role instead. Roles left open are reported rather than forced.
+
+Everything is read with three queries (the schedules, the saved assignments and the loads), and nothing is
+saved; the proposal is committed with schedule.assignments.create_role_assignments().
+"""
+from collections import Counter, defaultdict, namedtuple
+from itertools import groupby
+from django.conf import settings
+from django.db.models import Count
+from .models import ClassRole, Position, RoleAssignment, Schedule
+from .assignments import RoleAssignmentValidator
+from .registry import get_registry
+from .teachers import get_teacher_index
+
+# The statuses of the teachers who can be rostered.
+ELIGIBLE_STATUSES = ('擔任中', '新任')
+
+# Restricts some roles to the teachers of some positions, e.g. {'司琴': ['司琴']}. Roles not listed are open to all.
+ROLE_POSITIONS = getattr(settings, 'SCHEDULE_ROSTER_ROLE_POSITIONS', {})
+
+# A role of a schedule without any assignment.
+OpenSlot = namedtuple('OpenSlot', ['schedule', 'role'])
+
+# A teacher (a schedule.teachers.TeacherEntry) proposed for the role of a schedule.
+ProposedAssignment = namedtuple('ProposedAssignment', ['schedule', 'role', 'teacher'])
+
+Roster = namedtuple('Roster', ['assignments', 'unfilled', 'loads'])
+
+
+def _overlaps(schedule, other):
+    return schedule.start_time < other.end_time and other.start_time < schedule.end_time
+
+
+class _Day:
+    """
+    The proposals of a single date, filled by fill().
+    """
+
+    def __init__(self, slots, candidates, validator, loads):
+        """
+        :param slots: The OpenSlots of the date
+        :param candidates: The list of the eligible TeacherEntries of every slot
+        :param validator: A RoleAssignmentValidator indexing the date
+        :param loads: A Counter of the assignments per teacher id, updated along with the proposals
+        """
+        self.slots = slots
+        self.candidates = candidates
+        self.validator = validator
+        self.loads = loads
+        self.chosen = {}  # slot index -> TeacherEntry
+        self.busy = defaultdict(list)  # teacher id -> indexes of the slots proposed to them
+
+    def is_busy(self, teacher, index):
+        """
+        Returns whether the given teacher has a saved assignment overlapping the given slot.
+        """
+        schedule = self.slots[index].schedule
+        return self.validator.find_overlap(
+            teacher.id, schedule.date, schedule.start_time, schedule.end_time
+        ) is not None
+
+    def conflicts(self, teacher, index):
+        """
+        Returns the indexes of the slots proposed to the given teacher which overlap the given slot.
+        """
+        schedule = self.slots[index].schedule
+        return [other for other in self.busy[teacher.id] if _overlaps(self.slots[other].schedule, schedule)]
+
+    def pick(self, index, exclude_id=None):
+        """
+        Returns the least loaded candidate free for the given slot, or None.
+        """
+        free = [
+            teacher for teacher in self.candidates[index]
+            if teacher.id != exclude_id and not self.conflicts(teacher, index) and not self.is_busy(teacher, index)
+        ]
+        return min(free, key=lambda teacher: (self.loads[teacher.id], teacher.id), default=None)
+
+    def assign(self, index, teacher):
+        self.chosen[index] = teacher
+        self.busy[teacher.id].append(index)
+        self.loads[teacher.id] += 1
+
+    def unassign(self, index):
+        teacher = self.chosen.pop(index)
+        self.busy[teacher.id].remove(index)
+        self.loads[teacher.id] -= 1
+        return teacher
+
+    def swap(self, index):
+        """
+        Frees a candidate of the given slot by handing their only conflicting proposal over to another teacher.
+        Returns the freed candidate, or None.
+        """
+        for teacher in sorted(self.candidates[index], key=lambda teacher: (self.loads[teacher.id], teacher.id)):
+            conflicts = self.conflicts(teacher, index)
+            if len(conflicts) != 1 or self.is_busy(teacher, index):
+                continue
+            other = conflicts[0]
+            self.unassign(other)
+            replacement = self.pick(other, exclude_id=teacher.id)
+            if replacement is not None:
+                self.assign(other, replacement)
+                return teacher
+            self.assign(other, teacher)
+        return None
+
+    def fill(self):
+        order = sorted(range(len(self.slots)),
+                       key=lambda index: (len(self.candidates[index]), self.slots[index].schedule.start_time, index))
+        for index in order:
+            teacher = self.pick(index) or self.swap(index)
+            if teacher is not None:
+                self.assign(index, teacher)
+        return self.chosen
+
+
+def find_open_slots(schedules, required_roles, validator, registry):
+    """
+    Returns an OpenSlot per required role of the given schedules which is not assigned yet.
+
+    :param required_roles: A {(department name, class_type): [role names]} dictionary
+    """
+    roles = {role.name: role for role in registry.objects(ClassRole)}
+    return [
+        OpenSlot(schedule, roles[role_name])
+        for schedule in schedules
+        for role_name in required_roles.get((schedule.department.name, schedule.class_type), [])
+        if role_name in roles and not validator.has_role(schedule.id, roles[role_name].id)
+    ]
+
+
+def solve_roster(date_from, date_to, required_roles, role_positions=None):
+    """
+    Proposes a teacher for every open role of the schedules within the given window, without saving anything.
+
+    :param required_roles: A {(department name, class_type): [role names]} dictionary
+    :param role_positions: A {role name: [position names]} dictionary, ROLE_POSITIONS by default
+    :return: A Roster of the ProposedAssignments and the OpenSlots nobody could fill, both ordered by date,
+             and a Counter of the assignments per teacher id over the window once the proposal is committed
+    """
+    registry = get_registry()
+    role_positions = ROLE_POSITIONS if role_positions is None else role_positions
+    position_ids = {role_name: set(registry.ids(Position, names)) for role_name, names in role_positions.items()}
+
+    schedules = list(Schedule.objects.filter(date__range=(date_from, date_to)).select_related(
+        'department'
+    ).order_by('date', 'start_time', 'id'))
+    validator = RoleAssignmentValidator({schedule.date for schedule in schedules})
+    loads = Counter(dict(RoleAssignment.objects.filter(
+        schedule__date__range=(date_from, date_to), person__isnull=False
+    ).order_by().values('person_id').annotate(count=Count('id')).values_list('person_id', 'count')))
+
+    # Teachers without a department can be rostered in every department.
+    teachers = defaultdict(list)
+    for teacher in get_teacher_index().entries.values():
+        if teacher.status in ELIGIBLE_STATUSES:
+            teachers[teacher.department_id].append(teacher)
+
+    def candidates(slot):
+        allowed = position_ids.get(slot.role.name)
+        return [
+            teacher for teacher in teachers[slot.schedule.department_id] + teachers[None]
+            if allowed is None or teacher.position_id in allowed
+        ]
+
+    assignments, unfilled = [], []
+    open_slots = find_open_slots(schedules, required_roles, validator, registry)
+    for date, day_slots in groupby(open_slots, key=lambda slot: slot.schedule.date):
+        day_slots = list(day_slots)
+        chosen = _Day(day_slots, [candidates(slot) for slot in day_slots], validator, loads).fill()
+        for index, slot in enumerate(day_slots):
+            if index in chosen:
+                assignments.append(ProposedAssignment(slot.schedule, slot.role, chosen[index]))
+            else:
+                unfilled.append(slot)
+
+    return Roster(assignments, unfilled, loads)
@@ -0,0 +1,96 @@
+from collections import namedtuple
+from django.db.models import Max, Q
+from .models import Schedule, Department, ClassRole
+from .registry import get_registry
+
+# A single column of a department sheet.
+#   name:        key of the column in each row handed to the template
+#   class_types: the Schedule.class_type values the column reads from
+#   field:       the field to read, relative to Schedule
+#   role_name:   when set, only RoleAssignments with this ClassRole name are read
+SheetColumn = namedtuple('SheetColumn', ['name', 'class_types', 'field', 'role_name'])
+
+
+def _as_list(class_types):
+    return list(class_types) if isinstance(class_types, (list, tuple)) else [class_types]
+
+
+def schedule_column(name, class_types, field='topic'):
+    """
+    Declares a column read from the Schedule itself (e.g. the worship topic or hymn number).
+
+    :param name: The key of the column in the resulting rows (e.g. 'worship_topic')
+    :param class_types: A single class type or a list of class types (e.g. WORSHIP_CLASS or ['詩頌', '共習'])
+    :param field: The Schedule field to read (default: 'topic')
+    """
+    return SheetColumn(name, _as_list(class_types), field, None)
+
+
+def role_column(name, class_types, role_name, field='person__name'):
+    """
+    Declares a column read from the RoleAssignments of a schedule
+    (e.g. "worship teacher = role 講師 on class_type 崇拜").
+
+    :param name: The key of the column in the resulting rows (e.g. 'worship_teacher')
+    :param class_types: A single class type or a list of class types (e.g. WORSHIP_CLASS or ['詩頌', '共習'])
+    :param role_name: The name of the ClassRole to read (e.g. '講師', '司琴', etc.)
+    :param field: The RoleAssignment field to read (default: 'person__name')
+    """
+    return SheetColumn(name, _as_list(class_types), f'role_assignments__{field}', role_name)
+
+
+def compile_columns(columns, registry):
+    """
+    Compiles sheet columns into conditional aggregates over a date-grouped Schedule queryset.
+
+    The aggregates are keyed by position rather than by column name so that column names
+    may freely clash with Schedule fields ('topic', 'class_type', 'hymn_number', ...).
+
+    :param registry: The Registry mapping the role names of the columns to ids
+    """
+    aggregates = {}
+    for index, column in enumerate(columns):
+        condition = Q(class_type__in=column.class_types)
+        if column.role_name is not None:
+            # Filtering by id spares the join with ClassRole; an unknown role matches nothing.
+            condition &= Q(role_assignments__role_id=registry.id(ClassRole, column.role_name))
+        aggregates[f'column_{index}'] = Max(column.field, filter=condition)
+    return aggregates
+
+
+def build_sheet(department_name, columns, date_from=None, date_to=None):
+    """
+    Builds the rows of a department sheet in a single query.
+
+    Every row holds the 'date' plus one key per column; missing values are returned as
+    empty strings so that the templates can render them directly.
+
+    :param department_name: The name of the department to filter (e.g. KINDERGARTEN)
+    :param columns: A list of columns declared with schedule_column() / role_column()
+    :param date_from: Optional first date (inclusive) of the sheet
+    :param date_to: Optional last date (inclusive) of the sheet
+    :return: A list of dictionaries ordered by date
+    """
+    class_types = sorted({class_type for column in columns for class_type in column.class_types})
+    registry = get_registry()
+    schedules = Schedule.objects.filter(
+        department_id=registry.id(Department, department_name), class_type__in=class_types
+    )
+
+    if date_from is not None:
+        schedules = schedules.filter(date__gte=date_from)
+    if date_to is not None:
+        schedules = schedules.filter(date__lte=date_to)
+
+    rows = schedules.values('date').annotate(**compile_columns(columns, registry)).order_by('date')
+
+    return [
+        {
+            'date': row['date'],
+            **{
+                column.name: '' if row[f'column_{index}'] is None else row[f'column_{index}']
+                for index, column in enumerate(columns)
+            },
+        }
+        for row in rows
+    ]
@@ -0,0 +1,165 @@
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from .models import Department, Schedule, RoleAssignment, Teacher, ClassRole, HymnType, Position
+from .fragments import invalidate_slots, invalidate_pages, invalidate_all
+from .registry import get_registry, invalidate_registry
+from .teachers import invalidate_teacher_index
+from .workloads import assignment_cells, month_of, refresh_workloads
+
+
+def _schedule_slots(schedules):
+    return schedules.values_list('department__name', 'class_type', 'date').distinct()
+
+
+def _invalidate_slots_on_commit(slots):
+    """
+    Invalidates the given slots once the current transaction commits, so that no request can cache the rows
+    as they were before under the new generation stamps.
+    """
+    # The slots are read right away, while the changed rows can still be found.
+    slots = list(slots)
+    transaction.on_commit(lambda: invalidate_slots(slots))
+
+
+@receiver(post_init, sender=Schedule)
+def remember_schedule_slot(sender, instance, **kwargs):
+    """
+    Remembers where a schedule was loaded from, so that moving it invalidates its old slot as well.
+    """
+    # Read through __dict__ so that deferred fields are not loaded one query per instance.
+    fields = instance.__dict__
+    instance._fragment_origin = (fields.get('department_id'), fields.get('class_type'), fields.get('date'))
+    instance._workload_origin = (fields.get('department_id'), fields.get('date'), fields.get('start_time'),
+                                 fields.get('end_time'))
+
+
+@receiver(post_init, sender=RoleAssignment)
+def remember_role_assignment_schedule(sender, instance, **kwargs):
+    instance._fragment_origin = instance.__dict__.get('schedule_id')
+    instance._workload_origin = (instance.__dict__.get('schedule_id'), instance.__dict__.get('person_id'))
+
+
+@receiver(post_save, sender=Schedule)
+@receiver(post_delete, sender=Schedule)
+def invalidate_schedule(sender, instance, **kwargs):
+    slots = {(instance.department_id, instance.class_type, instance.date), instance._fragment_origin}
+    department_names = {department.id: department.name for department in get_registry().objects(Department)}
+    # A department created in the same transaction only reaches the registry once it commits.
+    unknown_ids = {department_id for department_id, _, _ in slots} - department_names.keys() - {None}
+    if unknown_ids:
+        department_names.update(Department.objects.filter(id__in=unknown_ids).values_list('id', 'name'))
+
+    _invalidate_slots_on_commit(
+        (department_names[department_id], class_type, day)
+        for department_id, class_type, day in slots
+        if department_id in department_names and day is not None
+    )
+
+
+@receiver(post_save, sender=RoleAssignment)
+@receiver(post_delete, sender=RoleAssignment)
+def invalidate_role_assignment(sender, instance, **kwargs):
+    schedule_ids = {instance.schedule_id, instance._fragment_origin} - {None}
+    _invalidate_slots_on_commit(_schedule_slots(Schedule.objects.filter(id__in=schedule_ids)))
+
+
+@receiver(post_save, sender=Teacher)
+def invalidate_teacher(sender, instance, created, **kwargs):
+    if not created:
+        _invalidate_slots_on_commit(_schedule_slots(Schedule.objects.filter(role_assignments__person=instance)))
+
+
+@receiver(post_save, sender=ClassRole)
+def invalidate_class_role(sender, instance, created, **kwargs):
+    if not created:
+        _invalidate_slots_on_commit(_schedule_slots(Schedule.objects.filter(role_assignments__role=instance)))
+
+
+@receiver(post_save, sender=HymnType)
+def invalidate_hymn_type(sender, instance, created, **kwargs):
+    if not created:
+        _invalidate_slots_on_commit(_schedule_slots(Schedule.objects.filter(hymn_type=instance)))
+
+
+@receiver(post_save, sender=ClassRole)
+@receiver(post_save, sender=HymnType)
+@receiver(post_delete, sender=ClassRole)
+def invalidate_dropdowns(sender, instance, **kwargs):
+    """
+    Roles and hymn types are listed in the assign-role dropdowns of every page
+    (teachers are searched with the autocomplete instead).
+    """
+    transaction.on_commit(invalidate_pages)
+
+
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+@receiver(post_save, sender=ClassRole)
+@receiver(post_delete, sender=ClassRole)
+@receiver(post_save, sender=HymnType)
+@receiver(post_delete, sender=HymnType)
+@receiver(post_save, sender=Position)
+@receiver(post_delete, sender=Position)
+def invalidate_dimensions(sender, instance, **kwargs):
+    """
+    The dimension tables are cached by schedule.registry, and the departments are listed in the navigation
+    of every page.
+    """
+    # Once committed, so that no process reloads the registry from the rows as they were before.
+    transaction.on_commit(invalidate_registry)
+    if sender is Department:
+        transaction.on_commit(invalidate_pages)
+
+
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+def invalidate_teachers(sender, instance, **kwargs):
+    # Once committed, so that no process rebuilds the index from the teachers as they were before.
+    transaction.on_commit(invalidate_teacher_index)
+
+
+@receiver(post_delete, sender=Teacher)
+@receiver(post_delete, sender=HymnType)
+def invalidate_detached_rows(sender, instance, **kwargs):
+    """
+    Deleting a teacher or hymn type nulls the references to it without sending any signal,
+    so the affected schedules can no longer be found; every cached table is invalidated instead.
+    """
+    transaction.on_commit(invalidate_all)
+
+
+@receiver(post_save, sender=RoleAssignment)
+def refresh_role_assignment_workloads(sender, instance, **kwargs):
+    """
+    Refreshes the workloads of the teacher and month the assignment was loaded with, as well as the current ones.
+    """
+    current = (instance.schedule_id, instance.person_id)
+    refresh_workloads(assignment_cells({instance._workload_origin, current}))
+    instance._workload_origin = current
+
+
+@receiver(pre_delete, sender=RoleAssignment)
+def remember_deleted_role_assignment_workloads(sender, instance, **kwargs):
+    # The schedule may be deleted along with the assignment, so its date is read before anything is deleted.
+    instance._workload_cells = assignment_cells({(instance.schedule_id, instance.person_id)})
+
+
+@receiver(post_delete, sender=RoleAssignment)
+def refresh_deleted_role_assignment_workloads(sender, instance, **kwargs):
+    refresh_workloads(instance._workload_cells)
+
+
+@receiver(post_save, sender=Schedule)
+def refresh_schedule_workloads(sender, instance, created, **kwargs):
+    """
+    Moving a schedule to another date, department or time changes the workloads of all its teachers.
+    """
+    current = (instance.department_id, instance.date, instance.start_time, instance.end_time)
+    origin, instance._workload_origin = instance._workload_origin, current
+    if created or origin == current:
+        return
+
+    person_ids = set(instance.role_assignments.exclude(person=None).values_list('person_id', flat=True))
+    months = {month_of(day) for day in (origin[1], instance.date) if day is not None}
+    refresh_workloads({(person_id, month) for person_id in person_ids for month in months})
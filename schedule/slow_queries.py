@@ -0,0 +1,153 @@
+"""
+Slow-query log: every query of the schedule app taking longer than the SCHEDULE_SLOW_QUERY_THRESHOLD setting
+(in milliseconds) is logged with the 'schedule.slow_queries' logger and saved as a SlowQuery, listed in the
+admin slowest first.
+
+SlowQueryMiddleware watches the queries of every database connection for the duration of each request, with
+connection.execute_wrapper() like the other middlewares measuring queries; commands and shells can do the same
+with slow_query_log(). A query belongs to the schedule app when it touches one of its tables or is run from its code.
+Each entry records the SQL and parameters, the innermost function of the schedule app on the call stack
+(e.g. 'schedule.models:RoleAssignment.clean'), the view of the current request and, for SELECT queries, the
+plan from EXPLAIN run on the same connection right after the query.
+
+The entry is saved in the current transaction, so a query logged from a transaction rolled back afterwards
+is only kept in the log output.
+"""
+import logging
+import sys
+import time
+from contextlib import ExitStack, contextmanager, nullcontext
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# In milliseconds; 0 disables the log. Read on every slow query, so it can be overridden at run time.
+DEFAULT_SLOW_QUERY_THRESHOLD = 500
+
+SCHEDULE_TABLE_PREFIX = 'schedule_'
+# The queries reading the log itself are never logged.
+SLOW_QUERY_TABLE = 'schedule_slowquery'
+
+# Modules whose frames are not reported as the origin of a query.
+_INSTRUMENTATION = {'schedule.slow_queries', 'schedule.metrics', 'schedule.profiling'}
+
+_current_view = ContextVar('schedule_slow_query_view', default='')
+# Set while logging, so that the EXPLAIN and INSERT queries are not watched themselves.
+_logging = ContextVar('schedule_slow_query_logging', default=False)
+
+
+def get_threshold():
+    return getattr(settings, 'SCHEDULE_SLOW_QUERY_THRESHOLD', DEFAULT_SLOW_QUERY_THRESHOLD)
+
+
+def find_origin():
+    """
+    Returns the innermost function of the schedule app on the call stack, as 'module:qualified name'.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module.startswith('schedule.') and module not in _INSTRUMENTATION:
+            return f"{module}:{frame.f_code.co_qualname}"
+        frame = frame.f_back
+    return ''
+
+
+def _isolated(connection):
+    """
+    Returns a context isolating a statement from the current transaction when a failure would abort it
+    (PostgreSQL). SQLite cannot open a savepoint while the statement being logged is still read.
+    """
+    if connection.vendor == 'postgresql' and connection.in_atomic_block:
+        return transaction.atomic(using=connection.alias)
+    return nullcontext()
+
+
+def explain(connection, sql, params):
+    """
+    Returns the plan of the given SELECT query, or '' if it cannot be explained.
+    """
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return ''
+    try:
+        # A failing EXPLAIN must not break the transaction of the query.
+        with _isolated(connection), connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+            return '\n'.join(' '.join(str(value) for value in row) for row in cursor.fetchall())
+    except DatabaseError:
+        return ''
+
+
+def log_slow_query(connection, sql, params, duration, origin):
+    from .models import SlowQuery
+
+    view_name = _current_view.get()
+    plan = explain(connection, sql, params)
+    logger.warning("Slow query (%.1f ms) from %s in %s: %s", duration, origin or '?', view_name or '-', sql)
+    try:
+        with _isolated(connection):
+            SlowQuery.objects.using(connection.alias).create(
+                duration=duration, sql=sql, params=repr(params), origin=origin[:300], view_name=view_name[:200],
+                explain=plan
+            )
+    except DatabaseError:
+        # E.g. the table does not exist yet while migrating.
+        logger.exception("Could not save the slow query.")
+
+
+def watch_queries(connection):
+    def wrapper(execute, sql, params, many, context):
+        if _logging.get():
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = (time.perf_counter() - start) * 1000
+
+        threshold = get_threshold()
+        if threshold and duration >= threshold:
+            origin = find_origin()
+            if (origin or SCHEDULE_TABLE_PREFIX in sql) and SLOW_QUERY_TABLE not in sql:
+                token = _logging.set(True)
+                try:
+                    log_slow_query(connection, sql, None if many else params, duration, origin)
+                finally:
+                    _logging.reset(token)
+        return result
+
+    return wrapper
+
+
+@contextmanager
+def slow_query_log():
+    """
+    Watches the queries of every database connection within the block.
+    """
+    # The wrappers belong to the connection objects, which outlive a closed and reopened connection.
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(watch_queries(connection)))
+        yield
+
+
+class SlowQueryMiddleware:
+    """
+    Watches the queries of the request and records its view for the slow-query log.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _current_view.set('')
+        try:
+            with slow_query_log():
+                return self.get_response(request)
+        finally:
+            _current_view.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.resolver_match:
+            _current_view.set(request.resolver_match.view_name)
@@ -0,0 +1,83 @@
+// teacher_autocomplete.js
+// Fills the datalist of the teacher search box as you type, and copies the id of the chosen teacher
+// into the hidden input named by its data-target attribute.
+// Teachers busy during the schedule chosen in the data-schedule select are labelled and cannot be chosen.
+
+document.querySelectorAll("input[data-autocomplete-url]").forEach(function (input) {
+    const options = document.getElementById(input.getAttribute("list"));
+    const target = document.getElementById(input.dataset.target);
+    const scheduleSelect = document.getElementById(input.dataset.schedule);
+    let timer = null;
+    let controller = null;
+    let busy = {};
+
+    function selectTeacher() {
+        const option = Array.from(options.options).find((option) => option.value === input.value);
+        target.value = option ? option.dataset.id : "";
+        if (!option) {
+            input.setCustomValidity("請從清單中選擇教員");
+        } else if (busy[option.dataset.id]) {
+            input.setCustomValidity(option.label);
+        } else {
+            input.setCustomValidity("");
+        }
+    }
+
+    function loadAvailability() {
+        busy = {};
+        if (!scheduleSelect || !scheduleSelect.value || !input.dataset.availabilityUrl) {
+            return;
+        }
+        fetch(input.dataset.availabilityUrl.replace("/0/", `/${scheduleSelect.value}/`))
+            .then((response) => response.json())
+            .then(function (data) {
+                data.busy.forEach(function (teacher) {
+                    busy[teacher.id] = teacher;
+                });
+                search();
+            })
+            .catch((error) => console.error(error));
+    }
+
+    function search() {
+        if (controller) {
+            controller.abort();
+        }
+        controller = new AbortController();
+
+        const url = new URL(input.dataset.autocompleteUrl, window.location.origin);
+        url.searchParams.set("q", input.value);
+        fetch(url, { signal: controller.signal })
+            .then((response) => response.json())
+            .then(function (data) {
+                options.replaceChildren(...data.results.map(function (teacher) {
+                    const option = document.createElement("option");
+                    option.value = teacher.name;
+                    option.dataset.id = teacher.id;
+                    const conflict = busy[teacher.id];
+                    if (conflict) {
+                        option.label = `忙碌：${conflict.department} ${conflict.role} ` +
+                            `${conflict.start_time.slice(0, 5)}-${conflict.end_time.slice(0, 5)}`;
+                    }
+                    return option;
+                }));
+                selectTeacher();
+            })
+            .catch(function (error) {
+                if (error.name !== "AbortError") {
+                    console.error(error);
+                }
+            });
+    }
+
+    input.addEventListener("input", function () {
+        selectTeacher();
+        clearTimeout(timer);
+        timer = setTimeout(search, 200);
+    });
+    input.addEventListener("focus", search, { once: true });
+    if (scheduleSelect) {
+        scheduleSelect.addEventListener("change", loadAvailability);
+        loadAvailability();
+    }
+});
@@ -0,0 +1,92 @@
+"""
+In-memory search index over the teacher names, for the assign-role autocomplete.
+
+Names are matched by prefix or substring after NFKC normalization and case folding, so that full-width
+and half-width characters match each other. Since CJK names have no word boundaries, the index maps every
+character to the teachers whose name contains it; a query only scans the teachers holding all of its characters.
+
+Every process keeps its own index, built on first use and built again once the version in the shared cache
+changes; the signal handlers in schedule.signals change it whenever a teacher is saved or deleted.
+"""
+import unicodedata
+from collections import namedtuple
+from .models import Teacher
+from .registry import get_shared_version, bump_shared_version
+
+TEACHER_INDEX_VERSION_KEY = 'schedule:teachers:version'
+
+TeacherEntry = namedtuple('TeacherEntry', ['id', 'name', 'key', 'department_id', 'position_id', 'status'])
+
+
+def normalize_name(name):
+    """
+    Returns the form of a name used for matching: NFKC-normalized, case-folded and without spaces.
+    """
+    return ''.join(unicodedata.normalize('NFKC', name).casefold().split())
+
+
+class TeacherIndex:
+
+    def __init__(self, version, teachers):
+        """
+        :param version: The version of the shared cache this index was built at
+        :param teachers: (id, name, department_id, position_id, status) tuples
+        """
+        self.version = version
+        self.entries = {}
+        self.postings = {}  # character -> ids of the teachers whose name contains it
+        for teacher_id, name, department_id, position_id, status in teachers:
+            key = normalize_name(name)
+            self.entries[teacher_id] = TeacherEntry(teacher_id, name, key, department_id, position_id, status)
+            for character in set(key):
+                self.postings.setdefault(character, set()).add(teacher_id)
+
+    def search(self, query, department_id=None, position_id=None, status=None, limit=20):
+        """
+        Returns up to limit (all if None) TeacherEntries whose name contains the query, the names starting
+        with it first.
+        An empty query matches every teacher.
+        """
+        query = normalize_name(query)
+        if query:
+            candidate_ids = set.intersection(*(self.postings.get(character, set()) for character in set(query)))
+        else:
+            candidate_ids = self.entries.keys()
+
+        matches = [
+            entry for entry in (self.entries[teacher_id] for teacher_id in candidate_ids)
+            if query in entry.key
+            and (department_id is None or entry.department_id == department_id)
+            and (position_id is None or entry.position_id == position_id)
+            and (status is None or entry.status == status)
+        ]
+        matches.sort(key=lambda entry: (not entry.key.startswith(query), entry.key, entry.id))
+        return matches[:limit]
+
+
+_teacher_index = TeacherIndex(None, [])
+
+
+def get_teacher_index():
+    """
+    Returns the teacher index of the current version, building it again (one query) if a teacher changed
+    since this process last built it.
+    """
+    global _teacher_index
+
+    version = get_shared_version(TEACHER_INDEX_VERSION_KEY)
+    index = _teacher_index
+    if version is None or version != index.version:
+        index = TeacherIndex(version, Teacher.objects.values_list('id', 'name', 'department_id', 'position_id', 'status'))
+        _teacher_index = index
+    return index
+
+
+def invalidate_teacher_index():
+    """
+    Makes every process build the teacher index again on its next search.
+    """
+    global _teacher_index
+
+    _teacher_index = TeacherIndex(None, [])
+    bump_shared_version(TEACHER_INDEX_VERSION_KEY)
@@ -1,3 +1,1274 @@
-from django.test import TestCase
+import json
+import tempfile
+from datetime import date, time, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .assignments import RoleAssignmentValidator
+from .checks import check_shared_cache
+from .context_processors import get_department_links
+from .registry import REGISTRY_VERSION_KEY, get_registry, invalidate_registry, warm_registry
+from .generation import expand_template, generate_schedules
+from .models import (Department, ClassRole, Teacher, Schedule, RoleAssignment, ScheduleTemplate, Position,
+                     TeacherWorkload, SlowQuery)
+from .roster import solve_roster
+from .workloads import rebuild_workloads
+from .metrics import reset_metrics
+from .slow_queries import slow_query_log
+from .sheets import build_sheet
+from .views import (PRE_KINDERGARTEN, AllSchedulesView, PreKindergartenSchedulesView, KindergartenSchedulesView, Elementary1SchedulesView,
+                    Elementary1CNJPSchedulesView, Elementary2SchedulesView, JuniorSchedulesView, JuniorJPSchedulesView,
+                    PianicaSchedulesView, ShinkoyasuSchedulesView)
+from .windows import (decode_cursor, encode_cursor, get_adjacent_terms, get_date_window, get_term,
+                      paginate_keyset)
+
+
+FIRST_SATURDAY = date(2025, 1, 4)
+# Covers every Saturday created by the tests, whatever the current term is.
+WINDOW = {'from': '2025-01-01', 'to': '2025-12-31'}
+
+
+class CacheClearingTestCase(TestCase):
+    """
+    Clears the cache between tests, since it outlives the rolled-back test transactions.
+    """
+
+    def setUp(self):
+        cache.clear()
+        # The navigation is loaded once per process; load it now so that query counts only cover the page.
+        get_department_links()
+
+
+class DepartmentSheetTests(CacheClearingTestCase):
+
+    # url name -> (view, department name)
+    SHEET_VIEWS = {
+        'pre_kindergarten_schedules': (PreKindergartenSchedulesView, PRE_KINDERGARTEN),
+        **{
+            url_name: (view, view.department_name) for url_name, view in [
+                ('kindergarten_schedules', KindergartenSchedulesView),
+                ('elementary_1_schedules', Elementary1SchedulesView),
+                ('elementary_1_cn_jp_schedules', Elementary1CNJPSchedulesView),
+                ('elementary_2_schedules', Elementary2SchedulesView),
+                ('junior_schedules', JuniorSchedulesView),
+                ('junior_jp_schedules', JuniorJPSchedulesView),
+                ('pianica_schedules', PianicaSchedulesView),
+                ('shinkoyasu_schedules', ShinkoyasuSchedulesView),
+            ]
+        },
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        for _, department_name in cls.SHEET_VIEWS.values():
+            Department.objects.create(name=department_name)
+        cls.roles = {name: ClassRole.objects.create(name=name) for name in ['老師', '司琴', '助教1', '講師']}
+        cls.teachers = [Teacher.objects.create(name=f'老師{i}', status='擔任中', gender='女') for i in range(3)]
+
+    def create_schedule(self, department_name, day, class_type, start_time, roles=(), **fields):
+        schedule = Schedule.objects.create(
+            department=Department.objects.get(name=department_name), date=day, class_type=class_type,
+            start_time=start_time, end_time=time(start_time.hour, 30), **fields
+        )
+        for role_name, teacher in roles:
+            RoleAssignment.objects.create(schedule=schedule, role=self.roles[role_name], person=teacher)
+        return schedule
+
+    def test_builds_one_row_per_date_in_one_query(self):
+        department_name = KindergartenSchedulesView.department_name
+        next_saturday = FIRST_SATURDAY + timedelta(weeks=1)
+        self.create_schedule(department_name, FIRST_SATURDAY, '詩頌', time(11, 0), topic='讚美', hymn_number=5,
+                             roles=[('老師', self.teachers[0]), ('司琴', self.teachers[1])])
+        self.create_schedule(department_name, FIRST_SATURDAY, '崇拜', time(14, 0), topic='創造', unit_number='3',
+                             roles=[('老師', self.teachers[2])])
+        self.create_schedule(department_name, FIRST_SATURDAY, '共習', time(15, 0), topic='勞作')
+        self.create_schedule(department_name, next_saturday, '崇拜', time(14, 0), topic='洪水')
+        get_registry()
+
+        with self.assertNumQueries(1):
+            first, second = build_sheet(department_name, KindergartenSchedulesView.columns,
+                                        FIRST_SATURDAY, next_saturday)
+
+        self.assertEqual(first, {
+            'date': FIRST_SATURDAY, 'hymn_topic': '讚美', 'hymn_number': 5, 'worship_topic': '創造', 'unit_number': '3',
+            'activity_topic': '勞作', 'hymn_teacher': '老師0', 'hymn_pianist': '老師1', 'hymn_assistant': '',
+            'worship_teacher': '老師2', 'activity_assistant': '',
+        })
+        self.assertEqual(second['date'], next_saturday)
+        self.assertEqual(second['worship_topic'], '洪水')
+        self.assertEqual([second[name] for name in ['hymn_topic', 'hymn_teacher', 'worship_teacher']], ['', '', ''])
+
+    def test_every_sheet_renders(self):
+        for _, department_name in self.SHEET_VIEWS.values():
+            # A teacher per department, since the schedules of the departments overlap.
+            teacher = Teacher.objects.create(name=f'{department_name}老師', status='擔任中', gender='男')
+            for class_type, start_time in [('詩頌', time(11, 0)), ('崇拜', time(14, 0))]:
+                self.create_schedule(department_name, FIRST_SATURDAY, class_type, start_time, topic='主題',
+                                     roles=[('講師', teacher)])
+
+        for url_name, (view, _) in self.SHEET_VIEWS.items():
+            with self.subTest(url_name=url_name):
+                response = self.client.get(reverse(url_name), WINDOW)
+                self.assertEqual(response.status_code, 200)
+                self.assertTemplateUsed(response, view.template_name)
+                self.assertEqual([row['date'] for row in response.context['schedules']], [FIRST_SATURDAY])
+
+
+class HymnClassesViewTests(CacheClearingTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kindergarten = Department.objects.create(name='幼稚班')
+        cls.elementary = Department.objects.create(name='幼年班')
+        cls.leader = ClassRole.objects.create(name='主領')
+        cls.pianist = ClassRole.objects.create(name='司琴')
+        cls.teachers = [
+            Teacher.objects.create(name=f'老師{i}', status='擔任中', gender='女') for i in range(4)
+        ]
+
+    def create_saturdays(self, count, offset=0):
+        for week in range(offset, offset + count):
+            saturday = FIRST_SATURDAY + timedelta(weeks=week)
+            kindergarten = Schedule.objects.create(
+                department=self.kindergarten, date=saturday, class_type='詩頌',
+                start_time=time(11, 30), end_time=time(12, 0), topic=f'k{week}', hymn_number=week + 1
+            )
+            elementary = Schedule.objects.create(
+                department=self.elementary, date=saturday, class_type='詩頌',
+                start_time=time(15, 0), end_time=time(15, 30), topic=f'e{week}'
+            )
+            RoleAssignment.objects.create(schedule=kindergarten, role=self.leader, person=self.teachers[0])
+            RoleAssignment.objects.create(schedule=kindergarten, role=self.pianist, person=self.teachers[1])
+            RoleAssignment.objects.create(schedule=elementary, role=self.leader, person=self.teachers[2])
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('hymn_class_schedules'), WINDOW)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_saturdays(self):
+        self.create_saturdays(2)
+        baseline = self.count_queries()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_saturdays(10, offset=2)
+        self.assertEqual(self.count_queries(), baseline)
+
+    def test_pivots_roles_into_columns(self):
+        self.create_saturdays(1)
+        Schedule.objects.create(
+            department=self.kindergarten, date=FIRST_SATURDAY + timedelta(weeks=1), class_type='詩頌',
+            start_time=time(11, 30), end_time=time(12, 0), topic='unassigned'
+        )
+
+        response = self.client.get(reverse('hymn_class_schedules'), WINDOW)
+        first, second = response.context['hymn_schedules']
+
+        self.assertEqual(first['date'], FIRST_SATURDAY)
+        self.assertEqual(first['hymn_number_k'], 1)
+        self.assertEqual(first['teacher_k'], '老師0')
+        self.assertEqual(first['pianist_k'], '老師1')
+        self.assertEqual(first['department_e'], '幼年班')
+        self.assertEqual(first['teacher_e'], '老師2')
+        self.assertEqual(second['hymn_topic_k'], 'unassigned')
+        self.assertEqual(second['teacher_k'], '')
+
+    def test_dropdown_lists_only_the_page_departments(self):
+        self.create_saturdays(1)
+        pre_kindergarten = Department.objects.create(name='幼幼班')
+        url = reverse('hymn_class_schedules')
+        self.client.get(url, WINDOW)
+        etag = self.client.get(url, WINDOW)['ETag']
+
+        # The version stamps of the page do not cover the other departments, so neither may the dropdown.
+        with self.captureOnCommitCallbacks(execute=True):
+            Schedule.objects.create(department=pre_kindergarten, date=FIRST_SATURDAY, class_type='詩頌',
+                                    start_time=time(16, 0), end_time=time(16, 30))
+        self.assertEqual(self.client.get(url, WINDOW, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        response = self.client.get(url, WINDOW)
+        self.assertEqual({schedule.department.name for schedule in response.context['schedule_options']},
+                         {'幼稚班', '幼年班'})
+
+
+class AllSchedulesViewTests(CacheClearingTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.departments = [Department.objects.create(name=f'班{i}') for i in range(10)]
+        cls.roles = [ClassRole.objects.create(name='講師'), ClassRole.objects.create(name='司琴')]
+        cls.teacher = Teacher.objects.create(name='王老師', status='擔任中', gender='男')
+
+    def create_schedules(self, weeks, offset=0):
+        """
+        Creates one schedule per department for each of the given number of Saturdays,
+        each with a teacher and a pianist.
+        """
+        schedules = Schedule.objects.bulk_create([
+            Schedule(department=department, date=FIRST_SATURDAY + timedelta(weeks=week), class_type='崇拜',
+                     start_time=time(14, 0), end_time=time(14, 55))
+            for week in range(offset, offset + weeks)
+            for department in self.departments
+        ])
+        RoleAssignment.objects.bulk_create([
+            RoleAssignment(schedule=schedule, role=role, person=self.teacher)
+            for schedule in schedules
+            for role in self.roles
+        ])
+
+    def render(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('all_schedules'), WINDOW)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    @mock.patch.object(AllSchedulesView, 'page_size', 1000)
+    def test_query_count_is_constant(self):
+        self.create_schedules(1)
+        _, baseline = self.render()
+
+        self.create_schedules(51, offset=1)
+        response, query_count = self.render()
+
+        self.assertEqual(len(response.context['schedules']), 520)
+        self.assertEqual(query_count, baseline)
+
+    def test_rows_list_roles_in_order(self):
+        self.create_schedules(1)
+
+        response, _ = self.render()
+        row = response.context['schedules'][0]
+
+        self.assertEqual(row['department'], '班0')
+        self.assertEqual(row['role_assignments'], [('講師', '王老師'), ('司琴', '王老師')])
+        self.assertContains(response, '講師: 王老師')
+
+
+class DateWindowTests(SimpleTestCase):
+
+    def get_window(self, **params):
+        with mock.patch('schedule.windows.timezone.localdate', return_value=date(2025, 5, 10)):
+            return get_date_window(RequestFactory().get('/', params))
+
+    def test_terms_are_calendar_quarters(self):
+        self.assertEqual(get_term(date(2025, 1, 1)), (date(2025, 1, 1), date(2025, 3, 31)))
+        self.assertEqual(get_term(date(2025, 6, 30)), (date(2025, 4, 1), date(2025, 6, 30)))
+        self.assertEqual(get_term(date(2025, 10, 1)), (date(2025, 10, 1), date(2025, 12, 31)))
+        self.assertEqual(get_term(date(2025, 12, 31)), (date(2025, 10, 1), date(2025, 12, 31)))
+        self.assertEqual(get_adjacent_terms(date(2025, 10, 1), date(2025, 12, 31)),
+                         ((date(2025, 7, 1), date(2025, 9, 30)), (date(2026, 1, 1), date(2026, 3, 31))))
+
+    def test_window_defaults_to_the_current_term(self):
+        self.assertEqual(self.get_window(), (date(2025, 4, 1), date(2025, 6, 30)))
+        self.assertEqual(self.get_window(**{'from': '2025-05-01'}), (date(2025, 5, 1), date(2025, 6, 30)))
+        self.assertEqual(self.get_window(**{'from': '2024-01-01', 'to': '2024-12-31'}),
+                         (date(2024, 1, 1), date(2024, 12, 31)))
+
+    def test_malformed_or_reversed_windows_fall_back_to_the_default(self):
+        term = (date(2025, 4, 1), date(2025, 6, 30))
+        for params in [{'from': 'yesterday'}, {'from': '2025-02-30'}, {'to': '2025-13-01'},
+                       {'from': '0001-01-01'}, {'to': '9999-12-31'}, {'from': '2025-06-01', 'to': '2025-05-01'}]:
+            with self.subTest(params=params):
+                date_from, date_to = self.get_window(**params)
+                self.assertEqual((date_from, date_to), term)
+                get_adjacent_terms(date_from, date_to)
+
+    def test_garbled_cursors_are_ignored(self):
+        for value in [None, '', 'abc', '2025-01-04,14:00:00', '2025-01-04,14:00:00,x', '2025-02-30,14:00:00,1',
+                      '2025-01-04,25:00:00,1', '2025-01-04,14:00:00,0', f'2025-01-04,14:00:00,{2 ** 63}',
+                      '2025-01-04,14:00:00,1,2']:
+            with self.subTest(value=value):
+                self.assertIsNone(decode_cursor(value))
+        self.assertEqual(decode_cursor('2025-01-04,14:00:00,7'), (date(2025, 1, 4), time(14, 0), 7))
+
+
+class KeysetPaginationTests(CacheClearingTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        departments = [Department.objects.create(name=f'班{i}') for i in range(3)]
+        # Several schedules share each date, and some of them a start time too.
+        cls.schedules = Schedule.objects.bulk_create([
+            Schedule(department=department, date=FIRST_SATURDAY + timedelta(weeks=week), class_type=class_type,
+                     start_time=start_time, end_time=time(15, 30))
+            for week in range(3)
+            for department in departments
+            for class_type, start_time in [('崇拜', time(14, 0)), ('共習', time(15, 0))]
+        ])
+        cls.ordered = list(Schedule.objects.order_by('date', 'start_time', 'id').values_list('id', flat=True))
+
+    def walk_forward(self, page_size):
+        """
+        Follows the next page cursors from the first page, returning the ids of each page.
+        """
+        pages, cursor = [], None
+        while True:
+            rows, _, cursor = paginate_keyset(Schedule.objects.all(), after=decode_cursor(cursor), page_size=page_size)
+            pages.append([schedule.id for schedule in rows])
+            if cursor is None:
+                return pages
+
+    def walk_backward(self, page_size):
+        """
+        Follows the previous page cursors from past the last schedule, returning the ids of each page.
+        """
+        last = Schedule.objects.get(id=self.ordered[-1])
+        pages, cursor = [], (last.date, last.start_time, last.id + 1)
+        while cursor is not None:
+            rows, cursor, _ = paginate_keyset(Schedule.objects.all(), before=cursor, page_size=page_size)
+            pages.append([schedule.id for schedule in rows])
+            cursor = decode_cursor(cursor)
+        return pages
+
+    def test_after_and_before_walk_every_schedule_once(self):
+        forward = self.walk_forward(4)
+        self.assertEqual([pk for page in forward for pk in page], self.ordered)
+        self.assertEqual([len(page) for page in forward], [4, 4, 4, 4, 2])
+
+        backward = self.walk_backward(4)
+        self.assertEqual([pk for page in reversed(backward) for pk in page], self.ordered)
+        self.assertEqual([len(page) for page in backward], [4, 4, 4, 4, 2])
+
+    def test_before_returns_the_page_preceding_a_cursor(self):
+        first_page, _, next_cursor = paginate_keyset(Schedule.objects.all(), page_size=5)
+        second_page, previous_cursor, _ = paginate_keyset(Schedule.objects.all(), after=decode_cursor(next_cursor),
+                                                          page_size=5)
+
+        self.assertEqual(previous_cursor, encode_cursor(second_page[0]))
+        back, cursor, _ = paginate_keyset(Schedule.objects.all(), before=decode_cursor(previous_cursor), page_size=5)
+        self.assertEqual(back, first_page)
+        self.assertIsNone(cursor)
+
+    @mock.patch.object(AllSchedulesView, 'page_size', 8)
+    def test_first_and_last_pages_have_no_previous_or_next_link(self):
+        first = self.client.get(reverse('all_schedules'), WINDOW)
+        self.assertIsNone(first.context['previous_cursor'])
+        self.assertNotContains(first, '上一頁')
+        self.assertContains(first, '下一頁')
+
+        last = self.client.get(reverse('all_schedules'), {**WINDOW, 'after': encode_cursor(
+            Schedule.objects.get(id=self.ordered[-9]))})
+        self.assertEqual(len(last.context['schedules']), 8)
+        self.assertIsNone(last.context['next_cursor'])
+        self.assertContains(last, '上一頁')
+        self.assertNotContains(last, '下一頁')
+
+    def test_a_forged_cursor_shows_the_first_page(self):
+        response = self.client.get(reverse('all_schedules'), {**WINDOW, 'after': f'2025-01-04,14:00:00,{10 ** 30}'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['schedules']), len(self.ordered))
+
+
+class FragmentCacheTests(CacheClearingTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='幼幼班')
+        cls.other_department = Department.objects.create(name='幼稚班')
+        cls.teacher_role = ClassRole.objects.create(name='講師')
+        cls.teacher = Teacher.objects.create(name='王老師', status='擔任中', gender='男')
+        cls.other_teacher = Teacher.objects.create(name='李老師', status='擔任中', gender='女')
+        cls.worship = Schedule.objects.create(
+            department=cls.department, date=FIRST_SATURDAY, class_type='崇拜',
+            start_time=time(14, 0), end_time=time(14, 30), topic='創造'
+        )
+        cls.other_worship = Schedule.objects.create(
+            department=cls.other_department, date=FIRST_SATURDAY, class_type='崇拜',
+            start_time=time(14, 0), end_time=time(14, 35)
+        )
+
+    def render(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('pre_kindergarten_schedules'), WINDOW)
+        sheet_queries = [query for query in queries if 'MAX(' in query['sql']]
+        return response, len(sheet_queries)
+
+    def test_cached_table_skips_the_sheet_query(self):
+        _, first = self.render()
+        response, second = self.render()
+
+        self.assertEqual((first, second), (1, 0))
+        self.assertContains(response, '創造')
+
+    def test_changes_invalidate_only_the_affected_department(self):
+        self.render()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RoleAssignment.objects.create(schedule=self.other_worship, role=self.teacher_role,
+                                          person=self.other_teacher)
+        self.assertEqual(self.render()[1], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RoleAssignment.objects.create(schedule=self.worship, role=self.teacher_role, person=self.teacher)
+        response, sheet_queries = self.render()
+        self.assertEqual(sheet_queries, 1)
+        self.assertContains(response, '王老師')
+
+    def test_tables_are_invalidated_once_the_change_commits(self):
+        self.render()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            RoleAssignment.objects.create(schedule=self.worship, role=self.teacher_role, person=self.teacher)
+            # Until the commit, other requests still read the rows as they were, under the old generation.
+            self.assertEqual(self.render()[1], 0)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.render()[1], 1)
+
+
+class ConditionalGetTests(CacheClearingTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='幼稚班')
+        cls.other_department = Department.objects.create(name='少年班')
+        cls.role = ClassRole.objects.create(name='老師')
+        cls.teacher = Teacher.objects.create(name='王老師', status='擔任中', gender='男')
+
+    def create_worship(self, department):
+        return Schedule.objects.create(
+            department=department, date=FIRST_SATURDAY, class_type='崇拜',
+            start_time=time(14, 0), end_time=time(14, 35)
+        )
+
+    def get_etag(self, url, client=None):
+        client = client or self.client
+        # The first response sets the CSRF cookie, which the ETag covers.
+        client.get(url, WINDOW)
+        return client.get(url, WINDOW)['ETag']
+
+    def test_unchanged_page_is_not_modified(self):
+        url = reverse('kindergarten_schedules')
+        etag = self.get_etag(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, WINDOW, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 0)
+
+    def test_changes_in_the_department_modify_the_page(self):
+        url = reverse('kindergarten_schedules')
+        etag = self.get_etag(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_worship(self.other_department)
+        self.assertEqual(self.client.get(url, WINDOW, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RoleAssignment.objects.create(schedule=self.create_worship(self.department), role=self.role,
+                                          person=self.teacher)
+        self.assertEqual(self.client.get(url, WINDOW, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_users_do_not_share_a_page(self):
+        url = reverse('kindergarten_schedules')
+        first, second = Client(), Client()
+        first.force_login(User.objects.create_user('first', password='secret'))
+        second.force_login(User.objects.create_user('second', password='secret'))
+
+        etag = self.get_etag(url, first)
+        self.assertEqual(first.get(url, WINDOW, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.get_etag(url, second), etag)
+        response = second.get(url, WINDOW, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('Cookie', response['Vary'])
+
+        first.logout()
+        self.assertEqual(first.get(url, WINDOW, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class DepartmentSchedulesExportTests(CacheClearingTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kindergarten = Department.objects.create(name='幼稚班')
+        cls.leader = ClassRole.objects.create(name='主領')
+        cls.pianist = ClassRole.objects.create(name='司琴')
+        cls.teachers = [Teacher.objects.create(name=f'老師{i}', status='擔任中', gender='女') for i in range(2)]
+        worship = Schedule.objects.create(department=cls.kindergarten, date=FIRST_SATURDAY, class_type='崇拜',
+                                          start_time=time(14, 0), end_time=time(14, 35), topic='創造')
+        RoleAssignment.objects.create(schedule=worship, role=cls.leader, person=cls.teachers[0])
+        RoleAssignment.objects.create(schedule=worship, role=cls.pianist, person=cls.teachers[1])
+        Schedule.objects.create(department=cls.kindergarten, date=FIRST_SATURDAY, class_type='共習',
+                                start_time=time(14, 40), end_time=time(15, 0), topic='空')
+        Schedule.objects.create(department=cls.kindergarten, date=date(2026, 1, 3), class_type='崇拜',
+                                start_time=time(14, 0), end_time=time(14, 35), topic='下一年')
+
+    def get_export(self, name, department_name='幼稚班', **params):
+        response = self.client.get(reverse(name, kwargs={'department_name': department_name}), {**WINDOW, **params})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_json_nests_the_role_assignments(self):
+        data = json.loads(self.get_export('api_department_schedules_json'))
+
+        self.assertEqual((data['department'], data['from'], data['to']), ('幼稚班', '2025-01-01', '2025-12-31'))
+        worship, study = data['schedules']
+        self.assertEqual((worship['date'], worship['start_time'], worship['topic']), ('2025-01-04', '14:00:00', '創造'))
+        self.assertEqual(worship['role_assignments'], [{'role': '主領', 'person': '老師0'},
+                                                       {'role': '司琴', 'person': '老師1'}])
+        self.assertEqual((study['class_type'], study['role_assignments']), ('共習', []))
+
+    def test_csv_has_a_line_per_assignment_or_unassigned_schedule(self):
+        lines = self.get_export('api_department_schedules_csv').splitlines()
+
+        self.assertEqual(lines[0], 'id,date,start_time,end_time,class_type,topic,unit_number,hymn_type,hymn_number,'
+                                   'role,person')
+        self.assertEqual([line.split(',')[4:6] + line.split(',')[9:] for line in lines[1:]], [
+            ['崇拜', '創造', '主領', '老師0'],
+            ['崇拜', '創造', '司琴', '老師1'],
+            ['共習', '空', '', ''],
+        ])
+
+    def test_filters_on_class_type_and_date_window(self):
+        data = json.loads(self.get_export('api_department_schedules_json', class_type='共習'))
+        self.assertEqual([schedule['topic'] for schedule in data['schedules']], ['空'])
+
+        lines = self.get_export('api_department_schedules_csv', **{'from': '2026-01-01', 'to': '2026-03-31'})
+        self.assertEqual([line.split(',')[5] for line in lines.splitlines()[1:]], ['下一年'])
+
+    def test_unknown_department_is_not_found(self):
+        for name in ['api_department_schedules_json', 'api_department_schedules_csv']:
+            response = self.client.get(reverse(name, kwargs={'department_name': '不存在'}), WINDOW)
+            self.assertEqual(response.status_code, 404)
+
+    def count_export_queries(self, name):
+        with CaptureQueriesContext(connection) as queries:
+            self.get_export(name)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_the_rows(self):
+        # The rows are read from a single query with .iterator(), not one per schedule.
+        baselines = {name: self.count_export_queries(name)
+                     for name in ['api_department_schedules_json', 'api_department_schedules_csv']}
+
+        schedules = Schedule.objects.bulk_create([
+            Schedule(department=self.kindergarten, date=FIRST_SATURDAY + timedelta(weeks=week), class_type='詩頌',
+                     start_time=time(11, 30), end_time=time(12, 0))
+            for week in range(1, 52)
+        ])
+        RoleAssignment.objects.bulk_create([
+            RoleAssignment(schedule=schedule, role=role, person=self.teachers[0])
+            for schedule in schedules
+            for role in [self.leader, self.pianist]
+        ])
+
+        for name, baseline in baselines.items():
+            with self.subTest(name=name):
+                self.assertEqual(self.count_export_queries(name), baseline)
+
+
+class RoleAssignmentBulkViewTests(CacheClearingTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='幼稚班')
+        cls.leader = ClassRole.objects.create(name='主領')
+        cls.assistant = ClassRole.objects.create(name='助教')
+        cls.teachers = [
+            Teacher.objects.create(name=f'老師{i}', status='擔任中', gender='女') for i in range(3)
+        ]
+        cls.schedules = [
+            Schedule.objects.create(
+                department=cls.department, date=FIRST_SATURDAY + timedelta(weeks=week), class_type='崇拜',
+                start_time=time(14, 0), end_time=time(14, 35)
+            )
+            for week in range(20)
+        ]
+
+    def post(self, rows):
+        return self.client.post(reverse('api_role_assignments_bulk'), {'assignments': rows},
+                                content_type='application/json')
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        rows = [
+            {'schedule': schedule.id, 'role': role.id, 'person': teacher.id}
+            for schedule in self.schedules
+            for role, teacher in [(self.leader, self.teachers[0]), (self.assistant, self.teachers[1])]
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(rows)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'success': True, 'created': 40})
+        self.assertEqual(RoleAssignment.objects.count(), 40)
+        # Including the three queries refreshing the teacher workloads.
+        self.assertLessEqual(len(queries), 13)
+
+    def test_conflicting_rows_reject_the_whole_batch(self):
+        schedule = self.schedules[0]
+        RoleAssignment.objects.create(schedule=schedule, role=self.leader, person=self.teachers[0])
+
+        response = self.post([
+            {'schedule': self.schedules[1].id, 'role': self.leader.id, 'person': self.teachers[0].id},
+            {'schedule': schedule.id, 'role': self.leader.id, 'person': self.teachers[1].id},
+            {'schedule': schedule.id, 'role': self.assistant.id, 'person': self.teachers[0].id},
+            {'schedule': schedule.id, 'role': self.assistant.id, 'person': self.teachers[2].id},
+            {'schedule': schedule.id, 'role': self.assistant.id, 'person': self.teachers[2].id},
+            {'schedule': 0, 'role': self.leader.id, 'person': self.teachers[2].id},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [1, 2, 4, 5])
+        self.assertEqual(RoleAssignment.objects.count(), 1)
+
+
+class RoleAssignmentValidatorTests(CacheClearingTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kindergarten = Department.objects.create(name='幼稚班')
+        cls.elementary = Department.objects.create(name='幼年班')
+        cls.leader = ClassRole.objects.create(name='主領')
+        cls.teacher = Teacher.objects.create(name='王老師', status='擔任中', gender='男')
+        cls.worship = Schedule.objects.create(
+            department=cls.kindergarten, date=FIRST_SATURDAY, class_type='崇拜',
+            start_time=time(14, 0), end_time=time(14, 35)
+        )
+        cls.activity = Schedule.objects.create(
+            department=cls.elementary, date=FIRST_SATURDAY, class_type='共習',
+            start_time=time(14, 30), end_time=time(15, 0)
+        )
+        cls.hymn = Schedule.objects.create(
+            department=cls.elementary, date=FIRST_SATURDAY, class_type='詩頌',
+            start_time=time(15, 0), end_time=time(15, 30)
+        )
+
+    def test_clean_reports_the_overlapping_assignment(self):
+        RoleAssignment.objects.create(schedule=self.worship, role=self.leader, person=self.teacher)
+
+        with self.assertRaisesMessage(ValidationError, "王老師 is already assigned as a '主領' in the '幼稚班' department"):
+            RoleAssignment(schedule=self.activity, role=self.leader, person=self.teacher).clean()
+
+        # Slots touching at their boundaries do not overlap.
+        RoleAssignment(schedule=self.hymn, role=self.leader, person=self.teacher).clean()
+
+    def test_one_validator_checks_many_assignments(self):
+        assignment = RoleAssignment.objects.create(schedule=self.hymn, role=self.leader, person=self.teacher)
+
+        with self.assertNumQueries(1):
+            validator = RoleAssignmentValidator([FIRST_SATURDAY])
+            validator.validate(assignment)
+            validator.validate(RoleAssignment(schedule=self.worship, role=self.leader, person=self.teacher))
+            self.assertEqual(validator.find_overlap(self.teacher.id, FIRST_SATURDAY, time(14, 30), time(15, 0)), None)
+            self.assertEqual(
+                validator.find_overlap(self.teacher.id, FIRST_SATURDAY, time(15, 10), time(16, 0)).assignment_id,
+                assignment.id
+            )
+
+            validator.add(RoleAssignment(schedule=self.worship, role=self.leader, person=self.teacher))
+            with self.assertRaises(ValidationError):
+                validator.validate(RoleAssignment(schedule=self.activity, role=self.leader, person=self.teacher))
+
+
+class RoleAssignmentInlineTests(CacheClearingTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kindergarten = Department.objects.create(name='幼稚班')
+        cls.elementary = Department.objects.create(name='幼年班')
+        cls.leader = ClassRole.objects.create(name='主領')
+        cls.teacher = Teacher.objects.create(name='王老師', status='擔任中', gender='男')
+        cls.worship = Schedule.objects.create(department=cls.kindergarten, date=FIRST_SATURDAY, class_type='崇拜',
+                                              start_time=time(14, 0), end_time=time(14, 35))
+        cls.activity = Schedule.objects.create(department=cls.elementary, date=FIRST_SATURDAY, class_type='共習',
+                                               start_time=time(14, 30), end_time=time(15, 0))
+        RoleAssignment.objects.create(schedule=cls.activity, role=cls.leader, person=cls.teacher)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', password='secret'))
+
+    def post_inline(self, *assignments):
+        data = {
+            'department': self.kindergarten.id, 'date': FIRST_SATURDAY.isoformat(), 'start_time': '14:00',
+            'end_time': '14:35', 'class_type': '崇拜', 'topic': '', 'unit_number': '', 'hymn_type': '',
+            'hymn_number': '',
+            'role_assignments-TOTAL_FORMS': len(assignments), 'role_assignments-INITIAL_FORMS': 0,
+            'role_assignments-MIN_NUM_FORMS': 0, 'role_assignments-MAX_NUM_FORMS': 1000,
+        }
+        for index, (role, person) in enumerate(assignments):
+            data[f'role_assignments-{index}-role'] = role.id
+            data[f'role_assignments-{index}-person'] = person.id
+        return self.client.post(reverse('admin:schedule_schedule_change', args=[self.worship.id]), data)
+
+    def test_a_conflicting_inline_is_reported_once(self):
+        with mock.patch.object(RoleAssignmentValidator, '__init__', autospec=True,
+                               side_effect=RoleAssignmentValidator.__init__) as validator:
+            response = self.post_inline((self.leader, self.teacher))
+
+        self.assertEqual(response.status_code, 200)
+        errors = [str(error) for form in response.context['inline_admin_formsets'][0].formset.forms
+                  for error in form.non_field_errors()]
+        self.assertEqual(len(errors), 1)
+        self.assertIn("王老師 is already assigned as a '主領' in the '幼年班' department", errors[0])
+        self.assertEqual(validator.call_count, 1)
+        self.assertFalse(self.worship.role_assignments.exists())
+
+    def test_valid_inlines_are_validated_once_and_saved(self):
+        free_teacher = Teacher.objects.create(name='李老師', status='擔任中', gender='女')
+        with mock.patch.object(RoleAssignmentValidator, '__init__', autospec=True,
+                               side_effect=RoleAssignmentValidator.__init__) as validator:
+            response = self.post_inline((self.leader, free_teacher))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(validator.call_count, 1)
+        self.assertTrue(self.worship.role_assignments.filter(role=self.leader, person=free_teacher).exists())
+
+
+class GenerateSchedulesTests(CacheClearingTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kindergarten = Department.objects.create(name='幼稚班')
+        cls.elementary = Department.objects.create(name='幼年班')
+        Department.objects.create(name='新子安')
+        for department, class_type, start_hour, recurrence in [
+            (cls.kindergarten, '詩頌', 11, ScheduleTemplate.EVERY_WEEK),
+            (cls.kindergarten, '崇拜', 14, ScheduleTemplate.EVERY_WEEK),
+            (cls.kindergarten, '共習', 15, ScheduleTemplate.EVERY_WEEK),
+            (cls.elementary, '崇拜', 14, ScheduleTemplate.EVERY_WEEK),
+            (cls.elementary, '詩頌', 15, ScheduleTemplate.ODD_WEEKS),
+            (cls.elementary, '共習', 15, ScheduleTemplate.EVEN_WEEKS),
+        ]:
+            ScheduleTemplate.objects.create(
+                department=department, class_type=class_type, start_time=time(start_hour, 0),
+                end_time=time(start_hour, 30), recurrence=recurrence, effective_from=date(2024, 1, 1)
+            )
+
+    def test_creates_the_missing_schedules_in_a_fixed_number_of_queries(self):
+        Schedule.objects.create(department=self.kindergarten, date=FIRST_SATURDAY, class_type='崇拜',
+                                start_time=time(13, 0), end_time=time(13, 30))
+        date_from, date_to = FIRST_SATURDAY, FIRST_SATURDAY + timedelta(weeks=7)
+
+        with self.assertNumQueries(3):
+            created = generate_schedules(date_from, date_to)
+
+        # 3 kindergarten classes and 2 elementary classes per Saturday, minus the existing one.
+        self.assertEqual(len(created), 8 * 5 - 1)
+        self.assertEqual(Schedule.objects.count(), 8 * 5)
+        # Existing schedules are left untouched.
+        self.assertEqual(Schedule.objects.get(department=self.kindergarten, date=FIRST_SATURDAY,
+                                              class_type='崇拜').start_time, time(13, 0))
+        # 2025-01-04 is the 1st Saturday of January, 2025-01-11 the 2nd.
+        self.assertEqual(
+            list(Schedule.objects.filter(department=self.elementary, date__lte=FIRST_SATURDAY + timedelta(weeks=1))
+                 .exclude(class_type='崇拜').order_by('date').values_list('class_type', flat=True)),
+            ['詩頌', '共習']
+        )
+        self.assertEqual(generate_schedules(date_from, date_to), [])
+
+    def test_dry_run_creates_nothing(self):
+        self.assertEqual(len(generate_schedules(FIRST_SATURDAY, FIRST_SATURDAY, dry_run=True)), 5)
+        self.assertFalse(Schedule.objects.exists())
+
+    def test_expands_every_nth_week_within_the_effective_period(self):
+        template = ScheduleTemplate(
+            department=self.kindergarten, class_type='口風琴', start_time=time(16, 0), end_time=time(16, 30),
+            weekday=6, recurrence=ScheduleTemplate.EVERY_NTH_WEEK, interval=3,
+            effective_from=date(2025, 1, 1), effective_until=date(2025, 3, 1)
+        )
+        # The Sundays from 2025-01-05, every 3 weeks, whatever the start of the window.
+        self.assertEqual(list(expand_template(template, date(2025, 1, 20), date(2025, 12, 31))),
+                         [date(2025, 1, 26), date(2025, 2, 16)])
+
+
+class AdminChangelistTests(CacheClearingTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='幼稚班')
+        cls.roles = [ClassRole.objects.create(name=name) for name in ('主領', '司琴')]
+        cls.teachers = [
+            Teacher.objects.create(name=f'老師{i}', status='擔任中', gender='女', department=cls.department)
+            for i in range(4)
+        ]
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def create_saturdays(self, count, offset=0):
+        for week in range(offset, offset + count):
+            schedule = Schedule.objects.create(
+                department=self.department, date=FIRST_SATURDAY + timedelta(weeks=week), class_type='崇拜',
+                start_time=time(14, 0), end_time=time(14, 35)
+            )
+            for role, teacher in zip(self.roles, self.teachers):
+                RoleAssignment.objects.create(schedule=schedule, role=role, person=teacher)
+
+    def count_queries(self, url_name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        url_names = ['admin:schedule_schedule_changelist', 'admin:schedule_roleassignment_changelist',
+                     'admin:schedule_teacher_changelist']
+        self.create_saturdays(2)
+        counts = [self.count_queries(url_name) for url_name in url_names]
+
+        self.create_saturdays(10, offset=2)
+        for index in range(4, 20):
+            Teacher.objects.create(name=f'老師{index}', status='擔任中', gender='男', department=self.department)
+
+        self.assertEqual([self.count_queries(url_name) for url_name in url_names], counts)
+
+    def test_person_filter_matches_part_of_the_name(self):
+        self.create_saturdays(1)
+        response = self.client.get(reverse('admin:schedule_roleassignment_changelist'), {'person_name': '師1'})
+        self.assertEqual([assignment.person for assignment in response.context['cl'].result_list], [self.teachers[1]])
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+
+    def test_a_per_process_cache_is_refused_outside_the_local_profile(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with self.settings(CACHES=locmem, LOCAL_PROFILE=False):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['schedule.E001'])
+        with self.settings(CACHES=locmem, LOCAL_PROFILE=True):
+            self.assertEqual(check_shared_cache(None), [])
+
+        filebased = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                 'LOCATION': '/tmp/schedule-cache'}}
+        with self.settings(CACHES=filebased, LOCAL_PROFILE=False):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class DepartmentLinksTests(CacheClearingTestCase):
+
+    def test_links_are_cached_until_a_department_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            department = Department.objects.create(name='幼稚班')
+        # One query per dimension table of the registry.
+        with self.assertNumQueries(4):
+            self.assertEqual(get_department_links(), [{'name': '幼稚班', 'url': reverse('kindergarten_schedules')}])
+        with self.assertNumQueries(0):
+            get_department_links()
+
+        department.name = '新班'
+        with self.captureOnCommitCallbacks(execute=True):
+            department.save()
+        self.assertEqual(get_department_links(), [
+            {'name': '新班', 'url': reverse('department_schedules', kwargs={'department_name': '新班'})}
+        ])
+
+    def test_another_process_changing_the_departments_is_noticed(self):
+        Department.objects.create(name='幼稚班')
+        get_department_links()
+
+        # Another worker bumps the shared version after changing the departments.
+        Department.objects.filter(name='幼稚班').update(name='少年班')
+        cache.set(REGISTRY_VERSION_KEY, 'changed elsewhere', timeout=None)
+        self.assertEqual([link['name'] for link in get_department_links()], ['少年班'])
+
+
+class RegistryTests(CacheClearingTestCase):
+
+    def test_maps_names_to_ids_until_a_row_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            leader = ClassRole.objects.create(name='主領')
+            pianist = ClassRole.objects.create(name='司琴')
+        registry = get_registry()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_registry().id(ClassRole, '主領'), leader.id)
+            self.assertEqual(get_registry().ids(ClassRole, ['司琴', '講師', '主領']), [pianist.id, leader.id])
+            self.assertEqual(get_registry().objects(ClassRole, ['司琴']), [pianist])
+            self.assertIs(get_registry(), registry)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            pianist.delete()
+        # Until the deletion commits, the registry keeps the rows as they were.
+        self.assertIs(get_registry(), registry)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(get_registry().objects(ClassRole), [leader])
+
+    def test_warming_loads_the_registry_ahead_of_the_first_request(self):
+        leader = ClassRole.objects.create(name='主領')
+        invalidate_registry()
+
+        warm_registry()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_registry().id(ClassRole, '主領'), leader.id)
+
+    def test_warming_without_the_tables_is_skipped(self):
+        invalidate_registry()
+
+        with mock.patch.object(ClassRole.objects, 'order_by', side_effect=DatabaseError), \
+                self.assertLogs('schedule.registry', 'WARNING'):
+            warm_registry()
+
+
+class TeacherAutocompleteTests(CacheClearingTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kindergarten = Department.objects.create(name='幼稚班')
+        cls.teachers = {
+            name: Teacher.objects.create(name=name, status=status, gender='女', department=department)
+            for name, status, department in [
+                ('王小明', '擔任中', cls.kindergarten),
+                ('小王', '擔任中', None),
+                ('Ｙａｍａｄａ 花子', '新任', cls.kindergarten),
+                ('李大同', '休息中', cls.kindergarten),
+            ]
+        }
+
+    def search(self, **params):
+        response = self.client.get(reverse('api_teacher_autocomplete'), params)
+        self.assertEqual(response.status_code, 200)
+        return [teacher['name'] for teacher in response.json()['results']]
+
+    def test_prefix_matches_come_first(self):
+        self.assertEqual(self.search(q='王'), ['王小明', '小王'])
+        self.assertEqual(self.search(q='小'), ['小王', '王小明'])
+
+    def test_full_width_and_case_are_ignored(self):
+        self.assertEqual(self.search(q='yamada'), ['Ｙａｍａｄａ 花子'])
+        self.assertEqual(self.search(q='Yamada花'), ['Ｙａｍａｄａ 花子'])
+
+    def test_filters(self):
+        self.assertEqual(self.search(q='', department='幼稚班', status='擔任中'), ['王小明'])
+        self.assertEqual(self.search(q='王', department='新子安'), [])
+
+    def test_searches_from_memory_until_a_teacher_changes(self):
+        self.search(q='王')
+        with self.assertNumQueries(0):
+            self.search(q='王')
+
+        teacher = self.teachers['李大同']
+        teacher.name = '王大同'
+        with self.captureOnCommitCallbacks() as callbacks:
+            teacher.save()
+        # Until the change commits, the index keeps the teachers as they were.
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search(q='王'), ['王小明', '小王'])
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.search(q='王'), ['王大同', '王小明', '小王'])
+
+
+class ScheduleAvailabilityTests(CacheClearingTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kindergarten = Department.objects.create(name='幼稚班')
+        cls.elementary = Department.objects.create(name='幼年班')
+        cls.leader = ClassRole.objects.create(name='主領')
+        cls.busy_teacher = Teacher.objects.create(name='王老師', status='擔任中', gender='男')
+        cls.free_teacher = Teacher.objects.create(name='李老師', status='擔任中', gender='女')
+        worship = Schedule.objects.create(
+            department=cls.kindergarten, date=FIRST_SATURDAY, class_type='崇拜',
+            start_time=time(14, 0), end_time=time(14, 35)
+        )
+        cls.activity = Schedule.objects.create(
+            department=cls.elementary, date=FIRST_SATURDAY, class_type='共習',
+            start_time=time(14, 30), end_time=time(15, 0)
+        )
+        RoleAssignment.objects.create(schedule=worship, role=cls.leader, person=cls.busy_teacher)
+
+    def test_partitions_the_teachers(self):
+        url = reverse('api_schedule_availability', kwargs={'schedule_id': self.activity.id})
+        self.client.get(url)
+
+        with self.assertNumQueries(2):
+            data = self.client.get(url).json()
+
+        self.assertEqual(data['free'], [{'id': self.free_teacher.id, 'name': '李老師'}])
+        self.assertEqual(data['busy'], [{
+            'id': self.busy_teacher.id, 'name': '王老師', 'department': '幼稚班', 'role': '主領',
+            'start_time': '14:00:00', 'end_time': '14:35:00',
+        }])
+
+
+class RosterTests(CacheClearingTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kindergarten = Department.objects.create(name='幼稚班')
+        cls.junior = Department.objects.create(name='青教組')
+        cls.teacher_role = ClassRole.objects.create(name='老師')
+        cls.assistant_role = ClassRole.objects.create(name='助教1')
+        cls.kindergarten_teacher = Teacher.objects.create(name='王老師', status='擔任中', gender='男',
+                                                          department=cls.kindergarten)
+        cls.floating_teacher = Teacher.objects.create(name='李老師', status='新任', gender='女')
+        Teacher.objects.create(name='張老師', status='擔任中', gender='女', department=cls.junior)
+        Teacher.objects.create(name='陳老師', status='休息中', gender='女', department=cls.kindergarten)
+        cls.schedules = [
+            Schedule.objects.create(department=cls.kindergarten, date=FIRST_SATURDAY + timedelta(weeks=week),
+                                    class_type='崇拜', start_time=time(14, 0), end_time=time(14, 35))
+            for week in range(2)
+        ]
+        cls.required_roles = {('幼稚班', '崇拜'): ['老師', '助教1']}
+
+    def test_balances_the_eligible_teachers(self):
+        roster = solve_roster(FIRST_SATURDAY, FIRST_SATURDAY + timedelta(weeks=1), self.required_roles)
+
+        self.assertEqual(roster.unfilled, [])
+        self.assertEqual(len(roster.assignments), 4)
+        self.assertEqual({assignment.teacher.id for assignment in roster.assignments},
+                         {self.kindergarten_teacher.id, self.floating_teacher.id})
+        self.assertEqual(roster.loads[self.kindergarten_teacher.id], 2)
+        self.assertEqual(roster.loads[self.floating_teacher.id], 2)
+
+    def test_skips_assigned_roles_and_busy_teachers(self):
+        RoleAssignment.objects.create(schedule=self.schedules[0], role=self.teacher_role,
+                                      person=self.kindergarten_teacher)
+
+        roster = solve_roster(FIRST_SATURDAY, FIRST_SATURDAY, self.required_roles)
+
+        self.assertEqual([(assignment.role.id, assignment.teacher.id) for assignment in roster.assignments],
+                         [(self.assistant_role.id, self.floating_teacher.id)])
+
+    def test_hands_a_role_over_to_free_a_teacher(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first, second, third = (Position.objects.create(name=name) for name in ('正式', '實習', '見習'))
+        teachers = [Teacher.objects.create(name=name, status='擔任中', gender='女', position=position)
+                    for name, position in (('甲', first), ('乙', second), ('丙', third))]
+        other = Schedule.objects.create(department=self.junior, date=FIRST_SATURDAY, class_type='崇拜',
+                                        start_time=time(14, 0), end_time=time(14, 35))
+        required_roles = {('幼稚班', '崇拜'): ['老師', '助教1'], ('青教組', '崇拜'): ['老師']}
+        role_positions = {'老師': ['正式', '實習'], '助教1': ['實習', '見習']}
+
+        roster = solve_roster(FIRST_SATURDAY, FIRST_SATURDAY, required_roles, role_positions)
+
+        self.assertEqual(roster.unfilled, [])
+        self.assertEqual(
+            [(assignment.schedule.id, assignment.role.id, assignment.teacher.name) for assignment in roster.assignments],
+            [(self.schedules[0].id, self.teacher_role.id, '甲'),
+             (self.schedules[0].id, self.assistant_role.id, '丙'),
+             (other.id, self.teacher_role.id, '乙')]
+        )
+
+    def test_commits_the_previewed_roster(self):
+        url = reverse('roster') + '?from=2025-01-01&to=2025-12-31'
+        response = self.client.get(url)
+        self.assertContains(response, '王老師')
+
+        proposal = response.context['roster'].assignments
+        self.assertTrue(proposal)
+
+        response = self.client.post(url, {'assignments': response.context['proposal']})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(RoleAssignment.objects.count(), len(proposal))
+        self.assertEqual(self.client.get(url).context['roster'].assignments, [])
+
+
+class TeacherWorkloadTests(CacheClearingTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kindergarten = Department.objects.create(name='幼稚班')
+        cls.leader = ClassRole.objects.create(name='主領')
+        cls.pianist = ClassRole.objects.create(name='司琴')
+        cls.teachers = [Teacher.objects.create(name=name, status='擔任中', gender='女') for name in ('王老師', '李老師')]
+        cls.schedules = [
+            Schedule.objects.create(department=cls.kindergarten, date=FIRST_SATURDAY + timedelta(weeks=week),
+                                    class_type='崇拜', start_time=time(14, 0), end_time=time(14, 35))
+            for week in range(2)
+        ]
+
+    def workloads(self):
+        return set(TeacherWorkload.objects.values_list('person__name', 'month', 'role__name', 'count', 'minutes'))
+
+    def test_follows_the_role_assignments(self):
+        first = RoleAssignment.objects.create(schedule=self.schedules[0], role=self.leader, person=self.teachers[0])
+        RoleAssignment.objects.create(schedule=self.schedules[1], role=self.leader, person=self.teachers[0])
+        self.assertEqual(self.workloads(), {('王老師', date(2025, 1, 1), '主領', 2, 70)})
+
+        first.person = self.teachers[1]
+        first.save()
+        self.assertEqual(self.workloads(), {('王老師', date(2025, 1, 1), '主領', 1, 35),
+                                            ('李老師', date(2025, 1, 1), '主領', 1, 35)})
+
+        schedule = Schedule.objects.get(id=self.schedules[1].id)
+        schedule.date = date(2025, 2, 1)
+        schedule.save()
+        self.assertEqual(self.workloads(), {('王老師', date(2025, 2, 1), '主領', 1, 35),
+                                            ('李老師', date(2025, 1, 1), '主領', 1, 35)})
+
+        schedule.delete()
+        first.delete()
+        self.assertEqual(self.workloads(), set())
+
+    def test_rebuild_matches_the_incremental_updates(self):
+        for schedule in self.schedules:
+            RoleAssignment.objects.create(schedule=schedule, role=self.leader, person=self.teachers[0])
+            RoleAssignment.objects.create(schedule=schedule, role=self.pianist, person=self.teachers[1])
+        incremental = self.workloads()
+
+        self.assertEqual(rebuild_workloads(), 2)
+        self.assertEqual(self.workloads(), incremental)
+
+    def test_report(self):
+        RoleAssignment.objects.create(schedule=self.schedules[0], role=self.pianist, person=self.teachers[1])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('workloads'), WINDOW)
+
+        self.assertEqual([role.name for role in response.context['roles']], ['司琴'])
+        self.assertEqual(response.context['workloads'], [{'name': '李老師', 'roles': [1], 'count': 1, 'minutes': 35}])
+
+
+class MetricsTests(CacheClearingTestCase):
+
+    def setUp(self):
+        super().setUp()
+        reset_metrics()
+
+    def test_measures_the_requests_per_view(self):
+        Schedule.objects.create(department=Department.objects.create(name='幼稚班'), date=FIRST_SATURDAY,
+                                class_type='詩頌', start_time=time(11, 30), end_time=time(12, 0))
+
+        response = self.client.get(reverse('hymn_class_schedules'), WINDOW)
+
+        timings = dict(part.split(';', 1)[0:2] for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timings), {'sql', 'pandas', 'template', 'total'})
+        self.assertIn('queries"', timings['sql'])
+
+        self.client.force_login(User.objects.create_user('staff', password='secret', is_staff=True))
+        metrics = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('schedule_request_duration_seconds_count{view="hymn_class_schedules"} 1', metrics)
+        self.assertIn('schedule_request_sql_queries_bucket{view="hymn_class_schedules",le="+Inf"} 1', metrics)
+        self.assertNotIn('view="metrics"', metrics)
+
+    def test_anonymous_requests_are_refused(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.force_login(User.objects.create_user('user', password='secret'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    def test_scrapers_authenticate_with_the_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+        with self.settings(SCHEDULE_METRICS_TOKEN='scrape-token'):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer other').status_code, 403)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer scrape-token').status_code, 200)
+
+
+class ProfilerTests(CacheClearingTestCase):
+
+    def test_profiles_staff_requests_on_demand(self):
+        staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.force_login(staff)
+
+        response = self.client.get(reverse('all_schedules'), {**WINDOW, '_profile': '1', '_profile_sql': '1'})
+
+        report = self.client.get(response['X-Profile-Url'])
+        self.assertContains(report, 'cumulative')
+        self.assertTrue(report.context['queries'])
+        download = self.client.get(reverse('profile_download', kwargs={'profile_id': response['X-Profile-Id']}))
+        self.assertEqual(download['Content-Type'], 'application/octet-stream')
+        self.assertContains(self.client.get(reverse('profiles')), '/schedules/all/')
+
+    def test_requests_cannot_choose_their_profile_id(self):
+        self.client.force_login(User.objects.create_user('staff', password='secret', is_staff=True))
+
+        profile_ids = [
+            self.client.get(reverse(name), {'_profile': '1'}, HTTP_X_REQUEST_ID='req-1')['X-Profile-Id']
+            for name in ('all_schedules', 'roster')
+        ]
+
+        self.assertNotIn('req-1', profile_ids)
+        self.assertNotEqual(profile_ids[0], profile_ids[1])
+        self.assertEqual(len(self.client.get(reverse('profiles')).context['profiles']), 2)
+
+    def test_ignores_other_users(self):
+        response = self.client.get(reverse('all_schedules'), {'_profile': '1'})
+
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(self.client.get(reverse('profiles')).status_code, 302)
+
+
+class SlowQueryLogTests(CacheClearingTestCase):
+
+    def test_logs_the_queries_with_their_origin_and_plan(self):
+        kindergarten = Department.objects.create(name='幼稚班')
+        schedule = Schedule.objects.create(department=kindergarten, date=FIRST_SATURDAY, class_type='崇拜',
+                                           start_time=time(14, 0), end_time=time(14, 35))
+        teacher = Teacher.objects.create(name='王老師', status='擔任中', gender='男')
+        role = ClassRole.objects.create(name='主領')
+
+        with self.assertLogs('schedule.slow_queries', 'WARNING'), self.settings(SCHEDULE_SLOW_QUERY_THRESHOLD=1e-9):
+            with slow_query_log():
+                RoleAssignment.objects.create(schedule=schedule, role=role, person=teacher)
+            self.client.get(reverse('all_schedules'), WINDOW)
+
+        origins = set(SlowQuery.objects.values_list('origin', flat=True))
+        self.assertIn('schedule.assignments:RoleAssignmentValidator.__init__', origins)
+        page_query = SlowQuery.objects.filter(view_name='all_schedules', sql__contains='schedule_schedule').first()
+        self.assertIsNotNone(page_query)
+        self.assertTrue(page_query.explain)
+
+    def test_fast_queries_are_not_logged(self):
+        self.client.get(reverse('all_schedules'), WINDOW)
+
+        self.assertFalse(SlowQuery.objects.exists())
+
+
+class SlowQueryConnectionTests(TransactionTestCase):
+    """
+    Closes the connection between requests, which a TestCase transaction would not allow.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_watches_every_request_without_leaking_wrappers(self):
+        for _ in range(3):
+            connection.close()
+            logged = SlowQuery.objects.count()
+            with self.assertLogs('schedule.slow_queries', 'WARNING'), \
+                    self.settings(SCHEDULE_SLOW_QUERY_THRESHOLD=1e-9):
+                self.client.get(reverse('all_schedules'), WINDOW)
+
+            self.assertEqual(connection.execute_wrappers, [])
+            self.assertGreater(SlowQuery.objects.filter(view_name='all_schedules').count(), logged)
+
+
+class BenchmarkCommandTests(TransactionTestCase):
+    """
+    The seeded dimension tables reach the registry once their transaction commits, which a TestCase would not do.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_seeds_and_compares_with_the_baseline(self):
+        call_command('seed_dataset', '--years', '1', '--teachers', '40', stdout=StringIO())
+        self.assertTrue(RoleAssignment.objects.exists())
+
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = Path(directory) / 'baseline.json'
+            call_command('benchmark', '--repeat', '1', '--baseline', str(baseline), '--save-baseline',
+                         stdout=StringIO())
+            results = json.loads(baseline.read_text())
+            self.assertIn('all_schedules', results)
+            self.assertIn('admin:schedule_schedule_changelist', results)
+            self.assertIn('RoleAssignment.clean', results)
+
+            results['all_schedules']['queries'] -= 1
+            baseline.write_text(json.dumps(results))
+            with self.assertRaisesMessage(CommandError, 'all_schedules'):
+                call_command('benchmark', '--repeat', '1', '--baseline', str(baseline), '--tolerance', '100',
+                             stdout=StringIO())
@@ -1,9 +1,13 @@
 from django.urls import path
-from .views import (AllSchedulesView, HymnClassesView, PreKindergartenSchedulesView,
-                    KindergartenSchedulesView, Elementary1SchedulesView,
+from .views import (AllSchedulesView, DepartmentScheduleView, HymnClassesView,
+                    PreKindergartenSchedulesView, KindergartenSchedulesView, Elementary1SchedulesView,
                     Elementary1CNJPSchedulesView, Elementary2SchedulesView,
                     JuniorSchedulesView, JuniorJPSchedulesView, PianicaSchedulesView,
-                    ShinkoyasuSchedulesView)
+                    ShinkoyasuSchedulesView, RosterView, WorkloadReportView)
+from .api import (DepartmentSchedulesJSONView, DepartmentSchedulesCSVView, RoleAssignmentBulkView,
+                  TeacherAutocompleteView, ScheduleAvailabilityView)
+from .metrics import metrics_view
+from .profiling import profile_list_view, profile_report_view, profile_download_view
 
 urlpatterns = [
     path('schedules/hymn_classes/', HymnClassesView.as_view(), name="hymn_class_schedules"),
@@ -16,5 +20,20 @@ urlpatterns = [
     path('schedules/junior_jp/', JuniorJPSchedulesView.as_view(), name='junior_jp_schedules'),
     path('schedules/pianica/', PianicaSchedulesView.as_view(), name='pianica_schedules'),
     path('schedules/shinkoyasu/', ShinkoyasuSchedulesView.as_view(), name='shinkoyasu_schedules'),
-    path('schedules/all/', AllSchedulesView.as_view(), name='all_schedules')
+    path('schedules/all/', AllSchedulesView.as_view(), name='all_schedules'),
+    path('schedules/roster/', RosterView.as_view(), name='roster'),
+    path('schedules/workloads/', WorkloadReportView.as_view(), name='workloads'),
+    path('schedules/department/<str:department_name>/', DepartmentScheduleView.as_view(), name='department_schedules'),
+    path('api/departments/<str:department_name>/schedules.json', DepartmentSchedulesJSONView.as_view(),
+         name='api_department_schedules_json'),
+    path('api/departments/<str:department_name>/schedules.csv', DepartmentSchedulesCSVView.as_view(),
+         name='api_department_schedules_csv'),
+    path('api/role_assignments/bulk/', RoleAssignmentBulkView.as_view(), name='api_role_assignments_bulk'),
+    path('api/teachers/autocomplete/', TeacherAutocompleteView.as_view(), name='api_teacher_autocomplete'),
+    path('api/schedules/<int:schedule_id>/availability/', ScheduleAvailabilityView.as_view(),
+         name='api_schedule_availability'),
+    path('metrics', metrics_view, name='metrics'),
+    path('profiles/', profile_list_view, name='profiles'),
+    path('profiles/<str:profile_id>/', profile_report_view, name='profile_report'),
+    path('profiles/<str:profile_id>.prof', profile_download_view, name='profile_download')
 ]
\ No newline at end of file
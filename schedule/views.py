@@ -2,17 +2,41 @@ from django.http import JsonResponse
 from django.views.generic import ListView, TemplateView
 from django.shortcuts import redirect, render, get_object_or_404
 from django.core.exceptions import ValidationError
-from .models import Schedule, RoleAssignment, ClassRole, Teacher
+from .models import Schedule, RoleAssignment, ClassRole, Teacher, Department, TeacherWorkload
 from django.urls import reverse
 from django.http import HttpResponseRedirect
 from django.forms.models import model_to_dict
-import pandas as pd
-from functools import reduce
+from django.utils.functional import cached_property, SimpleLazyObject
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
 from collections import defaultdict
-from django.db.models import Q
+from datetime import datetime, timezone as dt_timezone
+from urllib.parse import urlencode
+import hashlib
+import json
+from .sheets import build_sheet, schedule_column, role_column
+from .registry import get_registry
+from .teachers import get_teacher_index
+from .assignments import create_role_assignments
+from .roster import solve_roster
+from .workloads import month_of
+from .metrics import timed
+from .fragments import (fragment_key, page_versions, last_modified, ALL_DEPARTMENTS,
+                        FRAGMENT_CACHE_TIMEOUT)
+from .windows import (KEYSET_PAGE_SIZE, get_date_window, get_adjacent_terms, decode_cursor,
+                      paginate_keyset)
+
+
+def get_pandas():
+    """
+    Imports pandas on first use: only the hymn class page needs it, and it takes a while to load.
+    """
+    import pandas as pd
+    pd.set_option('display.max_columns', 500)
+    pd.set_option('display.width', 500)
+    return pd
 
-pd.set_option('display.max_columns', 500)
-pd.set_option('display.width', 500)
 
 HYMN_CLASS = "詩頌"
 WORSHIP_CLASS = "崇拜"
@@ -30,101 +54,147 @@ SHINKOYASU = "新子安"
 ALL_RE_SCHEDULES = "宗教教育總表"
 
 
-def merge_querysets_by_date(dataframes):
+def materialize_schedules(schedules):
     """
-    Merges a list of DataFrames on the 'date' column. Skips DataFrames that do not have a 'date' column.
+    Turns a page of schedules (loaded with select_related('department')) into plain rows for the templates,
+    with the role assignments of every schedule fetched in one extra query.
 
-    :param dataframes: A list of Pandas DataFrames
-    :return: A merged DataFrame
+    :param schedules: A list of Schedule objects
+    :return: A list of dictionaries with the schedule fields, the department name and an ordered
+             list of (role name, person name) pairs under 'role_assignments'
+    """
+    role_assignments = defaultdict(list)
+    for schedule_id, role_name, person_name in RoleAssignment.objects.filter(
+        schedule__in=schedules
+    ).order_by('schedule_id', 'role_id', 'id').values_list('schedule_id', 'role__name', 'person__name'):
+        role_assignments[schedule_id].append((role_name, person_name or ''))
+
+    return [
+        {
+            'id': schedule.id,
+            'date': schedule.date,
+            'start_time': schedule.start_time,
+            'end_time': schedule.end_time,
+            'department': schedule.department.name,
+            'class_type': schedule.class_type,
+            'role_assignments': role_assignments[schedule.id],
+        }
+        for schedule in schedules
+    ]
+
+
+class DateWindowMixin:
+    """
+    Restricts a schedule page to the ?from=/&to= date window (the current term by default)
+    and passes the window and the previous/next terms to the template.
     """
-    # Filter DataFrames to include only those with a 'date' column
-    valid_dataframes = [df for df in dataframes if 'date' in df.columns]
 
-    if not valid_dataframes:
-        raise ValueError("No DataFrames with a 'date' column were provided.")
+    @cached_property
+    def date_window(self):
+        return get_date_window(self.request)
 
-    # Merge the valid DataFrames on the 'date' column
-    result = reduce(lambda left, right: pd.merge(left, right, on='date', how='outer'), valid_dataframes)
-    return result
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['date_from'], context['date_to'] = self.date_window
+        context['previous_term'], context['next_term'] = get_adjacent_terms(*self.date_window)
+        return context
 
 
-def get_role_assignments(class_type, department_name, role_name, column_name, value_field='person__name'):
+class ConditionalGetMixin:
     """
-    Fetches role assignments filtered by class type, department, and role,
-    and returns a DataFrame with renamed columns.
-
-    :param class_type: The class type (single value or list of values) to filter (e.g., WORSHIP_CLASS or ['詩頌', '共習'])
-    :param department_name: The name of the department to filter (e.g., KINDERGARTEN)
-    :param role_name: The name of the role to filter (e.g., '老師', '司琴', etc.)
-    :param column_name: The new column name for the extracted value
-    :param value_field: The field to retrieve as value (default: 'person__name')
-    :return: A DataFrame with date and the specified value field
+    Answers conditional GETs with 304 Not Modified when no schedule of the page's departments changed,
+    using ETag and Last-Modified headers derived from their version stamps (see schedule.fragments).
+    The check runs before the view itself, so an unchanged page costs no query at all.
+    The pages embed the CSRF token and the controls of the current user, so the ETag also covers the user
+    and the session and CSRF cookies, and Last-Modified is only sent to visitors without them.
+    Requires DateWindowMixin.
     """
-    filter_kwargs = {
-        'schedule__department__name': department_name,
-        'role__name': role_name
-    }
+    page_departments = [ALL_DEPARTMENTS]
 
-    # Handle single or multiple class types
-    if isinstance(class_type, list):
-        filter_kwargs['schedule__class_type__in'] = class_type
-    else:
-        filter_kwargs['schedule__class_type'] = class_type
+    @cached_property
+    def versions(self):
+        return page_versions(self.page_departments)
 
-    role_assignments = RoleAssignment.objects.filter(
-        **filter_kwargs
-    ).order_by('schedule__date').values('schedule__date', value_field)
+    def get_identity(self, request):
+        """
+        Returns what the page depends on besides the schedules: the user and the session and CSRF cookies.
+        """
+        return [
+            str(request.user.pk or ''),
+            request.COOKIES.get(settings.SESSION_COOKIE_NAME, ''),
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        ]
 
-    result_df = pd.DataFrame(role_assignments).rename(columns={'schedule__date': 'date', value_field: column_name})
+    def get_etag(self, request, *args, **kwargs):
+        # The default date window depends on today's date, so it is part of the tag as well.
+        raw_etag = '|'.join([request.get_full_path(), *map(str, self.date_window), *self.versions,
+                             *self.get_identity(request)])
+        return hashlib.md5(raw_etag.encode()).hexdigest()
 
-    return result_df
+    def get_last_modified(self, request, *args, **kwargs):
+        # A date alone cannot tell two users apart.
+        if any(self.get_identity(request)):
+            return None
+        return datetime.fromtimestamp(last_modified(self.versions), tz=dt_timezone.utc)
 
+    def dispatch(self, request, *args, **kwargs):
+        response = condition(
+            etag_func=self.get_etag, last_modified_func=self.get_last_modified
+        )(super().dispatch)(request, *args, **kwargs)
+        patch_vary_headers(response, ['Cookie'])
+        return response
 
-def get_schedule_topics(class_types, department_name, column_name, include_hymn_number=False, include_unit_number=False):
+
+class FragmentCacheMixin:
     """
-    Fetches schedules filtered by class type(s) and department and returns a DataFrame with renamed columns.
-
-    :param class_types: A single class type or a list of class types to filter (e.g., WORSHIP_CLASS, ACTIVITY_CLASS, or ['詩頌', '共習'])
-    :param department_name: The name of the department to filter (e.g., PRE_KINDERGARTEN)
-    :param column_name: The new column name for the topic
-    :param include_hymn_number: Whether to include hymn_number in the DataFrame
-    :param unit_number_column_name: The new column name for the unit_number field (optional)
-    :return: A DataFrame with date, topic, hymn_number, and optionally unit_number columns
+    Passes a 'fragment_key' to the template, under which it caches its rendered table with {% cache %}.
+    The key covers the departments, class types and date window of the page and changes whenever a
+    schedule in that scope changes (see schedule.fragments), so the rows should be handed to the
+    template lazily and are only built on a cache miss.
+    Requires DateWindowMixin.
     """
-    filter_kwargs = {
-        'department__name': department_name
-    }
-
-    # Handle single or multiple class types
-    if isinstance(class_types, list):
-        filter_kwargs['class_type__in'] = class_types
-    else:
-        filter_kwargs['class_type'] = class_types
+    page_departments = []
+    fragment_class_types = []
 
-    # Fetch schedules
-    schedules = Schedule.objects.filter(**filter_kwargs).order_by('date').values('date', 'topic', 'hymn_number', 'unit_number')
-    df = pd.DataFrame(schedules).rename(columns={'topic': column_name})
-
-    # Replace NaN with an empty string for hymn_number
-    df['hymn_number'] = df['hymn_number'].fillna('')
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['fragment_key'] = fragment_key(
+            self.__class__.__name__, self.page_departments, self.fragment_class_types, *self.date_window
+        )
+        context['fragment_timeout'] = FRAGMENT_CACHE_TIMEOUT
+        return context
 
-    # Convert numeric values in hymn_number to integers where possible
-    df['hymn_number'] = df['hymn_number'].apply(
-        lambda x: int(x) if isinstance(x, float) and not pd.isnull(x) else x
-    )
+    def get_template_names(self):
+        # ListView inspects object_list to derive a default template name, which would build the lazy rows.
+        return [self.template_name]
 
-    # Rename the unit_number column if a new name is provided
-    if not include_unit_number:
-        df = df.drop(columns=['unit_number'], errors='ignore')
 
-    # Remove hymn_number column if include_hymn_number is False
-    if not include_hymn_number:
-        df = df.drop(columns=['hymn_number'], errors='ignore')
+class KeysetPaginationMixin:
+    """
+    Paginates a Schedule queryset on (date, start_time, id) with the ?after=/?before= cursors
+    and passes the previous/next page cursors to the template.
+    """
+    page_size = KEYSET_PAGE_SIZE
+    previous_cursor = None
+    next_cursor = None
+
+    def paginate_schedules(self, queryset):
+        schedules, self.previous_cursor, self.next_cursor = paginate_keyset(
+            queryset,
+            after=decode_cursor(self.request.GET.get('after')),
+            before=decode_cursor(self.request.GET.get('before')),
+            page_size=self.page_size,
+        )
+        return schedules
 
-    return df
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['previous_cursor'] = self.previous_cursor
+        context['next_cursor'] = self.next_cursor
+        return context
 
 
-class AllSchedulesView(ListView):
+class AllSchedulesView(ConditionalGetMixin, KeysetPaginationMixin, DateWindowMixin, ListView):
     """
     View to display all schedules regardless of department and handle role assignments.
     """
@@ -133,7 +203,10 @@ class AllSchedulesView(ListView):
     context_object_name = 'schedules'
 
     def get_queryset(self):
-        return Schedule.objects.all().order_by('date', 'start_time')
+        schedules = self.paginate_schedules(
+            Schedule.objects.filter(date__range=self.date_window).select_related('department')
+        )
+        return materialize_schedules(schedules)
 
     def post(self, request, *args, **kwargs):
         # Handle role assignment here
@@ -152,7 +225,7 @@ class AllSchedulesView(ListView):
         return redirect('all_schedules')  # Redirect to refresh the page
 
 
-class DepartmentScheduleView(ListView):
+class DepartmentScheduleView(ConditionalGetMixin, KeysetPaginationMixin, DateWindowMixin, ListView):
     """
     View to display schedules filtered by department and handle role assignments.
     """
@@ -160,10 +233,19 @@ class DepartmentScheduleView(ListView):
     template_name = 'schedule/department_schedules.html'
     context_object_name = 'schedules'
 
+    @property
+    def page_departments(self):
+        return [self.kwargs.get('department_name')]
+
     def get_queryset(self):
         department_name = self.kwargs.get('department_name')
 
-        return Schedule.objects.filter(department__name=department_name).order_by('date', 'start_time')
+        schedules = self.paginate_schedules(
+            Schedule.objects.filter(
+                department_id=get_registry().id(Department, department_name), date__range=self.date_window
+            ).select_related('department')
+        )
+        return materialize_schedules(schedules)
 
     def post(self, request, *args, **kwargs):
         schedule_id = request.POST.get('schedule')
@@ -193,64 +275,48 @@ class DepartmentScheduleView(ListView):
         department_name = self.kwargs.get('department_name')
 
         # Add dropdown data
-        context['schedules'] = Schedule.objects.filter(department__name=department_name)
-        context['roles'] = ClassRole.objects.all()
-        context['persons'] = Teacher.objects.all()
+        registry = get_registry()
+        context['schedule_options'] = Schedule.objects.filter(
+            department_id=registry.id(Department, department_name), date__range=self.date_window
+        ).select_related('department').order_by('date', 'start_time')
+        context['roles'] = registry.objects(ClassRole)
         context['department_name'] = department_name
 
         return context
 
 # Here is my HymnClassesView.
-class HymnClassesView(ListView):
+class HymnClassesView(ConditionalGetMixin, FragmentCacheMixin, DateWindowMixin, ListView):
     """
     View to display schedules filtered by department and handle role assignments.
     """
     model = Schedule
     template_name = 'schedule/hymn_class_schedules.html'
-    context_object_name = 'schedules'
+    context_object_name = 'hymn_schedules'
+    page_departments = [KINDERGARTEN, ELEMENTARY_1, ELEMENTARY_1_CN_JP, ELEMENTARY_2]
+    fragment_class_types = [HYMN_CLASS]
+
+    # The flat columns fetched for every (hymn schedule, role assignment) pair.
+    PIVOT_COLUMNS = ['date', 'department', 'hymn_type', 'hymn_number', 'hymn_topic', 'role', 'person']
+
+    @timed('pandas')
+    def pivot_schedules(self, rows):
+        """
+        Pivots flat (date, department, hymn_type, hymn_number, hymn_topic, role, person) tuples
+        into one row per schedule with one column per role.
+        Schedules without role assignments come in with role and person set to None.
+        """
+        pd = get_pandas()
 
-    def pivot_schedules(self, schedules):
-        # Initialize a list to hold rows for the DataFrame
-        rows = []
-
-        # Loop through schedules and their role assignments
-        for schedule in schedules:
-            if not schedule.role_assignments.exists():  # Handle schedules without role assignments
-                row = {
-                    'date': schedule.date,
-                    'department': schedule.department.name,
-                    'hymn_type': schedule.hymn_type.name if schedule.hymn_type else '',
-                    'hymn_number': schedule.hymn_number,
-                    'hymn_topic': schedule.topic,
-                    'role': '',
-                    'person': '',
-                }
-                rows.append(row)
-            else:
-                for role_assignment in schedule.role_assignments.all():
-                    row = {
-                        'date': schedule.date,
-                        'department': schedule.department.name,
-                        'hymn_type': schedule.hymn_type.name if schedule.hymn_type else '',
-                        'hymn_number': schedule.hymn_number,
-                        'hymn_topic': schedule.topic,
-                        'role': role_assignment.role.name if role_assignment.role else '',
-                        'person': role_assignment.person.name if role_assignment.person else '',
-                    }
-                    rows.append(row)
         # Check if rows list is empty
         if not rows:
             return pd.DataFrame()  # Return an empty DataFrame
 
-        # Convert the list of rows into a DataFrame
-        df = pd.DataFrame(rows)
+        # Keep the values as Python objects so that hymn numbers are not turned into floats.
+        df = pd.DataFrame(rows, columns=self.PIVOT_COLUMNS, dtype=object)
 
         # Replace '幼年班(中日文)' with '幼年班' in the 'department' column
         df['department'] = df['department'].replace('幼年班(中日文)', '幼年班')
 
-        if df.empty:  # Handle empty DataFrame case
-            return pd.DataFrame()
-
         # Replace NaN with empty strings.
         df = df.fillna('')
 
@@ -266,7 +332,9 @@ class HymnClassesView(ListView):
         result = result.rename_axis(None, axis=1)
         return result
 
-    def reshape_dateframe_to_fit_the_template_format(self, df: pd.DataFrame):
+    @timed('pandas')
+    def reshape_dateframe_to_fit_the_template_format(self, df: 'pd.DataFrame'):
+        pd = get_pandas()
         if df.empty:  # Check if DataFrame is empty
             return pd.DataFrame(columns=[
                 'date',
@@ -314,24 +382,32 @@ class HymnClassesView(ListView):
         final_df = final_df.fillna('')
         return final_df
 
-    def get_queryset(self):
-
+    @cached_property
+    def hymn_schedules(self):
         """
         Process and group hymn class schedules into a list of dictionaries
         containing relevant details.
-        """
-        # Fetch schedules with related RoleAssignments, Roles, and Persons
-        hymn_schedules = Schedule.objects.filter(
-            class_type=HYMN_CLASS
-        ).prefetch_related('role_assignments__role', 'role_assignments__person')
 
-        pivoted_schedules = self.pivot_schedules(hymn_schedules)
+        Everything is fetched as flat value tuples in a single query (schedules without
+        role assignments are kept by the LEFT OUTER JOIN), and the result is memoized for
+        the lifetime of the request.
+        """
+        rows = list(Schedule.objects.filter(
+            class_type=HYMN_CLASS, date__range=self.date_window
+        ).values_list(
+            'date', 'department__name', 'hymn_type__name', 'hymn_number', 'topic',
+            'role_assignments__role__name', 'role_assignments__person__name'
+        ))
+
+        pivoted_schedules = self.pivot_schedules(rows)
         reformatted_df = self.reshape_dateframe_to_fit_the_template_format(pivoted_schedules)
 
         # Convert DataFrame to list of dictionaries
-        reformatted_list = reformatted_df.to_dict(orient='records')
-        return reformatted_list
+        return reformatted_df.to_dict(orient='records')
 
+    def get_queryset(self):
+        # Built only if the template's cached table is missing.
+        return SimpleLazyObject(lambda: self.hymn_schedules)
 
     def post(self, request, *args, **kwargs):
         schedule_id = request.POST.get('schedule')
@@ -358,69 +434,45 @@ class HymnClassesView(ListView):
 
     def get_context_data(self, **kwargs):
         """
-        Pass two separate querysets for different department groups to the template.
+        Pass the pivoted hymn schedules and the dropdown data for the assign-role modal to the template.
         """
         context = super().get_context_data(**kwargs)
-        context['hymn_schedules'] = self.get_queryset()
-        context['schedules'] = Schedule.objects.filter(class_type=HYMN_CLASS).order_by('date')
+        registry = get_registry()
+        # Only the departments of the page, whose version stamps make up its ETag.
+        context['schedule_options'] = Schedule.objects.filter(
+            department_id__in=registry.ids(Department, self.page_departments), class_type=HYMN_CLASS,
+            date__range=self.date_window
+        ).select_related('department').order_by('date')
 
         # Definal the specific class roles you want to include in the dropdown.
         allowed_roles = ['主領', '司琴', '助教']
-        context['roles'] = ClassRole.objects.filter(name__in=allowed_roles)
-        context['persons'] = Teacher.objects.all()
+        context['roles'] = registry.objects(ClassRole, allowed_roles)
 
         return context
 
 
 # Here is the view I have been developing so far. I wonder how to redirect to the page where I made the post request instead of \
 # returning JSON responses, which are not user-friendly.
-class PreKindergartenSchedulesView(ListView):
+class PreKindergartenSchedulesView(ConditionalGetMixin, FragmentCacheMixin, DateWindowMixin, ListView):
     template_name = 'schedule/pre_kindergarten_schedules.html'
     context_object_name = 'schedules'
 
-    def get_queryset(self):
-
-        combined_queryset = Schedule.objects.filter(
-            Q(class_type='崇拜') | Q(class_type='共習')
-        ).order_by('date').values('date', 'class_type', 'topic')
-
-        role_assignments = RoleAssignment.objects.filter(
-            role__name__in=['講師', '助教1', '助教2']
-        ).order_by('schedule__date').values('schedule__date', 'role__name', 'person__name')
-
-        schedule_df = pd.DataFrame(combined_queryset)
-        roles_df = pd.DataFrame(role_assignments)
+    columns = [
+        schedule_column('worship_topic', WORSHIP_CLASS),
+        schedule_column('activity_topic', ACTIVITY_CLASS),
+        role_column('講師', [WORSHIP_CLASS, ACTIVITY_CLASS], '講師'),
+        role_column('助教1', [WORSHIP_CLASS, ACTIVITY_CLASS], '助教1'),
+        role_column('助教2', [WORSHIP_CLASS, ACTIVITY_CLASS], '助教2'),
+    ]
+    page_departments = [PRE_KINDERGARTEN]
+    fragment_class_types = [WORSHIP_CLASS, ACTIVITY_CLASS]
 
-        result = defaultdict(lambda: {
-            'date': '',
-            'worship_topic': '',
-            'activity_topic': '',
-            '講師': '',
-            '助教1': '',
-            '助教2': ''
-        })
-
-        for _, row in schedule_df.iterrows():
-            date = row['date']
-            class_type = row['class_type']
-            topic = row['topic']
-
-            result[date]['date'] = date
-            if class_type == '崇拜':
-                result[date]['worship_topic'] = topic
-            elif class_type == '共習':
-                result[date]['activity_topic'] = topic
-
-        for _, row in roles_df.iterrows():
-            date = row['schedule__date']
-            role = row['role__name']
-            person_name = row['person__name']
-
-            if role in result[date]:
-                result[date][role] = person_name
-
-        formatted_result = list(result.values())
-        return formatted_result
+    def get_queryset(self):
+        """
+        Builds one row per date of the pre-kindergarten sheet for the requested date window,
+        in a single query scoped to the department (see schedule.sheets).
+        """
+        return SimpleLazyObject(lambda: build_sheet(PRE_KINDERGARTEN, self.columns, *self.date_window))
 
     def post(self, request, *args, **kwargs):
         schedule_id = request.POST.get('schedule')
@@ -447,229 +499,259 @@ class PreKindergartenSchedulesView(ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['schedule_options'] = Schedule.objects.filter(department__name = PRE_KINDERGARTEN)
-        context['roles'] = ClassRole.objects.filter(name__in=['講師', '助教1', '助教2'])
-        context['teachers'] = Teacher.objects.all()
+        registry = get_registry()
+        context['schedule_options'] = Schedule.objects.filter(
+            department_id=registry.id(Department, PRE_KINDERGARTEN), date__range=self.date_window
+        ).select_related('department').order_by('date', 'start_time')
+        context['roles'] = registry.objects(ClassRole, ['講師', '助教1', '助教2'])
         return context
 
 
-class KindergartenSchedulesView(TemplateView):
+class DepartmentSheetView(ConditionalGetMixin, FragmentCacheMixin, DateWindowMixin, TemplateView):
     """
-    A custom view for rendering schedules and role assignments in a format suitable for kindergarten classes.
+    Base view for the department sheets. Subclasses declare the department and the sheet
+    columns, and the sheet of the requested date window is fetched in a single query (see schedule.sheets)
+    when its rendered table is not cached.
     """
-    template_name = 'schedule/kindergarten_schedules.html'
+    department_name = None
+    columns = []
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-
-        # # Fetch schedules and convert them to DataFrames
-        # hymn_topic_df = get_schedule_topics(HYMN_CLASS, KINDERGARTEN, 'hymn_topic', include_hymn_number=True)
-        # worship_topic_df = get_schedule_topics(WORSHIP_CLASS, KINDERGARTEN, 'worship_topic', False, True)
-        # # Drop hymn_number column from worship_topic_df DataFrame.
-        # activity_topic_df = get_schedule_topics(ACTIVITY_CLASS, KINDERGARTEN, 'activity_topic')
-
-        # # Fetch role assignments and convert them to DataFrames
-        # hymn_teachers_df = get_role_assignments(HYMN_CLASS, KINDERGARTEN, '老師', 'hymn_teacher')
-        # hymn_pianists_df = get_role_assignments(HYMN_CLASS, KINDERGARTEN, '司琴', 'hymn_pianist')
-        # hymn_assistants_df = get_role_assignments(HYMN_CLASS, KINDERGARTEN, '助教1', 'hymn_assistant')
-        # worship_teachers_df = get_role_assignments(WORSHIP_CLASS, KINDERGARTEN, '老師', 'worship_teacher')
-        # activity_assistants_df = get_role_assignments(ACTIVITY_CLASS, KINDERGARTEN, '助教1', 'activity_assistant')
-
-        # result_df = merge_querysets_by_date([hymn_topic_df, hymn_teachers_df, hymn_pianists_df, hymn_assistants_df,
-        #                                      worship_topic_df, worship_teachers_df,
-        #                                      activity_topic_df, activity_assistants_df])
-        # context['schedules'] = result_df.to_dict(orient='records')
-        return context
+    @property
+    def page_departments(self):
+        return [self.department_name]
 
-class Elementary1SchedulesView(TemplateView):
-
-    template_name = 'schedule/elementary_1_schedules.html'
+    @property
+    def fragment_class_types(self):
+        return sorted({class_type for column in self.columns for class_type in column.class_types})
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-
-        # # Fetch schedules and convert them to DataFrames
-        # worship_topic_df = get_schedule_topics(WORSHIP_CLASS, ELEMENTARY_1, 'worship_topic', include_hymn_number=True, include_unit_number=True)
-        # worship_topic_df.rename(columns={'hymn_number': 'worship_hymn_number'}, inplace=True)
-        # hymn_activity_topic_df = get_schedule_topics(class_types=[HYMN_CLASS, ACTIVITY_CLASS], department_name=ELEMENTARY_1, column_name='hymn_activity_topic', include_hymn_number=True)
-        # hymn_activity_topic_df.rename(columns={'hymn_number': 'hymn_hymn_number'}, inplace=True)
-
-        # hymn_activity_class_types_df = get_role_assignments(class_type=[HYMN_CLASS, ACTIVITY_CLASS], department_name=ELEMENTARY_1, role_name='講師', column_name='class_type', value_field='schedule__class_type')
-
-        # # Fetch role assignments and convert them to DataFrames
-        # worship_teachers_df = get_role_assignments(WORSHIP_CLASS, ELEMENTARY_1, '講師', 'worship_teacher')
-        # worship_assistants_df = get_role_assignments(WORSHIP_CLASS, ELEMENTARY_1, '助教1', 'worship_assistant')
-        # worship_disciplinarians_df = get_role_assignments(WORSHIP_CLASS, ELEMENTARY_1, '秩序管理', 'worship_disciplinarian')
-        # worship_pianists_df = get_role_assignments(WORSHIP_CLASS, ELEMENTARY_1, '司琴', 'worship_pianist')
-        # hymn_activity_teachers_df = get_role_assignments(class_type=[HYMN_CLASS, ACTIVITY_CLASS], department_name=ELEMENTARY_1, role_name='講師', column_name='hymn_acitivity_teacher')
-        # hymn_activity_pianists_df = get_role_assignments(class_type=[HYMN_CLASS, ACTIVITY_CLASS], department_name=ELEMENTARY_1, role_name='司琴', column_name='hymn_activity_pianist')
-
-        # result_df = merge_querysets_by_date([worship_topic_df, worship_teachers_df, worship_assistants_df, worship_disciplinarians_df, worship_pianists_df,
-        #                                      hymn_activity_class_types_df, hymn_activity_topic_df, hymn_activity_teachers_df, hymn_activity_pianists_df])
-
-        # # Replace NaN with empty strings.
-        # result_df.fillna('', inplace=True)
-
-        # context['schedules'] = result_df.to_dict(orient='records')
+        context['schedules'] = SimpleLazyObject(
+            lambda: build_sheet(self.department_name, self.columns, *self.date_window)
+        )
         return context
 
 
-class Elementary1CNJPSchedulesView(TemplateView):
-
-    template_name = 'schedule/elementary_1_cn_jp_schedules.html'
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-
-        # # Fetch schedules and convert them to DataFrames
-        # worship_topic_df = get_schedule_topics(WORSHIP_CLASS, ELEMENTARY_1_CN_JP, 'worship_topic', include_hymn_number=True, include_unit_number=True)
-        # worship_topic_df.rename(columns={'hymn_number': 'worship_hymn_number'}, inplace=True)
-        # hymn_activity_topic_df = get_schedule_topics(class_types=[HYMN_CLASS, ACTIVITY_CLASS], department_name=ELEMENTARY_1_CN_JP, column_name='hymn_activity_topic', include_hymn_number=True)
-        # hymn_activity_topic_df.rename(columns={'hymn_number': 'hymn_hymn_number'}, inplace=True)
-
-        # hymn_activity_class_types_df = get_role_assignments(class_type=[HYMN_CLASS, ACTIVITY_CLASS], department_name=ELEMENTARY_1_CN_JP, role_name='講師', column_name='class_type', value_field='schedule__class_type')
-
-        # # Fetch role assignments and convert them to DataFrames
-        # worship_teachers_df = get_role_assignments(WORSHIP_CLASS, ELEMENTARY_1_CN_JP, '講師', 'worship_teacher')
-        # worship_assistants_df = get_role_assignments(WORSHIP_CLASS, ELEMENTARY_1_CN_JP, '助教1', 'worship_assistant')
-        # worship_disciplinarians_df = get_role_assignments(WORSHIP_CLASS, ELEMENTARY_1_CN_JP, '秩序管理', 'worship_disciplinarian')
-        # worship_pianists_df = get_role_assignments(WORSHIP_CLASS, ELEMENTARY_1_CN_JP, '司琴', 'worship_pianist')
-        # hymn_activity_teachers_df = get_role_assignments(class_type=[HYMN_CLASS, ACTIVITY_CLASS], department_name=ELEMENTARY_1_CN_JP, role_name='講師', column_name='hymn_acitivity_teacher')
-        # hymn_activity_pianists_df = get_role_assignments(class_type=[HYMN_CLASS, ACTIVITY_CLASS], department_name=ELEMENTARY_1_CN_JP, role_name='司琴', column_name='hymn_activity_pianist')
-
-        # result_df = merge_querysets_by_date([worship_topic_df, worship_teachers_df, worship_assistants_df, worship_disciplinarians_df, worship_pianists_df,
-        #                                      hymn_activity_class_types_df, hymn_activity_topic_df, hymn_activity_teachers_df, hymn_activity_pianists_df])
+class KindergartenSchedulesView(DepartmentSheetView):
+    """
+    A custom view for rendering schedules and role assignments in a format suitable for kindergarten classes.
+    """
+    template_name = 'schedule/kindergarten_schedules.html'
+    department_name = KINDERGARTEN
+    columns = [
+        schedule_column('hymn_topic', HYMN_CLASS),
+        schedule_column('hymn_number', HYMN_CLASS, field='hymn_number'),
+        schedule_column('worship_topic', WORSHIP_CLASS),
+        schedule_column('unit_number', WORSHIP_CLASS, field='unit_number'),
+        schedule_column('activity_topic', ACTIVITY_CLASS),
+        role_column('hymn_teacher', HYMN_CLASS, '老師'),
+        role_column('hymn_pianist', HYMN_CLASS, '司琴'),
+        role_column('hymn_assistant', HYMN_CLASS, '助教1'),
+        role_column('worship_teacher', WORSHIP_CLASS, '老師'),
+        role_column('activity_assistant', ACTIVITY_CLASS, '助教1'),
+    ]
+
+
+class Elementary1SchedulesView(DepartmentSheetView):
 
-        # # Replace NaN with empty strings.
-        # result_df.fillna('', inplace=True)
+    template_name = 'schedule/elementary_1_schedules.html'
+    department_name = ELEMENTARY_1
+    columns = [
+        schedule_column('worship_topic', WORSHIP_CLASS),
+        schedule_column('unit_number', WORSHIP_CLASS, field='unit_number'),
+        schedule_column('worship_hymn_number', WORSHIP_CLASS, field='hymn_number'),
+        schedule_column('class_type', [HYMN_CLASS, ACTIVITY_CLASS], field='class_type'),
+        schedule_column('hymn_activity_topic', [HYMN_CLASS, ACTIVITY_CLASS]),
+        schedule_column('hymn_hymn_number', [HYMN_CLASS, ACTIVITY_CLASS], field='hymn_number'),
+        role_column('worship_teacher', WORSHIP_CLASS, '講師'),
+        role_column('worship_assistant', WORSHIP_CLASS, '助教1'),
+        role_column('worship_disciplinarian', WORSHIP_CLASS, '秩序管理'),
+        role_column('worship_pianist', WORSHIP_CLASS, '司琴'),
+        role_column('hymn_activity_teacher', [HYMN_CLASS, ACTIVITY_CLASS], '講師'),
+        role_column('hymn_activity_pianist', [HYMN_CLASS, ACTIVITY_CLASS], '司琴'),
+    ]
+
+
+class Elementary1CNJPSchedulesView(Elementary1SchedulesView):
 
-        # context['schedules'] = result_df.to_dict(orient='records')
-        return context
+    template_name = 'schedule/elementary_1_cn_jp_schedules.html'
+    department_name = ELEMENTARY_1_CN_JP
 
 
-class Elementary2SchedulesView(TemplateView):
+class Elementary2SchedulesView(DepartmentSheetView):
 
     template_name = 'schedule/elementary_2_schedules.html'
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-
-        # # Fetch schedules and convert them to DataFrames
-        # worship_topic_df = get_schedule_topics(WORSHIP_CLASS, ELEMENTARY_2, 'worship_topic', include_hymn_number=True, include_unit_number=True)
-        # worship_topic_df.rename(columns={'hymn_number': 'worship_hymn_number'}, inplace=True)
-        # hymn_activity_topic_df = get_schedule_topics(class_types=[HYMN_CLASS, ACTIVITY_CLASS], department_name=ELEMENTARY_2, column_name='hymn_activity_topic')
-
-        # hymn_activity_class_types_df = get_role_assignments(class_type=[HYMN_CLASS, ACTIVITY_CLASS], department_name=ELEMENTARY_2, role_name='講師', column_name='class_type', value_field='schedule__class_type')
-
-        # # Fetch role assignments and convert them to DataFrames
-        # worship_teachers_df = get_role_assignments(WORSHIP_CLASS, ELEMENTARY_2, '講師', 'worship_teacher')
-        # worship_assistants_df = get_role_assignments(WORSHIP_CLASS, ELEMENTARY_2, '助教1', 'worship_assistant')
-        # worship_disciplinarians_df = get_role_assignments(WORSHIP_CLASS, ELEMENTARY_2, '秩序管理', 'worship_disciplinarian')
-        # hymn_activity_teachers_df = get_role_assignments(class_type=[HYMN_CLASS, ACTIVITY_CLASS], department_name=ELEMENTARY_2, role_name='講師', column_name='hymn_activity_teacher')
-        # hymn_activity_pianists_df = get_role_assignments(class_type=[HYMN_CLASS, ACTIVITY_CLASS], department_name=ELEMENTARY_2, role_name='司琴', column_name='hymn_activity_pianist')
-
-        # result_df = merge_querysets_by_date([worship_topic_df, worship_teachers_df, worship_assistants_df, worship_disciplinarians_df,
-        #                                      hymn_activity_class_types_df, hymn_activity_topic_df, hymn_activity_teachers_df, hymn_activity_pianists_df])
-
-        # # Replace NaN with empty strings.
-        # result_df.fillna('', inplace=True)
-
-        # context['schedules'] = result_df.to_dict(orient='records')
-        return context
-
-
-class JuniorSchedulesView(TemplateView):
+    department_name = ELEMENTARY_2
+    columns = [
+        schedule_column('worship_topic', WORSHIP_CLASS),
+        schedule_column('unit_number', WORSHIP_CLASS, field='unit_number'),
+        schedule_column('worship_hymn_number', WORSHIP_CLASS, field='hymn_number'),
+        schedule_column('class_type', [HYMN_CLASS, ACTIVITY_CLASS], field='class_type'),
+        schedule_column('hymn_activity_topic', [HYMN_CLASS, ACTIVITY_CLASS]),
+        role_column('worship_teacher', WORSHIP_CLASS, '講師'),
+        role_column('worship_assistant', WORSHIP_CLASS, '助教1'),
+        role_column('worship_disciplinarian', WORSHIP_CLASS, '秩序管理'),
+        role_column('hymn_activity_teacher', [HYMN_CLASS, ACTIVITY_CLASS], '講師'),
+        role_column('hymn_activity_pianist', [HYMN_CLASS, ACTIVITY_CLASS], '司琴'),
+    ]
+
+
+class JuniorSchedulesView(DepartmentSheetView):
 
     template_name = 'schedule/junior_schedules.html'
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-
-        # # Fetch schedules and convert them to DataFrames
-        # worship_topic_df = get_schedule_topics(WORSHIP_CLASS, JUNIOR, 'worship_topic', include_hymn_number=True, include_unit_number=True)
-        # worship_topic_df.rename(columns={'hymn_number': 'worship_hymn_number'}, inplace=True)
-
-        # activity_topic_df = get_schedule_topics(class_types=ACTIVITY_CLASS, department_name=JUNIOR, column_name='activity_topic')
-
-        # # Fetch role assignments and convert them to DataFrames
-        # worship_teachers_df = get_role_assignments(WORSHIP_CLASS, JUNIOR, '講師', 'worship_teacher')
-        # worship_assistants_df = get_role_assignments(WORSHIP_CLASS, JUNIOR, '助教1', 'worship_assistant')
-        # worship_pianists_df = get_role_assignments(WORSHIP_CLASS, JUNIOR, '司琴', 'worship_pianist')
-        # activity_teachers_df = get_role_assignments(class_type=[HYMN_CLASS, ACTIVITY_CLASS], department_name=JUNIOR, role_name='講師', column_name='activity_teacher')
-
-        # result_df = merge_querysets_by_date([worship_topic_df, worship_teachers_df, worship_assistants_df, worship_pianists_df,
-        #                                      activity_topic_df, activity_teachers_df])
-        # # Replace NaN with empty strings.
-        # result_df.fillna('', inplace=True)
-
-        # context['schedules'] = result_df.to_dict(orient='records')
-        return context
+    department_name = JUNIOR
+    columns = [
+        schedule_column('worship_topic', WORSHIP_CLASS),
+        schedule_column('unit_number', WORSHIP_CLASS, field='unit_number'),
+        schedule_column('worship_hymn_number', WORSHIP_CLASS, field='hymn_number'),
+        schedule_column('activity_topic', ACTIVITY_CLASS),
+        role_column('worship_teacher', WORSHIP_CLASS, '講師'),
+        role_column('worship_assistant', WORSHIP_CLASS, '助教1'),
+        role_column('worship_pianist', WORSHIP_CLASS, '司琴'),
+        role_column('activity_teacher', [HYMN_CLASS, ACTIVITY_CLASS], '講師'),
+    ]
 
 
-class JuniorJPSchedulesView(TemplateView):
+class JuniorJPSchedulesView(DepartmentSheetView):
 
     template_name = 'schedule/junior_jp_schedules.html'
+    department_name = JUNIOR_JP
+    columns = [
+        schedule_column('worship_topic', WORSHIP_CLASS),
+        schedule_column('unit_number', WORSHIP_CLASS, field='unit_number'),
+        schedule_column('worship_hymn_number', WORSHIP_CLASS, field='hymn_number'),
+        schedule_column('activity_topic', ACTIVITY_CLASS),
+        role_column('worship_teacher', WORSHIP_CLASS, '講師'),
+        role_column('activity_teacher', [HYMN_CLASS, ACTIVITY_CLASS], '講師'),
+    ]
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
 
-        # # Fetch schedules and convert them to DataFrames
-        # worship_topic_df = get_schedule_topics(WORSHIP_CLASS, JUNIOR_JP, 'worship_topic', include_hymn_number=True, include_unit_number=True)
-        # worship_topic_df.rename(columns={'hymn_number': 'worship_hymn_number'}, inplace=True)
+class PianicaSchedulesView(DepartmentSheetView):
 
-        # activity_topic_df = get_schedule_topics(class_types=ACTIVITY_CLASS, department_name=JUNIOR_JP, column_name='activity_topic')
+    template_name = 'schedule/pianica_schedules.html'
+    department_name = PIANICA
+    columns = [
+        schedule_column('class_type', [PIANICA_CLASS, HYMN_CLASS], field='class_type'),
+        schedule_column('hymn_type', [PIANICA_CLASS, HYMN_CLASS], field='hymn_type__name'),
+        schedule_column('topic', [PIANICA_CLASS, HYMN_CLASS]),
+        role_column('pianica_teacher', [PIANICA_CLASS, HYMN_CLASS], '老師'),
+        role_column('pianica_pianist', [PIANICA_CLASS, HYMN_CLASS], '司琴'),
+        role_column('pianica_assistant_1', [PIANICA_CLASS, HYMN_CLASS], '助教1'),
+        role_column('pianica_assistant_2', [PIANICA_CLASS, HYMN_CLASS], '助教2'),
+    ]
 
-        # # Fetch role assignments and convert them to DataFrames
-        # worship_teachers_df = get_role_assignments(WORSHIP_CLASS, JUNIOR_JP, '講師', 'worship_teacher')
-        # activity_teachers_df = get_role_assignments(class_type=[HYMN_CLASS, ACTIVITY_CLASS], department_name=JUNIOR_JP, role_name='講師', column_name='activity_teacher')
 
-        # result_df = merge_querysets_by_date([worship_topic_df, worship_teachers_df,
-        #                                      activity_topic_df, activity_teachers_df])
-        # # Replace NaN with empty strings.
-        # result_df.fillna('', inplace=True)
+class ShinkoyasuSchedulesView(DepartmentSheetView):
 
-        # context['schedules'] = result_df.to_dict(orient='records')
-        return context
+    template_name = 'schedule/shinkoyasu_schedules.html'
+    department_name = SHINKOYASU
+    columns = [
+        schedule_column('hymn_number', HYMN_CLASS, field='hymn_number'),
+        role_column('shinkoyasu_hymn_teacher', HYMN_CLASS, '老師'),
+        role_column('shinkoyasu_hymn_pianist', HYMN_CLASS, '司琴'),
+        role_column('shinkoyasu_worship_teacher', WORSHIP_CLASS, '老師'),
+        role_column('shinkoyasu_worship_assistant', WORSHIP_CLASS, '助教1'),
+    ]
 
-class PianicaSchedulesView(TemplateView):
 
-    template_name = 'schedule/pianica_schedules.html'
+def get_required_roles():
+    """
+    Returns the roles shown by the department sheets for each class type, as a
+    {(department name, class_type): [role names]} dictionary (see schedule.roster).
+    """
+    sheets = [(PRE_KINDERGARTEN, PreKindergartenSchedulesView.columns)]
+    pending = list(DepartmentSheetView.__subclasses__())
+    while pending:
+        view = pending.pop()
+        pending.extend(view.__subclasses__())
+        sheets.append((view.department_name, view.columns))
+
+    required_roles = defaultdict(list)
+    for department_name, columns in sheets:
+        for column in columns:
+            if column.role_name is None:
+                continue
+            for class_type in column.class_types:
+                if column.role_name not in required_roles[(department_name, class_type)]:
+                    required_roles[(department_name, class_type)].append(column.role_name)
+    return dict(required_roles)
+
+
+class RosterView(DateWindowMixin, TemplateView):
+    """
+    Previews the teachers proposed for the open roles of the date window (see schedule.roster)
+    and commits the previewed proposal in one go.
+    """
+    template_name = 'schedule/roster.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-
-        # pianica_topic_df = pd.DataFrame(Schedule.objects.filter(class_type__in=['口風琴', '詩頌'], department__name='口風琴班').values('date', 'class_type', 
-        # 'hymn_type__name','topic').order_by('date'))
-
-        # pianica_teachers_df = get_role_assignments(class_type=[PIANICA_CLASS, HYMN_CLASS], department_name=PIANICA, role_name='老師', column_name='pianica_teacher')
-        # pianica_pianists_df = get_role_assignments(class_type=[PIANICA_CLASS, HYMN_CLASS], department_name=PIANICA, role_name='司琴', column_name='pianica_pianist')
-        # pianica_assistants_1_df = get_role_assignments(class_type=[PIANICA_CLASS, HYMN_CLASS], department_name=PIANICA, role_name='助教1', column_name='pianica_assistant_1')
-        # pianica_assistatns_2_df = get_role_assignments(class_type=[PIANICA_CLASS, HYMN_CLASS], department_name=PIANICA, role_name='助教2', column_name='pianica_assistant_2')
-        # result_df = merge_querysets_by_date([pianica_topic_df, pianica_teachers_df, pianica_pianists_df,
-        #                                      pianica_assistants_1_df, pianica_assistatns_2_df])
-        # # Replace NaN with empty strings.
-        # result_df.fillna('', inplace=True)
-        # print(f"Result: \n{result_df}")
-        # context['schedules'] = result_df.to_dict(orient='records')
-        # print(result_df.to_dict(orient='records'))
+        roster = solve_roster(*self.date_window, get_required_roles())
+        teachers = get_teacher_index().entries
+        context['roster'] = roster
+        context['loads'] = sorted(
+            ((teachers[teacher_id].name, count) for teacher_id, count in roster.loads.items()
+             if count and teacher_id in teachers),
+            key=lambda load: (-load[1], load[0])
+        )
+        context['proposal'] = json.dumps([
+            {'schedule': assignment.schedule.id, 'role': assignment.role.id, 'person': assignment.teacher.id}
+            for assignment in roster.assignments
+        ])
         return context
 
+    def post(self, request, *args, **kwargs):
+        window = {'from': self.date_window[0], 'to': self.date_window[1]}
+        try:
+            rows = json.loads(request.POST.get('assignments', ''))
+        except ValueError:
+            rows = None
+        if not isinstance(rows, list) or not rows:
+            return HttpResponseRedirect(request.path + "?" + urlencode({**window, 'error': "Nothing to commit"}))
 
-class ShinkoyasuSchedulesView(TemplateView):
+        assignments, errors = create_role_assignments(rows)
+        if errors:
+            # The preview is stale, e.g. someone assigned one of its roles meanwhile; nothing was saved.
+            return HttpResponseRedirect(request.path + "?" + urlencode({**window, 'error': errors[0][1]}))
+        return HttpResponseRedirect(reverse('all_schedules') + "?" + urlencode(window))
 
-    template_name = 'schedule/shinkoyasu_schedules.html'
+
+class WorkloadReportView(DateWindowMixin, TemplateView):
+    """
+    Reports how many times, and for how long, every teacher served each role over the months of the date window,
+    optionally in a single department (?department=<name>).
+
+    The report reads the TeacherWorkload aggregate (see schedule.workloads), one row per teacher, month, role
+    and department, rather than the role assignments.
+    """
+    template_name = 'schedule/workloads.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # shinkoyasu_hymn_numbers_df = pd.DataFrame(Schedule.objects.filter(class_type=HYMN_CLASS, department__name='新子安').values('date', 'hymn_number').order_by('date'))
-        # shinkoyasu_hymn_teachers_df = get_role_assignments(HYMN_CLASS, SHINKOYASU, '老師', 'shinkoyasu_hymn_teacher')
-        # shinkoyasu_hymn_pianists_df = get_role_assignments(HYMN_CLASS, SHINKOYASU, '司琴', 'shinkoyasu_hymn_pianist')
-        # shinkoyasu_worship_teachers_df = get_role_assignments(WORSHIP_CLASS, SHINKOYASU, '老師', 'shinkoyasu_worship_teacher')
-        # shinkoyasu_worship_assistants_df = get_role_assignments(WORSHIP_CLASS, SHINKOYASU, '助教1', 'shinkoyasu_worship_assistant')
-        # result_df = merge_querysets_by_date([shinkoyasu_hymn_numbers_df, shinkoyasu_hymn_teachers_df, shinkoyasu_hymn_pianists_df,
-        #                                      shinkoyasu_worship_teachers_df, shinkoyasu_worship_assistants_df])
-        # # Replace NaN with empty strings.
-        # result_df.fillna('', inplace=True)
-        # context['schedules'] = result_df.to_dict(orient='records')
-        # print(result_df.to_dict(orient='records'))
-        return context
\ No newline at end of file
+        registry = get_registry()
+        date_from, date_to = self.date_window
+        workloads = TeacherWorkload.objects.filter(month__range=(month_of(date_from), date_to))
+
+        department_name = self.request.GET.get('department')
+        if department_name:
+            workloads = workloads.filter(department_id=registry.id(Department, department_name))
+
+        teachers = {}
+        for person_id, person_name, role_id, count, minutes in workloads.values_list(
+            'person_id', 'person__name', 'role_id', 'count', 'minutes'
+        ):
+            teacher = teachers.setdefault(person_id, {'name': person_name, 'roles': defaultdict(int),
+                                                      'count': 0, 'minutes': 0})
+            teacher['roles'][role_id] += count
+            teacher['count'] += count
+            teacher['minutes'] += minutes
+
+        roles = [role for role in registry.objects(ClassRole)
+                 if any(role.id in teacher['roles'] for teacher in teachers.values())]
+        context['department_name'] = department_name
+        context['roles'] = roles
+        context['workloads'] = [
+            {**teacher, 'roles': [teacher['roles'].get(role.id, 0) for role in roles]}
+            for teacher in sorted(teachers.values(), key=lambda teacher: (-teacher['count'], teacher['name']))
+        ]
+        return context
@@ -0,0 +1,114 @@
+from datetime import date, timedelta
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+
+# Schedules are paginated on this key, which is unique and matches the order of every schedule list.
+KEYSET_ORDERING = ('date', 'start_time', 'id')
+KEYSET_PAGE_SIZE = 100
+
+# A window bound outside these dates is ignored, so that the terms around any window exist.
+EARLIEST_DATE = date(1900, 1, 1)
+LATEST_DATE = date(2999, 12, 31)
+
+
+def get_term(day):
+    """
+    Returns the first and last day of the term (calendar quarter) containing the given date.
+    """
+    first_month = 3 * ((day.month - 1) // 3) + 1
+    first_day = date(day.year, first_month, 1)
+    if first_month == 10:
+        next_term = date(day.year + 1, 1, 1)
+    else:
+        next_term = date(day.year, first_month + 3, 1)
+    return first_day, next_term - timedelta(days=1)
+
+
+def get_date_window(request):
+    """
+    Reads the ?from=YYYY-MM-DD&to=YYYY-MM-DD date window of a schedule page.
+    A missing, malformed or out of range bound defaults to the corresponding bound of the current term,
+    and a reversed window to the whole current term.
+
+    :return: A (date_from, date_to) tuple of dates
+    """
+    term_start, term_end = get_term(timezone.localdate())
+
+    def parse(value, default):
+        try:
+            day = parse_date(value or '')
+        except ValueError:
+            return default
+        return day if day is not None and EARLIEST_DATE <= day <= LATEST_DATE else default
+
+    date_from, date_to = parse(request.GET.get('from'), term_start), parse(request.GET.get('to'), term_end)
+    if date_from > date_to:
+        return term_start, term_end
+    return date_from, date_to
+
+
+def get_adjacent_terms(date_from, date_to):
+    """
+    Returns the terms right before and right after the given date window,
+    as ((first_day, last_day), (first_day, last_day)).
+    """
+    return get_term(date_from - timedelta(days=1)), get_term(date_to + timedelta(days=1))
+
+
+def encode_cursor(schedule):
+    """
+    Encodes the (date, start_time, id) key of a schedule as a 'YYYY-MM-DD,HH:MM:SS,id' cursor.
+    """
+    return f"{schedule.date.isoformat()},{schedule.start_time.isoformat()},{schedule.id}"
+
+
+def decode_cursor(value):
+    """
+    Decodes a cursor built by encode_cursor(). Returns None if the cursor is missing or malformed.
+    """
+    try:
+        raw_date, raw_time, raw_id = value.split(',')
+        key = (parse_date(raw_date), parse_time(raw_time), int(raw_id))
+    except (AttributeError, ValueError):
+        return None
+    # Schedule ids are positive 64-bit integers; a larger forged id would overflow the query parameter.
+    if None in key or not 0 < key[2] < 2 ** 63:
+        return None
+    return key
+
+
+def paginate_keyset(queryset, after=None, before=None, page_size=KEYSET_PAGE_SIZE):
+    """
+    Returns one page of schedules ordered by (date, start_time, id), seeking past a cursor
+    instead of using OFFSET so that the cost of a page does not depend on its position.
+
+    :param queryset: A Schedule queryset
+    :param after: A decoded cursor; the page starts right after this key
+    :param before: A decoded cursor; the page ends right before this key (takes precedence over after)
+    :param page_size: The maximum number of schedules in the page
+    :return: A (schedules, previous_cursor, next_cursor) tuple; a cursor is None when there is no such page
+    """
+    if before is not None:
+        day, start_time, pk = before
+        rows = list(queryset.filter(
+            Q(date__lt=day) | Q(date=day, start_time__lt=start_time) | Q(date=day, start_time=start_time, id__lt=pk)
+        ).order_by(*[f'-{field}' for field in KEYSET_ORDERING])[:page_size + 1])
+        has_previous, has_next = len(rows) > page_size, True
+        rows = rows[:page_size][::-1]
+    else:
+        if after is not None:
+            day, start_time, pk = after
+            queryset = queryset.filter(
+                Q(date__gt=day) | Q(date=day, start_time__gt=start_time) | Q(date=day, start_time=start_time, id__gt=pk)
+            )
+        rows = list(queryset.order_by(*KEYSET_ORDERING)[:page_size + 1])
+        has_previous, has_next = after is not None, len(rows) > page_size
+        rows = rows[:page_size]
+
+    if not rows:
+        return rows, None, None
+
+    previous_cursor = encode_cursor(rows[0]) if has_previous else None
+    next_cursor = encode_cursor(rows[-1]) if has_next else None
+    return rows, previous_cursor, next_cursor
@@ -0,0 +1,138 @@
+"""
+Maintenance of the TeacherWorkload aggregate: (teacher, month, role, department) -> count and minutes.
+
+The signal handlers in schedule.signals refresh the (teacher, month) cells touched by every saved or deleted
+role assignment, and by every schedule moved to another date, department or time. A refresh recomputes those
+cells from the role assignments of that teacher and month instead of adding or subtracting one, so the
+table cannot drift whatever order the signals come in (e.g. the cascades of a deleted schedule), and
+refreshing a cell twice is harmless. Bulk operations, which send no signals, call refresh_workloads()
+themselves (see schedule.assignments.create_role_assignments()).
+
+rebuild_workloads() (the rebuild_workloads command) recomputes the whole table, e.g. after raw SQL changes.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+from django.db import transaction
+from django.db.models import Q
+from .models import RoleAssignment, Schedule, TeacherWorkload
+
+WORKLOAD_CHUNK_SIZE = 2000
+
+_FIELDS = ('person_id', 'role_id', 'schedule__department_id', 'schedule__date', 'schedule__start_time',
+           'schedule__end_time')
+
+
+def month_of(day):
+    """
+    Returns the first day of the month of the given day.
+    """
+    return day.replace(day=1)
+
+
+def _month_end(month):
+    return month_of(month + timedelta(days=31)) - timedelta(days=1)
+
+
+def _minutes(start_time, end_time):
+    return (end_time.hour * 60 + end_time.minute) - (start_time.hour * 60 + start_time.minute)
+
+
+def _aggregate(rows):
+    """
+    Sums up rows of _FIELDS into a {(person id, month, role id, department id): [count, minutes]} dictionary.
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for person_id, role_id, department_id, day, start_time, end_time in rows:
+        total = totals[(person_id, month_of(day), role_id, department_id)]
+        total[0] += 1
+        total[1] += _minutes(start_time, end_time)
+    return totals
+
+
+def assignment_cells(pairs):
+    """
+    Returns the (person id, month) cells of the given (schedule id, person id) pairs, with a single query.
+    """
+    pairs = [(schedule_id, person_id) for schedule_id, person_id in pairs
+             if schedule_id is not None and person_id is not None]
+    if not pairs:
+        return set()
+    dates = dict(Schedule.objects.filter(id__in={schedule_id for schedule_id, _ in pairs}).values_list('id', 'date'))
+    return {(person_id, month_of(dates[schedule_id])) for schedule_id, person_id in pairs if schedule_id in dates}
+
+
+def _persons_by_month(cells):
+    persons_by_month = defaultdict(set)
+    for person_id, month in cells:
+        if person_id is not None:
+            persons_by_month[month_of(month)].add(person_id)
+    return persons_by_month
+
+
+def cell_assignments(cells):
+    """
+    Returns the role assignments of the given (person id, month) cells, as rows of _FIELDS.
+    This is the query refresh_workloads() runs for every saved or deleted role assignment.
+    """
+    persons_by_month = _persons_by_month(cells)
+    if not persons_by_month:
+        return RoleAssignment.objects.none().values_list(*_FIELDS)
+    return RoleAssignment.objects.filter(reduce(or_, (
+        Q(person_id__in=person_ids, schedule__date__range=(month, _month_end(month)))
+        for month, person_ids in persons_by_month.items()
+    ))).values_list(*_FIELDS)
+
+
+def refresh_workloads(cells):
+    """
+    Recomputes the given (person id, month) cells of TeacherWorkload from the role assignments.
+
+    Reads the assignments and the current rows of the cells with one query each, then deletes the rows left
+    empty and inserts or updates the others with a single upsert.
+    """
+    persons_by_month = _persons_by_month(cells)
+    if not persons_by_month:
+        return
+
+    totals = _aggregate(cell_assignments(cells))
+
+    with transaction.atomic():
+        rows = TeacherWorkload.objects.filter(reduce(or_, (
+            Q(person_id__in=person_ids, month=month) for month, person_ids in persons_by_month.items()
+        )))
+        empty = [workload_id for workload_id, *key in rows.values_list('id', 'person_id', 'month', 'role_id',
+                                                                        'department_id')
+                 if tuple(key) not in totals]
+        if empty:
+            TeacherWorkload.objects.filter(id__in=empty).delete()
+        TeacherWorkload.objects.bulk_create(
+            [
+                TeacherWorkload(person_id=person_id, month=month, role_id=role_id, department_id=department_id,
+                                count=count, minutes=minutes)
+                for (person_id, month, role_id, department_id), (count, minutes) in totals.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['person', 'month', 'role', 'department'],
+            update_fields=['count', 'minutes'],
+        )
+
+
+def rebuild_workloads():
+    """
+    Recomputes the whole TeacherWorkload table from the role assignments, read in chunks.
+
+    :return: The number of rows created
+    """
+    totals = _aggregate(RoleAssignment.objects.filter(person__isnull=False).values_list(*_FIELDS).iterator(
+        chunk_size=WORKLOAD_CHUNK_SIZE
+    ))
+    with transaction.atomic():
+        TeacherWorkload.objects.all().delete()
+        TeacherWorkload.objects.bulk_create((
+            TeacherWorkload(person_id=person_id, month=month, role_id=role_id, department_id=department_id,
+                            count=count, minutes=minutes)
+            for (person_id, month, role_id, department_id), (count, minutes) in totals.items()
+        ), batch_size=WORKLOAD_CHUNK_SIZE)
+    return len(totals)